@@ -146,6 +146,91 @@ STATIC_URL = "/static/"
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# In-flight uploads, relative to MEDIA_ROOT so finished files are renamed into place, not copied
+FILE_UPLOAD_STAGING_DIR = 'uploads/.incoming'
+
+# Files accepted by one api/files/upload/batch/ request; Django's own per-request limit must allow as many
+FILE_UPLOAD_BATCH_MAX_FILES = 500
+DATA_UPLOAD_MAX_NUMBER_FILES = FILE_UPLOAD_BATCH_MAX_FILES
+
+# Resumable uploads: preallocated session files (relative to MEDIA_ROOT), default and allowed chunk
+# sizes, and how long an idle session is kept before cleanup_upload_sessions removes it
+FILE_UPLOAD_SESSION_DIR = 'uploads/.sessions'
+FILE_UPLOAD_CHUNK_SIZE = 8 * 2**20
+FILE_UPLOAD_MIN_CHUNK_SIZE = 256 * 2**10
+FILE_UPLOAD_MAX_CHUNK_SIZE = 64 * 2**20
+FILE_UPLOAD_SESSION_TTL_HOURS = 24
+
+# Disk a user can make the server reserve: largest file a session may announce, and the open
+# sessions (and their preallocated bytes) a user may hold at once
+FILE_UPLOAD_MAX_SIZE = int(os.environ.get("FILE_UPLOAD_MAX_SIZE", 4 * 2**30))
+FILE_UPLOAD_MAX_OPEN_SESSIONS = int(os.environ.get("FILE_UPLOAD_MAX_OPEN_SESSIONS", 10))
+FILE_UPLOAD_MAX_OPEN_SESSION_BYTES = int(os.environ.get("FILE_UPLOAD_MAX_OPEN_SESSION_BYTES", 16 * 2**30))
+
+# Seconds a deleted upload waits before reap_deleted_files removes it; uploading the same content
+# again within this window revives it without storing the bytes again
+FILE_DELETE_GRACE_SECONDS = int(os.environ.get("FILE_DELETE_GRACE_SECONDS", 300))
+
+# Hand file downloads to the web server after the permission check: None (stream from Django),
+# "x-accel-redirect" (nginx, with an internal location at FILE_DOWNLOAD_ACCEL_PREFIX aliased to
+# MEDIA_ROOT) or "x-sendfile" (Apache mod_xsendfile, lighttpd)
+FILE_DOWNLOAD_OFFLOAD = os.environ.get("FILE_DOWNLOAD_OFFLOAD") or None
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get("FILE_DOWNLOAD_ACCEL_PREFIX", "/protected-media/")
+
+# Which stored content api/files/probe/ may link without the bytes being sent: "user" (only reports the
+# user's own duplicates, so a probe cannot reveal that another user stored some content) or "global"
+# (any blob, so identical files are uploaded once system-wide). Global links require proof of
+# possession: the SHA-256 of a server-chosen range of up to FILE_DEDUPE_PROOF_BYTES bytes, answered
+# within FILE_DEDUPE_CHALLENGE_SECONDS
+FILE_DEDUPE_PROBE_SCOPE = os.environ.get("FILE_DEDUPE_PROBE_SCOPE", "user")
+FILE_DEDUPE_PROOF_BYTES = 64 * 2**10
+FILE_DEDUPE_CHALLENGE_SECONDS = 300
+
+# Text extraction jobs (process_files): token budget of a stored chunk and tokens shared by consecutive
+# chunks, attempts before a job is marked failed, and seconds a worker holds a job before it is
+# considered dead and the job is retried
+FILE_PROCESSING_CHUNK_TOKENS = int(os.environ.get("FILE_PROCESSING_CHUNK_TOKENS", 512))
+FILE_PROCESSING_CHUNK_OVERLAP = int(os.environ.get("FILE_PROCESSING_CHUNK_OVERLAP", 64))
+FILE_PROCESSING_MAX_ATTEMPTS = 3
+FILE_PROCESSING_LEASE_SECONDS = 600
+
+# Retrieval indexes over extracted text (chat.rag): directory of their memory-mapped segments,
+# segments kept before the smaller ones are merged, BM25 parameters, and hits returned by api/rag/query/
+RAG_INDEX_DIR = os.environ.get("RAG_INDEX_DIR") or BASE_DIR / "rag_index"
+RAG_INDEX_MAX_SEGMENTS = 8
+RAG_BM25_K1 = 1.2
+RAG_BM25_B = 0.75
+RAG_TOP_K = 5
+RAG_MAX_TOP_K = 50
+
+# Dense retrieval: the class embedding chunks and queries, and its keyword arguments. The default
+# hashes words into vectors locally; indexes of another embedder are kept apart and need a rebuild.
+# RAG_DEFAULT_MODE is used when a query does not name one ("lexical", "dense" or "hybrid").
+RAG_EMBEDDER = os.environ.get("RAG_EMBEDDER", "chat.rag.embeddings.HashingEmbedder")
+RAG_EMBEDDER_OPTIONS = {"dim": 256}
+RAG_DEFAULT_MODE = "lexical"
+
+# Dense segments of at least RAG_IVF_MIN_ROWS chunks are clustered for approximate search, probing
+# the RAG_IVF_NPROBE closest of their ~sqrt(rows) lists: raise it for recall, lower it for latency
+RAG_IVF_MIN_ROWS = 50000
+RAG_IVF_NPROBE = 16
+
+# Hybrid mode fuses the top RAG_HYBRID_DEPTH hits of each index by reciprocal rank, with the rank
+# constant RAG_RRF_CONSTANT. Results are cached for RAG_CACHE_TIMEOUT seconds; uploads, deletes and
+# index changes invalidate them earlier
+RAG_HYBRID_DEPTH = 50
+RAG_RRF_CONSTANT = 60
+RAG_CACHE_TIMEOUT = int(os.environ.get("RAG_CACHE_TIMEOUT", 300))
+
+# Every user's files are indexed in their own shard; a process keeps the shards it searched open
+# until they take more than RAG_SHARD_MEMORY_BYTES, then closes the least recently used ones
+RAG_SHARD_MEMORY_BYTES = int(os.environ.get("RAG_SHARD_MEMORY_BYTES", 256 * 2**20))
+
+# api/rag/answer/ streams an answer by this model of src.utils.gpt.GPT_VERSIONS when the request
+# names none, keeping RAG_ANSWER_TOKENS of its context window free for the answer
+RAG_ANSWER_MODEL = "gpt35"
+RAG_ANSWER_TOKENS = 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -175,8 +260,59 @@ CRONJOBS = [
     ('0 2 * * *', 'django.core.management.call_command', ['cleanup_old_conversations', '--days=30', '--deleted-only', '--force']),
     # Run cleanup for very old conversations every Sunday at 3:00 AM
     ('0 3 * * 0', 'django.core.management.call_command', ['cleanup_old_conversations', '--days=90', '--force']),
+    # Roll up yesterday's file events and delete raw events past retention every day at 1:30 AM
+    ('30 1 * * *', 'django.core.management.call_command', ['compact_file_events']),
+    # Reclaim storage of deleted uploads every 5 minutes
+    ('*/5 * * * *', 'django.core.management.call_command', ['reap_deleted_files']),
+    # Remove abandoned resumable upload sessions every hour
+    ('15 * * * *', 'django.core.management.call_command', ['cleanup_upload_sessions']),
+    # Extract text of files queued for processing every minute
+    ('* * * * *', 'django.core.management.call_command', ['process_files']),
+    # Merge the retrieval shards and drop text of deleted files every night at 4:00 AM
+    ('0 4 * * *', 'django.core.management.call_command', ['rebuild_rag_index', '--compact']),
 ]
 
+# Caching
+# Shared tier of src.utils.cache.TwoTierCache: a file-based store that all local workers share,
+# or any Redis-compatible server when REDIS_URL is set
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / ".cache"),
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        }
+    }
+
+TWO_TIER_CACHE = {
+    "alias": "default",
+    "local_max_entries": 2048,
+    "local_timeout": 30,
+    "jitter": 0.1,
+    "lock_timeout": 10,
+}
+
+# Buffered FileEventLog writes (chat.utils.audit): batch size that forces a flush, seconds an event may
+# wait before the background flush, and events kept for retry while the database is unavailable
+FILE_EVENT_LOG_BUFFER = {
+    "max_batch": 500,
+    "flush_interval": 5.0,
+    "max_buffer": 20000,
+}
+
+# Days of raw FileEventLog rows kept once compacted into daily rollups (compact_file_events)
+FILE_EVENT_LOG_RETENTION_DAYS = int(os.environ.get("FILE_EVENT_LOG_RETENTION_DAYS", 90))
+
+# Seconds a cached conversation listing may live; writes invalidate it earlier via version bumps
+CONVERSATION_CACHE_TIMEOUT = int(os.environ.get("CONVERSATION_CACHE_TIMEOUT", 60))
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
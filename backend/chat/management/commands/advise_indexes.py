@@ -0,0 +1,83 @@
+"""
+Django management command to check hot endpoint queries for missing indexes.
+"""
+
+from django.core.management.base import BaseCommand
+
+from chat.utils.indexes import (
+    HOT_QUERIES,
+    create_index,
+    explain,
+    find_plan_issues,
+    index_exists,
+    sample_context,
+    time_queryset,
+)
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN hot endpoint queries, flag sequential scans and temp sorts, and add missing indexes'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Create the missing indexes and report before/after timings'
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Timed executions per query (default: 5)'
+        )
+        parser.add_argument(
+            '--verbose-plan',
+            action='store_true',
+            help='Print the full query plan for every query'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        context = sample_context()
+        flagged = 0
+
+        for hot_query in HOT_QUERIES:
+            queryset = hot_query.build(context)
+            plan = explain(queryset)
+            issues = find_plan_issues(plan)
+            has_index = index_exists(hot_query.model, hot_query.index_name)
+            before = time_queryset(queryset, options['runs'])
+
+            status = self.style.WARNING('NEEDS INDEX') if issues or not has_index else self.style.SUCCESS('OK')
+            self.stdout.write(f'{hot_query.name}: {status} ({before:.2f} ms)')
+            if options['verbose_plan']:
+                for line in plan:
+                    self.stdout.write(f'    plan: {line}')
+            for issue in issues:
+                self.stdout.write(f'    {issue}')
+            if not has_index:
+                self.stdout.write(f'    missing index: {hot_query.index_name}')
+
+            if not (issues or not has_index):
+                continue
+            flagged += 1
+            if not options['apply']:
+                continue
+
+            sql = create_index(hot_query.model, hot_query.index_name)
+            if sql:
+                self.stdout.write(f'    created: {sql}')
+            queryset = hot_query.build(context)
+            after = time_queryset(queryset, options['runs'])
+            remaining = find_plan_issues(explain(queryset))
+            self.stdout.write(f'    before {before:.2f} ms -> after {after:.2f} ms')
+            for issue in remaining:
+                self.stdout.write(f'    still present: {issue}')
+
+        if flagged and not options['apply']:
+            self.stdout.write(
+                self.style.WARNING(f'{flagged} queries need attention, rerun with --apply to add indexes')
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS('Index check finished'))
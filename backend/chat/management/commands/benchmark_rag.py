@@ -0,0 +1,271 @@
+"""
+Django management command to benchmark retrieval quality and latency of every retrieval mode.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import CustomUser
+from chat.management.commands.benchmark_search import build_vocabulary
+from chat.models import FileUpload, TextChunk
+from chat.rag.embeddings import get_embedder
+from chat.rag.retrieval import RETRIEVAL_MODES, retrieve
+from chat.rag.shards import get_shard
+from chat.utils.blobs import acquire_blob
+from chat.utils.processing import process_jobs, queue_uploads
+
+BENCHMARK_EMAIL = 'rag-benchmark@example.invalid'
+
+# Topic words start with a vowel, corpus words with a consonant, so the two never collide
+TOPIC_SYLLABLES = 'ab ec id og uf yp az ej ik ov ut yr'.split()
+
+
+def tree_size(path):
+    """Bytes of the files under ``path``."""
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def synthetic_corpus(rng, files, paragraphs, queries, relevant, distractors):
+    """
+    Files of Zipf-distributed pseudo-words, with sentences planted for each query.
+
+    Every query names two of three topic words of its own. Its relevant passages are ``relevant``
+    sentences holding all three, planted in random paragraphs; ``distractors`` other sentences hold
+    one of the two, so ranking matters and not only matching.
+
+    Returns:
+        Tuple[dict, list]: File name -> text, and ``{"query", "relevant"}`` per query
+    """
+    words, cum_weights = build_vocabulary(rng)
+
+    def sentence(*planted):
+        filler = rng.choices(words, cum_weights=cum_weights, k=12)
+        for word in planted:
+            filler.insert(rng.randrange(len(filler) + 1), word)
+        return ' '.join(filler).capitalize() + '.'
+
+    topics = set()
+    while len(topics) < 3 * queries:
+        topics.add(''.join(rng.choices(TOPIC_SYLLABLES, k=rng.randint(3, 4))))
+    topics = sorted(topics)
+    rng.shuffle(topics)
+
+    texts = [[[sentence() for _ in range(5)] for _ in range(paragraphs)] for _ in range(files)]
+    cases = []
+    for i in range(queries):
+        terms = topics[3 * i:3 * i + 3]
+        needles = [sentence(*terms) for _ in range(relevant)]
+        for planted in needles + [sentence(rng.choice(terms[:2])) for _ in range(distractors)]:
+            rng.choice(rng.choice(texts)).append(planted)
+        cases.append({"query": f'{terms[0]} {terms[1]} {rng.choice(words[:50])}', "relevant": needles})
+    corpus = {
+        f'doc-{n:05d}.txt': '\n\n'.join(' '.join(paragraph) for paragraph in text) for n, text in enumerate(texts)
+    }
+    return corpus, cases
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark recall@k, MRR and latency of each retrieval mode on a synthetic corpus or a fixture, '
+        'uploaded and processed like user files, and print the results as JSON'
+    )
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--fixture',
+            help='JSON file of {"files": {name: text}, "queries": [{"query": ..., "relevant": [passage, ...]}]} '
+                 'to use instead of a synthetic corpus'
+        )
+        parser.add_argument(
+            '--files',
+            type=int,
+            default=200,
+            help='Synthetic files (default: 200)'
+        )
+        parser.add_argument(
+            '--paragraphs',
+            type=int,
+            default=20,
+            help='Paragraphs of five sentences per synthetic file (default: 20)'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=100,
+            help='Synthetic queries (default: 100)'
+        )
+        parser.add_argument(
+            '--relevant',
+            type=int,
+            default=2,
+            help='Relevant passages planted per synthetic query (default: 2)'
+        )
+        parser.add_argument(
+            '--distractors',
+            type=int,
+            default=3,
+            help='Passages planted per synthetic query holding only one of its topic words (default: 3)'
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=10,
+            help='Results per query (default: 10)'
+        )
+        parser.add_argument(
+            '--modes',
+            nargs='+',
+            choices=list(RETRIEVAL_MODES),
+            default=list(RETRIEVAL_MODES),
+            help='Retrieval modes to measure (default: all of them)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Extraction processes (default: 1)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic corpus'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file and a summary to stdout'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark user, their files and their shard after the run'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the benchmark."""
+        if options['fixture']:
+            with open(options['fixture']) as fixture:
+                data = json.load(fixture)
+            corpus, cases = data['files'], data['queries']
+            source = {"fixture": options['fixture']}
+        else:
+            rng = random.Random(options['seed'])
+            corpus, cases = synthetic_corpus(
+                rng, options['files'], options['paragraphs'], options['queries'], options['relevant'],
+                options['distractors'],
+            )
+            source = {"seed": options['seed']}
+        if not corpus or not cases:
+            raise CommandError('The corpus needs files and queries')
+
+        # Results must come from this corpus only: start from a user of our own, without files
+        CustomUser.objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = CustomUser.objects.create(email=BENCHMARK_EMAIL)
+        try:
+            report = self.run(user, corpus, cases, options)
+        finally:
+            if not options['keep']:
+                user.delete()
+        report["corpus"].update(source)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            for mode, result in report["modes"].items():
+                latency = result["latency_ms"]
+                self.stdout.write(
+                    f'{mode:>8}: recall@{options["k"]} {result["recall"]:.3f}, MRR {result["mrr"]:.3f}, '
+                    f'p50 {latency["p50"]:.2f} ms, p95 {latency["p95"]:.2f} ms, p99 {latency["p99"]:.2f} ms'
+                )
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, user, corpus, cases, options) -> dict:
+        started = time.perf_counter()
+        uploads = []
+        for name, text in corpus.items():
+            content = text.encode()
+            digest = hashlib.sha256(content).hexdigest()
+            blob = acquire_blob(digest, ContentFile(content, name=name))
+            uploads.append(FileUpload.objects.create(
+                uploader=user, name=name, size=len(content), hash=digest, blob=blob, file=blob.file.name
+            ))
+        queue_uploads(uploads)
+        upload_seconds = time.perf_counter() - started
+        processing = process_jobs(workers=options['workers'], uploader=user)
+
+        shard = get_shard(user.pk)
+        k = options['k']
+        modes = {}
+        for mode in options['modes']:
+            # Map the segments before timing, as a server answering queries would have
+            retrieve(user, cases[0]["query"], k, mode)
+            recalls, ranks, timings = [], [], []
+            for case in cases:
+                begin = time.perf_counter()
+                results = retrieve(user, case["query"], k, mode)
+                timings.append((time.perf_counter() - begin) * 1000)
+                texts = [result["text"] for result in results]
+                relevant = case["relevant"]
+                found = sum(any(passage in text for text in texts) for passage in relevant)
+                recalls.append(found / len(relevant) if relevant else 1.0)
+                rank = next(
+                    (n for n, text in enumerate(texts, 1) if any(passage in text for passage in relevant)), None
+                )
+                ranks.append(1 / rank if rank else 0.0)
+            timings.sort()
+            modes[mode] = {
+                "recall": round(statistics.fmean(recalls), 4),
+                "mrr": round(statistics.fmean(ranks), 4),
+                "latency_ms": {
+                    "mean": round(statistics.fmean(timings), 3),
+                    "p50": round(percentile(timings, 50), 3),
+                    "p95": round(percentile(timings, 95), 3),
+                    "p99": round(percentile(timings, 99), 3),
+                    "max": round(timings[-1], 3),
+                },
+            }
+
+        return {
+            "corpus": {
+                "files": len(corpus),
+                "bytes": sum(upload.size for upload in uploads),
+                "chunks": TextChunk.objects.filter(job__indexed_for__user=user).count(),
+                "queries": len(cases),
+            },
+            "build": {
+                "upload_seconds": round(upload_seconds, 3),
+                "process_seconds": round(processing.seconds, 3),
+                "jobs_failed": processing.failed,
+                "chunks_indexed": processing.indexed,
+            },
+            "index_bytes": {name: tree_size(index.directory) for name, index in shard.indexes.items()},
+            "k": k,
+            "modes": modes,
+            "settings": {
+                "chunk_tokens": settings.FILE_PROCESSING_CHUNK_TOKENS,
+                "chunk_overlap": settings.FILE_PROCESSING_CHUNK_OVERLAP,
+                "embedder": get_embedder().name,
+                "ivf_min_rows": settings.RAG_IVF_MIN_ROWS,
+                "ivf_nprobe": settings.RAG_IVF_NPROBE,
+                "hybrid_depth": settings.RAG_HYBRID_DEPTH,
+            },
+        }
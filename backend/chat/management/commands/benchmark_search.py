@@ -0,0 +1,147 @@
+"""
+Django management command to benchmark conversation search (icontains vs full-text index).
+"""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from authentication.models import CustomUser
+from chat.models import Conversation
+from chat.utils.search import (
+    apply_fulltext_search,
+    is_fulltext_available,
+    rebuild_search_index,
+    remove_conversation_search_index,
+)
+
+BENCHMARK_EMAIL = 'search-benchmark@example.invalid'
+
+SYLLABLES = 'ka lo mi ne ru sa to vi ze bra cle dro fin gal hem jor kas lun mor nes pal quin ros tav wex'.split()
+
+
+def build_vocabulary(rng, size=20000):
+    """Pseudo-words with Zipf weights, so term selectivity looks like natural text."""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, size + 1):
+        total += 1.0 / rank
+        cum_weights.append(total)
+    return words, cum_weights
+
+
+class Command(BaseCommand):
+    help = 'Benchmark icontains search against the full-text index on synthetic conversations'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--conversations',
+            type=int,
+            default=1_000_000,
+            help='Number of synthetic conversations to create (default: 1000000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=20,
+            help='Number of search queries timed per strategy (default: 20)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic corpus'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the synthetic conversations after the run'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the benchmark."""
+        if not is_fulltext_available():
+            raise CommandError('Full-text index table not found, run `python manage.py migrate` first')
+
+        rng = random.Random(options['seed'])
+        vocabulary = build_vocabulary(rng)
+        user, _ = CustomUser.objects.get_or_create(email=BENCHMARK_EMAIL)
+        conversations = Conversation.objects.filter(user=user)
+
+        existing = conversations.count()
+        missing = options['conversations'] - existing
+        if missing > 0:
+            self.stdout.write(f'Creating {missing} synthetic conversations...')
+            started = time.perf_counter()
+            self._populate(user, missing, options['batch_size'], rng, vocabulary)
+            self.stdout.write(f'  inserted in {time.perf_counter() - started:.1f}s')
+
+            self.stdout.write('Indexing...')
+            started = time.perf_counter()
+            rebuild_search_index(conversations, batch_size=options['batch_size'])
+            self.stdout.write(f'  indexed in {time.perf_counter() - started:.1f}s')
+
+        # Mid-frequency words typed partially, like a search-as-you-type box
+        words, _ = vocabulary
+        terms = [rng.choice(words[50:5000])[:5] for _ in range(options['queries'])]
+        for label, search in (('icontains', self._search_icontains), ('full-text', self._search_fulltext)):
+            timings = []
+            for term in terms:
+                started = time.perf_counter()
+                search(conversations, term)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{label:>10}: median {statistics.median(timings):.1f} ms, '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms, max {timings[-1]:.1f} ms'
+            )
+
+        if not options['keep']:
+            self.stdout.write('Removing synthetic conversations...')
+            remove_conversation_search_index(conversations.values_list('pk', flat=True).iterator())
+            conversations.delete()
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _populate(self, user, count, batch_size, rng, vocabulary):
+        words, cum_weights = vocabulary
+        for start in range(0, count, batch_size):
+            batch = [
+                Conversation(
+                    title=' '.join(rng.choices(words, cum_weights=cum_weights, k=4)).capitalize(),
+                    summary=' '.join(rng.choices(words, cum_weights=cum_weights, k=24)),
+                    user=user,
+                )
+                for _ in range(min(batch_size, count - start))
+            ]
+            with transaction.atomic():
+                Conversation.objects.bulk_create(batch)
+
+    @staticmethod
+    def _search_icontains(conversations, term):
+        queryset = conversations.filter(Q(title__icontains=term) | Q(summary__icontains=term))
+        queryset.count()
+        list(queryset.order_by('-modified_at')[:10])
+
+    @staticmethod
+    def _search_fulltext(conversations, term):
+        queryset = apply_fulltext_search(conversations, term)
+        queryset.count()
+        list(queryset.order_by('-search_rank', '-modified_at')[:10])
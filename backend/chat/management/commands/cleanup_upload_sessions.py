@@ -0,0 +1,68 @@
+"""
+Django management command to remove abandoned resumable uploads.
+"""
+
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import UploadSession
+from chat.utils.uploads import discard_session_file, get_session_dir, get_staging_dir
+
+
+class Command(BaseCommand):
+    help = 'Delete upload sessions idle for longer than the TTL, and stray partial files left on disk'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=settings.FILE_UPLOAD_SESSION_TTL_HOURS,
+            help=f'Idle hours after which a session is abandoned (default: {settings.FILE_UPLOAD_SESSION_TTL_HOURS})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be deleted without actually deleting'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        hours = options['hours']
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=hours)
+
+        expired = UploadSession.objects.filter(updated_at__lt=cutoff)
+        sessions = 0
+        for session in expired.iterator():
+            sessions += 1
+            if not dry_run:
+                discard_session_file(session)
+                session.delete()
+
+        # Partial files whose session row is gone, and staged single-request uploads from crashed workers
+        live = {f'{session_id}.part' for session_id in UploadSession.objects.values_list('id', flat=True)}
+        stray = 0
+        for directory in (get_session_dir(), get_staging_dir()):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or entry.name in live:
+                        continue
+                    if entry.stat().st_mtime >= time.time() - hours * 3600:
+                        continue
+                    stray += 1
+                    if not dry_run:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+
+        prefix = 'DRY RUN - would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {sessions} upload sessions idle for more than {hours} hours and {stray} stray files'
+        ))
@@ -0,0 +1,57 @@
+"""
+Django management command to roll up file events by day and apply raw event retention.
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.utils.rollups import compact_file_events, purge_file_events, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Compact FileEventLog into daily rollups, then delete raw events past retention in batches'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='First day to (re)compact, YYYY-MM-DD (default: continue from the last compacted day)'
+        )
+        parser.add_argument(
+            '--lookback-days',
+            type=int,
+            default=1,
+            help='Compacted days to recompute for late events when --since is not given (default: 1)'
+        )
+        parser.add_argument(
+            '--retain-days',
+            type=int,
+            default=settings.FILE_EVENT_LOG_RETENTION_DAYS,
+            help=f'Days of raw events to keep, 0 keeps everything (default: {settings.FILE_EVENT_LOG_RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Raw events deleted per statement (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        days, rows = compact_file_events(options['since'], options['lookback_days'])
+        self.stdout.write(f'Compacted {days} days into {rows} rollup rows')
+
+        if options['retain_days'] <= 0:
+            return
+        cutoff = retention_cutoff(options['retain_days'])
+        if cutoff is None:
+            self.stdout.write('Nothing compacted yet, raw events are kept')
+            return
+        deleted = purge_file_events(cutoff, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} raw events before {cutoff:%Y-%m-%d %H:%M %Z}'))
@@ -0,0 +1,55 @@
+"""
+Django management command to extract text from uploaded files.
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from chat.utils.processing import process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued text extraction jobs on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Extraction processes (default: CPU count, at most 4)'
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            help='Stop after this many jobs (default: until the queue is empty)'
+        )
+        parser.add_argument(
+            '--loop',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, polling the queue every SECONDS seconds when it is empty'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+
+        while True:
+            report = process_jobs(options['workers'], options['max_jobs'])
+            if report.jobs or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {report.jobs} jobs in {report.seconds:.2f}s: {report.done} done '
+                    f'({report.bytes / 2**20:.1f} MB into {report.chunks} chunks, {report.tokens} tokens, '
+                    f'{report.mb_per_second:.1f} MB/s, {report.indexed} indexed), {report.failed} failed, '
+                    f'{report.retried} queued for retry'
+                ))
+            if not options['loop']:
+                return
+            close_old_connections()
+            if not report.jobs:
+                time.sleep(options['loop'])
@@ -0,0 +1,47 @@
+"""
+Django management command to reclaim storage of deleted uploads.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chat.utils.deletion import reap_deleted_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete soft-deleted uploads past the grace period and unlink files no longer referenced'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--grace-seconds',
+            type=int,
+            default=settings.FILE_DELETE_GRACE_SECONDS,
+            help=f'Seconds a deleted upload can still be revived (default: {settings.FILE_DELETE_GRACE_SECONDS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Uploads deleted per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--loop',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, reaping every SECONDS seconds'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        while True:
+            rows, files = reap_deleted_uploads(options['grace_seconds'], options['batch_size'])
+            if rows or files or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Reaped {rows} deleted uploads and unlinked {files} files'))
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['loop'])
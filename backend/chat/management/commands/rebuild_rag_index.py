@@ -0,0 +1,85 @@
+"""
+Django management command to rebuild or compact the per-user retrieval shards.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import FileUpload, IndexedJob
+from chat.rag.retrieval import INDEXES, chunk_documents, user_jobs
+from chat.rag.shards import get_shard, get_shards, remove_shard
+
+
+class Command(BaseCommand):
+    help = "Re-index every user's extracted text, or merge their shards' segments and drop text of deleted files"
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Only merge the existing segments of each index into one, dropping chunks of deleted files'
+        )
+        parser.add_argument(
+            '--index',
+            choices=list(INDEXES),
+            help='Only rebuild or compact this index (default: all of them)'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            help='Only this user id (repeatable; default: every user)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Chunks per segment when rebuilding (default: 50000)'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        started = time.perf_counter()
+        if options['user']:
+            user_ids = options['user']
+        elif options['compact']:
+            user_ids = get_shards().user_ids()
+        else:
+            with_uploads = FileUpload.objects.filter(deleted_at__isnull=True).values_list('uploader_id', flat=True)
+            user_ids = sorted({*with_uploads.distinct(), *get_shards().user_ids()})
+        chunks = 0
+        for user_id in user_ids:
+            chunks += self.compact(user_id, options) if options['compact'] else self.rebuild(user_id, options)
+        action = 'Compacted' if options['compact'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {len(user_ids)} shards holding {chunks} chunks in {time.perf_counter() - started:.2f}s'
+        ))
+
+    def indexes(self, user_id, options):
+        indexes = get_shard(user_id).indexes
+        return [indexes[options['index']]] if options['index'] else list(indexes.values())
+
+    def compact(self, user_id, options) -> int:
+        live = set(IndexedJob.objects.filter(user_id=user_id).values_list('job_id', flat=True))
+        chunks = 0
+        for index in self.indexes(user_id, options):
+            index.compact(live)
+            chunks = len(index)
+        return chunks
+
+    def rebuild(self, user_id, options) -> int:
+        job_ids = user_jobs(user_id)
+        if not job_ids and not options['index']:
+            remove_shard(user_id)
+            IndexedJob.objects.filter(user_id=user_id).delete()
+            return 0
+        chunks = 0
+        for index in self.indexes(user_id, options):
+            chunks = index.rebuild(chunk_documents(job_ids), options['batch_size'])
+        with transaction.atomic():
+            IndexedJob.objects.filter(user_id=user_id).delete()
+            IndexedJob.objects.bulk_create(IndexedJob(user_id=user_id, job_id=job_id) for job_id in job_ids)
+        return chunks
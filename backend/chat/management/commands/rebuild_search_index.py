@@ -0,0 +1,34 @@
+"""
+Django management command to rebuild the conversation full-text search index.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.utils.search import is_fulltext_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for conversation titles, summaries and messages'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Number of conversations indexed per batch (default: 2000)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep existing index rows instead of clearing the index first'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        if not is_fulltext_available():
+            raise CommandError('Full-text index table not found, run `python manage.py migrate` first')
+
+        self.stdout.write('Rebuilding conversation search index...')
+        indexed = rebuild_search_index(batch_size=options['batch_size'], clear=not options['keep'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} conversations'))
@@ -0,0 +1,74 @@
+"""
+Django management command to verify stored files and collect orphans.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.utils.scrub import scrub_media
+
+
+class Command(BaseCommand):
+    help = 'Re-hash stored files against their SHA-256, report missing files and delete old orphans'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(8, os.cpu_count() or 1),
+            help='Hashing threads (default: CPU count, at most 8)'
+        )
+        parser.add_argument(
+            '--rate-limit',
+            type=float,
+            default=50,
+            help='Maximum read throughput in MB/s, 0 for unlimited (default: 50)'
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help='Unreferenced files younger than this are not orphans yet (default: 24)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphans without deleting them'
+        )
+        parser.add_argument(
+            '--no-verify',
+            action='store_true',
+            help='Skip re-hashing, only check for missing files and orphans'
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+
+        report = scrub_media(
+            workers=options['workers'],
+            rate_limit=options['rate_limit'] * 2**20 or None,
+            grace_seconds=int(options['grace_hours'] * 3600),
+            delete_orphans=not options['dry_run'],
+            verify=not options['no_verify'],
+        )
+
+        for name, expected, actual in report.mismatched:
+            self.stdout.write(self.style.ERROR(f'MISMATCH {name}: expected {expected}, found {actual}'))
+        for name in report.missing:
+            self.stdout.write(self.style.ERROR(f'MISSING {name}'))
+        action = 'orphan (not deleted)' if options['dry_run'] else 'deleted orphan'
+        for name in report.orphans:
+            self.stdout.write(self.style.WARNING(f'{action} {name}'))
+
+        self.stdout.write(
+            f'Scanned {report.files} files, {report.bytes / 2**20:.1f} MB in {report.seconds:.2f}s '
+            f'({report.mb_per_second:.1f} MB/s): {len(report.mismatched)} mismatched, '
+            f'{len(report.missing)} missing, {len(report.orphans)} orphans'
+        )
+        if report.mismatched or report.missing:
+            raise CommandError(f'Scrub found {len(report.mismatched) + len(report.missing)} damaged or missing files')
+        self.stdout.write(self.style.SUCCESS('Media store is consistent'))
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_TABLE = "chat_conversation_fts"
+POSTGRES_TABLE = "chat_conversation_search"
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+            "USING fts5(conversation_id UNINDEXED, title, summary, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+            "conversation_id uuid PRIMARY KEY REFERENCES chat_conversation (id) ON DELETE CASCADE "
+            "DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin ON {POSTGRES_TABLE} USING GIN (document)"
+        )
+    else:
+        return
+
+    Conversation = apps.get_model("chat", "Conversation")
+    Message = apps.get_model("chat", "Message")
+    pk_field = Conversation._meta.pk
+    # Same configuration as chat.utils.search queries with, so the index and the query agree
+    search_config = getattr(settings, "SEARCH_CONFIG", "english")
+    with connection.cursor() as cursor:
+        for conversation in Conversation.objects.iterator():
+            body = "\n".join(
+                Message.objects.filter(version_id=conversation.active_version_id)
+                .order_by("created_at")
+                .values_list("content", flat=True)
+            )
+            if connection.vendor == "sqlite":
+                cursor.execute(
+                    f"INSERT OR REPLACE INTO {SQLITE_TABLE} (rowid, conversation_id, title, summary, body) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    [
+                        conversation.pk.int >> 65,
+                        pk_field.get_db_prep_value(conversation.pk, connection),
+                        conversation.title or "",
+                        conversation.summary or "",
+                        body,
+                    ],
+                )
+            else:
+                cursor.execute(
+                    f"INSERT INTO {POSTGRES_TABLE} (conversation_id, document) VALUES (%s, "
+                    "setweight(to_tsvector(%s, %s), 'A') || setweight(to_tsvector(%s, %s), 'B') || "
+                    "setweight(to_tsvector(%s, %s), 'C')) ON CONFLICT (conversation_id) DO NOTHING",
+                    [
+                        conversation.pk,
+                        search_config,
+                        conversation.title or "",
+                        search_config,
+                        conversation.summary or "",
+                        search_config,
+                        body,
+                    ],
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {POSTGRES_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0006_alter_fileeventlog_file"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
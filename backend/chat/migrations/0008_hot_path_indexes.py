@@ -0,0 +1,57 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+INDEXES = [
+    (
+        "conversation",
+        models.Index(
+            condition=models.Q(("deleted_at__isnull", True)), fields=["user", "-modified_at"], name="chat_conv_user_live_idx"
+        ),
+    ),
+    ("conversation", models.Index(fields=["user", "-modified_at"], name="chat_conv_user_modified_idx")),
+    ("conversation", models.Index(fields=["-modified_at"], name="chat_conv_modified_idx")),
+    ("fileeventlog", models.Index(fields=["file", "-timestamp"], name="chat_fileevent_file_idx")),
+    ("fileeventlog", models.Index(fields=["user", "-timestamp"], name="chat_fileevent_user_idx")),
+    ("fileupload", models.Index(fields=["uploader", "-uploaded_at"], name="chat_file_uploader_idx")),
+    ("message", models.Index(fields=["version", "created_at"], name="chat_msg_version_created_idx")),
+]
+
+
+def _existing_indexes(schema_editor, model):
+    with schema_editor.connection.cursor() as cursor:
+        return schema_editor.connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+
+def add_missing_indexes(apps, schema_editor):
+    # `advise_indexes --apply` may already have built some of these ahead of the deploy
+    for model_name, index in INDEXES:
+        model = apps.get_model("chat", model_name)
+        if index.name not in _existing_indexes(schema_editor, model):
+            schema_editor.add_index(model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        model = apps.get_model("chat", model_name)
+        if index.name in _existing_indexes(schema_editor, model):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0007_conversation_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_missing_indexes, remove_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+def blob_path(sha256):
+    # Frozen copy of chat.utils.blobs.blob_path
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def fold_uploads_into_blobs(apps, schema_editor):
+    """Give every existing upload a blob, keeping one copy of the bytes per hash."""
+    FileBlob = apps.get_model("chat", "FileBlob")
+    FileUpload = apps.get_model("chat", "FileUpload")
+
+    uploads = defaultdict(list)
+    for upload in FileUpload.objects.filter(blob__isnull=True).order_by("uploaded_at").iterator():
+        uploads[upload.hash].append(upload)
+
+    for sha256, rows in uploads.items():
+        blob = FileBlob.objects.filter(hash=sha256).first()
+        names = {row.file.name for row in rows if row.file.name}
+        if blob is None:
+            source = next((name for name in names if default_storage.exists(name)), None)
+            if source is None:
+                continue
+            with default_storage.open(source, "rb") as content:
+                name = default_storage.save(blob_path(sha256), content)
+            blob = FileBlob.objects.create(hash=sha256, file=name, size=rows[0].size, ref_count=0)
+
+        for name in names - {blob.file.name}:
+            default_storage.delete(name)
+        FileUpload.objects.filter(pk__in=[row.pk for row in rows]).update(blob=blob, file=blob.file.name)
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=FileUpload.objects.filter(blob=blob).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0009_fileblob"),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_uploads_into_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileeventlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_fileeventlog_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileEventDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(choices=[('upload', 'Upload'), ('delete', 'Delete'), ('access', 'Access')], max_length=10)),
+                ('count', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='fileeventlog',
+            index=models.Index(fields=['timestamp'], name='chat_fileevent_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='fileeventdailyrollup',
+            name='file',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='chat.fileupload'),
+        ),
+        migrations.AddField(
+            model_name='fileeventdailyrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='fileeventdailyrollup',
+            index=models.Index(fields=['user', '-day'], name='chat_rollup_user_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileeventdailyrollup',
+            index=models.Index(fields=['day'], name='chat_rollup_day_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_file_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textchunk',
+            name='end_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='textchunk',
+            name='start_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='textchunk',
+            name='token_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,6 +2,7 @@ import uuid
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 import hashlib
 
 from authentication.models import CustomUser
@@ -14,6 +15,23 @@ class Role(models.Model):
         return self.name
 
 
+class ConversationQuerySet(models.QuerySet):
+    """Bulk updates and deletes skip ``Conversation.save``/``delete``, so they invalidate cached listings here."""
+
+    def _bump_cache_versions(self):
+        from chat.utils.cache import bump_conversation_cache_version
+        for user_id in set(self.values_list('user_id', flat=True)):
+            bump_conversation_cache_version(user_id)
+
+    def update(self, **kwargs):
+        self._bump_cache_versions()
+        return super().update(**kwargs)
+
+    def delete(self):
+        self._bump_cache_versions()
+        return super().delete()
+
+
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=100, blank=False, null=False, default="Mock title")
@@ -26,6 +44,21 @@ class Conversation(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # get_conversations: live conversations of a user, newest first
+            models.Index(
+                fields=['user', '-modified_at'],
+                name='chat_conv_user_live_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # Summaries endpoint, with and without the `user` filter
+            models.Index(fields=['user', '-modified_at'], name='chat_conv_user_modified_idx'),
+            models.Index(fields=['-modified_at'], name='chat_conv_modified_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -38,6 +71,8 @@ class Conversation(models.Model):
         """Override save to automatically update summary when conversation is modified."""
         # Check if we're already updating the summary to prevent recursion
         updating_summary = kwargs.pop('updating_summary', False)
+        # Message.save re-indexes itself once the message row exists
+        update_search_index = kwargs.pop('update_search_index', True)
         
         super().save(*args, **kwargs)
         
@@ -46,6 +81,21 @@ class Conversation(models.Model):
             from chat.utils.summary import update_conversation_summary
             update_conversation_summary(self)
 
+        if not updating_summary and update_search_index:
+            from chat.utils.search import update_conversation_search_index
+            update_conversation_search_index(self)
+
+        if not updating_summary:
+            from chat.utils.cache import bump_conversation_cache_version
+            bump_conversation_cache_version(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        from chat.utils.cache import bump_conversation_cache_version
+        from chat.utils.search import remove_conversation_search_index
+        remove_conversation_search_index([self.pk])
+        bump_conversation_cache_version(self.user_id)
+        return super().delete(*args, **kwargs)
+
 
 class Version(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -71,26 +121,54 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=['version', 'created_at'], name='chat_msg_version_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        self.version.conversation.save()
+        from chat.utils.search import update_conversation_search_index
+
+        conversation = self.version.conversation
+        conversation.save(update_search_index=False)
         super().save(*args, **kwargs)
+        update_conversation_search_index(conversation)
 
     def __str__(self):
         return f"{self.role}: {self.content[:20]}..."
 
 
+class FileBlob(models.Model):
+    """Content-addressed file bytes shared by every FileUpload with the same SHA-256."""
+    hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/')
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash} ({self.ref_count} refs)"
+
+
 class FileUpload(models.Model):
     file = models.FileField(upload_to='uploads/')
+    blob = models.ForeignKey(FileBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='uploads')
     name = models.CharField(max_length=255)
     size = models.BigIntegerField()
     hash = models.CharField(max_length=64, db_index=True)
     uploader = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Set by deletes; the row and its bytes are removed later by reap_deleted_files
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('hash', 'uploader')
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['uploader', '-uploaded_at'], name='chat_file_uploader_idx'),
+            models.Index(
+                fields=['deleted_at'], name='chat_file_deleted_idx', condition=models.Q(deleted_at__isnull=False)
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.hash:
@@ -117,6 +195,54 @@ class FileUpload(models.Model):
         return f"{self.name} ({self.size} bytes)"
 
 
+class FileRemoval(models.Model):
+    """A stored file to unlink, recorded in the transaction that dropped its last reference."""
+    path = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.path
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are written by offset into a preallocated file until it is complete."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(
+        max_length=64, blank=True, help_text="Optional digest declared by the client, checked on completion"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def __str__(self):
+        return f"{self.name} ({self.size} bytes, session {self.id})"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('session', 'index')
+        ordering = ['index']
+
+    def __str__(self):
+        return f"chunk {self.index} of {self.session_id}"
+
+
 class FileEventLog(models.Model):
     EVENT_CHOICES = [
         ("upload", "Upload"),
@@ -126,11 +252,105 @@ class FileEventLog(models.Model):
     event_type = models.CharField(max_length=10, choices=EVENT_CHOICES)
     file = models.ForeignKey(FileUpload, on_delete=models.SET_NULL, null=True, related_name='logs')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when a buffered batch is written
+    timestamp = models.DateTimeField(default=timezone.now)
     extra = models.TextField(blank=True, null=True, help_text="Optional extra info (e.g., IP, user agent)")
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['file', '-timestamp'], name='chat_fileevent_file_idx'),
+            models.Index(fields=['user', '-timestamp'], name='chat_fileevent_user_idx'),
+            # Range scans of compaction and retention
+            models.Index(fields=['timestamp'], name='chat_fileevent_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.event_type} by {self.user} on {self.file} at {self.timestamp}"
+
+
+class FileEventDailyRollup(models.Model):
+    """Event counts per day, user, file and event type, compacted from FileEventLog by compact_file_events."""
+    day = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # No constraint, so history keeps counting a file after it is deleted
+    file = models.ForeignKey(
+        FileUpload, null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    event_type = models.CharField(max_length=10, choices=FileEventLog.EVENT_CHOICES)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['user', '-day'], name='chat_rollup_user_day_idx'),
+            models.Index(fields=['day'], name='chat_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.count} {self.event_type} by {self.user_id} on {self.file_id}"
+
+
+class FileProcessingJob(models.Model):
+    """Text extraction of one content hash, shared by every upload of those bytes."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    hash = models.CharField(max_length=64, unique=True)
+    # Name of the upload that queued the job; the file type is detected from its extension
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    chunk_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # A running job whose lease expired belongs to a dead worker and is claimed again
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='chat_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.hash[:12]}): {self.status}"
+
+
+class TextChunk(models.Model):
+    """Normalized text extracted from a file, in order; consecutive chunks overlap."""
+    job = models.ForeignKey(FileProcessingJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    text = models.TextField()
+    # Byte range of the file the text came from
+    start_offset = models.BigIntegerField(default=0)
+    end_offset = models.BigIntegerField(default=0)
+    token_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('job', 'index')
+        ordering = ['index']
+
+    def __str__(self):
+        return f"chunk {self.index} of {self.job_id}"
+
+
+class IndexedJob(models.Model):
+    """A job whose chunks are in a user's retrieval shard (``chat.rag.shards``)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    job = models.ForeignKey(FileProcessingJob, on_delete=models.CASCADE, related_name='indexed_for')
+    indexed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'job')
+
+    def __str__(self):
+        return f"job {self.job_id} indexed for user {self.user_id}"
@@ -0,0 +1,116 @@
+import hashlib
+
+from django.db import connection
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from src.utils.cache import cache
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CountFreePagination(StandardResultsSetPagination):
+    """
+    Page-number pagination without a COUNT(*) per page.
+
+    One extra row is fetched to know whether a next page exists. The response keeps the
+    `count`, `next`, `previous`, `results` shape; `count` is filled according to `count_mode`:
+        - "none": always null
+        - "cached": exact count, computed once per query and cached (keyed by the view's
+          cache versions when it has them, so writes refresh it)
+        - "estimate": query planner estimate on PostgreSQL, exact count elsewhere
+    On the last page the count is known from the offset and is always exact and free. Otherwise
+    the count is never below the rows already seen plus the known next row, so a stale estimate
+    cannot contradict the page.
+    """
+    count_mode = 'cached'
+    count_cache_timeout = 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.page_number = self._get_page_number(request)
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=self.page_number, message='That page contains no results')
+            )
+
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if self.has_next:
+            self.count = self.get_count(queryset, view)
+            if self.count is not None:
+                self.count = max(self.count, offset + len(rows) + 1)
+        else:
+            self.count = offset + len(rows)
+        return rows
+
+    def _get_page_number(self, request):
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            page_number = 0
+        if page_number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+        return page_number
+
+    def get_count(self, queryset, view=None):
+        if self.count_mode == 'none':
+            return None
+        if self.count_mode == 'estimate' and connection.vendor == 'postgresql':
+            return self._estimate_count(queryset)
+        if self.count_mode == 'cached':
+            return self._cached_count(queryset, view)
+        return queryset.count()
+
+    def _cached_count(self, queryset, view):
+        sql, params = queryset.order_by().query.sql_with_params()
+        versions = view.get_cache_versions() if hasattr(view, 'get_cache_versions') else []
+        digest = hashlib.sha1(repr((sql, params, versions)).encode()).hexdigest()
+        return cache.get_or_compute(f'pagination:count:{digest}', queryset.count, self.count_cache_timeout)
+
+    @staticmethod
+    def _estimate_count(queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+
+class EstimatedCountPagination(CountFreePagination):
+    count_mode = 'estimate'
@@ -0,0 +1,3 @@
+"""
+Retrieval over the text extracted from uploaded files (``TextChunk`` rows), behind ``RAGQueryView``.
+"""
@@ -0,0 +1,28 @@
+"""
+Query and document analysis shared by indexing and search.
+"""
+
+import re
+from typing import List
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Terms longer than this are mostly identifiers, hashes and base64 that nobody searches for
+MAX_TERM_LENGTH = 40
+
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be but by for from has have he her his i if in into is it its me my no not of on
+    or our she so such that the their them then there these they this to was we were what when which
+    who will with you your
+    """.split()
+)
+
+
+def analyze(text: str) -> List[str]:
+    """Lower-cased word terms of ``text`` in order, without stop words."""
+    return [
+        term
+        for term in TERM_RE.findall(text.lower())
+        if term not in STOP_WORDS and len(term) <= MAX_TERM_LENGTH
+    ]
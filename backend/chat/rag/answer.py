@@ -0,0 +1,87 @@
+"""
+Answers to questions about the user's files, written by a GPT model from the passages retrieval finds.
+
+``stream_answer`` yields server-sent events: the passages the answer is based on (``citations``)
+as soon as retrieval is done, then the answer (``token``) as the model writes it, then ``done``, or
+``error`` if the model fails midway. A client shows its sources after the search, not after the
+whole answer was generated.
+
+Passages go into the prompt best first, numbered for the model to cite, while they fit in the
+model's context window (``GPT_VERSIONS``) next to the instructions, the question and
+``RAG_ANSWER_TOKENS`` left for the answer; the rest are neither sent nor cited. Token counts are the
+estimate of ``chat.utils.chunking``, which errs high, so prompts do not overflow the window.
+"""
+
+import json
+import logging
+from typing import Iterator, List, Tuple
+
+from django.conf import settings
+
+from chat.rag.retrieval import cached_retrieve
+from chat.utils.chunking import count_tokens
+from src.utils.gpt import GPT_VERSIONS, SYSTEM_PROMPT, get_conversation_answer
+
+logger = logging.getLogger(__name__)
+
+INSTRUCTIONS = (
+    "Answer the question using only the numbered passages from the user's files below. Cite the passages "
+    "you use by their number in brackets, like [1]. If they do not hold the answer, say so."
+)
+# Tokens the chat format adds around each message
+MESSAGE_TOKENS = 4
+
+
+def passage_budget(model: str, question: str) -> int:
+    """Tokens left for passages in a prompt to ``model``; negative when the question alone is too long."""
+    fixed = count_tokens(SYSTEM_PROMPT) + count_tokens(INSTRUCTIONS) + count_tokens(question) + 3 * MESSAGE_TOKENS
+    return GPT_VERSIONS[model].context_window - settings.RAG_ANSWER_TOKENS - fixed
+
+
+def build_prompt(question: str, results: List[dict], budget: int) -> Tuple[str, List[dict]]:
+    """
+    The prompt answering ``question`` from retrieval results.
+
+    Args:
+        question: The user's question
+        results: Retrieval results, best first
+        budget: Tokens the passages may take, from ``passage_budget``
+
+    Returns:
+        Tuple[str, List[dict]]: The prompt, and the results it holds, passage ``[n]`` being the n-th
+    """
+    passages, cited = [], []
+    for result in results:
+        passage = f"[{len(cited) + 1}] {result['name']}\n{result['text']}"
+        tokens = count_tokens(passage)
+        if tokens > budget:
+            break
+        budget -= tokens
+        passages.append(passage)
+        cited.append(result)
+    return '\n\n'.join([INSTRUCTIONS, *passages, f"Question: {question}"]), cited
+
+
+def event(name: str, data) -> str:
+    """A server-sent event carrying ``data`` as JSON, so tokens with line breaks fit on one line."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_answer(user, query: str, k: int, mode: str, dedupe: bool, model: str) -> Iterator[str]:
+    """
+    Server-sent events answering ``query`` from the user's files with ``model``.
+
+    The model is not called when no passage matches: there would be nothing to base an answer on.
+    """
+    results = cached_retrieve(user, query, k, mode, dedupe)
+    prompt, cited = build_prompt(query, results, passage_budget(model, query))
+    yield event('citations', cited)
+    if cited:
+        try:
+            for token in get_conversation_answer([{"role": "user", "content": prompt}], model, stream=True):
+                yield event('token', token)
+        except Exception:
+            logger.exception('Answering a RAG query with %s failed', model)
+            yield event('error', {"error": "The model failed to answer"})
+            return
+    yield event('done', {})
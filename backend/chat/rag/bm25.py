@@ -0,0 +1,195 @@
+"""
+BM25 top-k retrieval over index segments with MaxScore early termination.
+
+Documents are scored one at a time in ordinal order (document-at-a-time). Every query term has an
+upper bound on what it can add to a score; once the top-k heap is full, terms whose bounds together
+cannot lift a document above the k-th score are "non-essential": their postings are never iterated,
+only probed (by binary search) for documents the other terms found, and scoring a document stops as
+soon as what is left cannot get it into the heap.
+"""
+
+import heapq
+import math
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Collection, List, NamedTuple, Optional, Sequence, Tuple
+
+from chat.rag.segments import Segment
+
+_EXHAUSTED = float('inf')
+
+
+@dataclass(frozen=True)
+class BM25:
+    k1: float = 1.2
+    b: float = 0.75
+
+    def idf(self, df: int, docs: int) -> float:
+        # Lucene's variant, never negative for terms in more than half the documents
+        return math.log(1 + (docs - df + 0.5) / (df + 0.5))
+
+
+class Hit(NamedTuple):
+    score: float
+    chunk_id: int
+    job_id: int
+
+
+class TopK:
+    """The k best hits seen so far, in a min-heap whose root is the score to beat."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[float, int, int]] = []
+
+    @property
+    def threshold(self) -> float:
+        return self._heap[0][0] if len(self._heap) >= self.k else 0.0
+
+    def push(self, score: float, chunk_id: int, job_id: int) -> bool:
+        """Add a hit if it makes the top k; True when that raised the threshold."""
+        # Ties are broken towards lower chunk ids, so results do not depend on segment order
+        entry = (score, -chunk_id, job_id)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return len(self._heap) == self.k
+        if entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def hits(self) -> List[Hit]:
+        return [Hit(score, -chunk_id, job_id) for score, chunk_id, job_id in sorted(self._heap, reverse=True)]
+
+
+class _Cursor:
+    __slots__ = ('docs', 'freqs', 'weight', 'bound', 'position', 'doc')
+
+    def __init__(self, docs: Sequence[int], freqs: Sequence[int], weight: float, bound: float):
+        self.docs = docs
+        self.freqs = freqs
+        self.weight = weight
+        self.bound = bound
+        self.position = 0
+        self.doc = docs[0] if len(docs) else _EXHAUSTED
+
+    def next(self):
+        self.position += 1
+        self.doc = self.docs[self.position] if self.position < len(self.docs) else _EXHAUSTED
+
+    def seek(self, target: int):
+        """Move to the first posting at or after ``target``."""
+        if self.doc < target:
+            self.position = bisect_left(self.docs, target, self.position + 1)
+            self.doc = self.docs[self.position] if self.position < len(self.docs) else _EXHAUSTED
+
+
+def search_segment(
+    segment: Segment,
+    query: Sequence[Tuple[str, float]],
+    avg_length: float,
+    top: TopK,
+    bm25: BM25,
+    allowed_jobs: Optional[Collection[int]] = None,
+    excluded_jobs: Collection[int] = (),
+):
+    """
+    Score one segment into ``top``.
+
+    Args:
+        segment: The segment to search
+        query: ``(term, weight)`` pairs, the weight being the term's IDF times its count in the query
+        avg_length: Average document length of the whole index
+        top: Heap shared by every segment searched, so a good threshold carries over
+        bm25: Scoring parameters
+        allowed_jobs: Only documents of these jobs are hits; None for all
+        excluded_jobs: Documents of these jobs are never hits
+    """
+    k1, b = bm25.k1, bm25.b
+    norm_base, norm_per_length = k1 * (1 - b), k1 * b / avg_length
+    min_norm = norm_base + norm_per_length * segment.min_length
+    cursors = []
+    for term, weight in query:
+        entry = segment.term_postings(term)
+        if entry is None:
+            continue
+        docs, freqs, max_tf = entry
+        # The most a term can add: its highest frequency in the shortest document of the segment
+        bound = weight * max_tf * (k1 + 1) / (max_tf + min_norm)
+        cursors.append(_Cursor(docs, freqs, weight * (k1 + 1), bound))
+    if not cursors:
+        return
+    cursors.sort(key=lambda cursor: cursor.bound)
+    # bounds[i]: the most cursors[0..i] can add together
+    bounds = list(accumulate(cursor.bound for cursor in cursors))
+    lengths, job_ids, chunk_ids = segment.lengths, segment.job_ids, segment.chunk_ids
+
+    essential = 0
+    while True:
+        threshold = top.threshold
+        while essential < len(cursors) and bounds[essential] <= threshold:
+            essential += 1
+        if essential == len(cursors):
+            # Not even every term together can beat the k-th score any more
+            return
+        doc = min(cursor.doc for cursor in cursors[essential:])
+        if doc == _EXHAUSTED:
+            return
+        job_id = job_ids[doc]
+        if (allowed_jobs is not None and job_id not in allowed_jobs) or job_id in excluded_jobs:
+            for cursor in cursors[essential:]:
+                if cursor.doc == doc:
+                    cursor.next()
+            continue
+
+        norm = norm_base + norm_per_length * lengths[doc]
+        score = 0.0
+        for cursor in cursors[essential:]:
+            if cursor.doc == doc:
+                tf = cursor.freqs[cursor.position]
+                score += cursor.weight * tf / (tf + norm)
+                cursor.next()
+        for i in range(essential - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                break
+            cursor = cursors[i]
+            cursor.seek(doc)
+            if cursor.doc == doc:
+                tf = cursor.freqs[cursor.position]
+                score += cursor.weight * tf / (tf + norm)
+        else:
+            top.push(score, chunk_ids[doc], job_id)
+
+
+def search_segments(
+    segments: Sequence[Segment],
+    terms: Sequence[str],
+    k: int,
+    bm25: BM25 = BM25(),
+    allowed_jobs: Optional[Collection[int]] = None,
+    excluded_jobs: Collection[int] = (),
+) -> List[Hit]:
+    """
+    The ``k`` best BM25 hits for the analyzed query ``terms`` across ``segments``.
+
+    Corpus statistics (document count, average length, document frequencies) are taken over all
+    segments, so scores do not depend on how documents are split between them.
+    """
+    docs = sum(segment.docs for segment in segments)
+    if not docs or not terms or k < 1:
+        return []
+    avg_length = sum(segment.total_length for segment in segments) / docs
+    counts = {}
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    query = []
+    for term, count in counts.items():
+        df = sum(segment.terms[term][1] for segment in segments if term in segment.terms)
+        if df:
+            query.append((term, count * bm25.idf(df, docs)))
+    top = TopK(k)
+    # Largest segments first: they fill the heap with good hits soonest
+    for segment in sorted(segments, key=lambda segment: segment.docs, reverse=True):
+        search_segment(segment, query, avg_length, top, bm25, allowed_jobs, excluded_jobs)
+    return top.hits()
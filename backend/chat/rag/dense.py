@@ -0,0 +1,271 @@
+"""
+Dense (embedding) retrieval over memory-mapped ``.npy`` segments.
+
+A segment holds ``vectors.npy`` (float32, one unit-length row per chunk), and ``chunks.npy`` and
+``jobs.npy`` (int64) for the chunk and job of every row. Segments are opened with
+``np.load(mmap_mode='r')``, so every process searching the index reads the same pages from the OS
+page cache instead of holding a private copy. A query is embedded once and scored against each
+segment in blocks of rows, one matrix-vector product per block, keeping the block's best rows with
+``argpartition``; memory stays bounded by the block size however large the index grows.
+
+Segments are append-only and compacted like the lexical ones (``chat.rag.index``). Segments of at
+least ``RAG_IVF_MIN_ROWS`` rows, which only merges and rebuilds produce, are clustered into an
+inverted file (``chat.rag.ivf``) and searched approximately, probing ``RAG_IVF_NPROBE`` lists;
+new documents land in small flat segments that are searched exactly.
+"""
+
+import json
+import os
+import shutil
+from typing import Callable, Collection, List, Optional
+
+import numpy as np
+
+from chat.rag.bm25 import Hit
+from chat.rag.embeddings import Embedder
+from chat.rag.index import SegmentedIndex
+from chat.rag.ivf import cluster_segment
+
+# Rows scored per matrix-vector product: 64 MB of float32 at 256 dimensions
+BLOCK_ROWS = 65536
+
+
+class DenseSegment:
+    """A read-only segment of embeddings, memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        self.docs = meta['docs']
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.chunk_ids = np.load(os.path.join(path, 'chunks.npy'), mmap_mode='r')
+        self.job_ids = np.load(os.path.join(path, 'jobs.npy'), mmap_mode='r')
+        # Clustered segments: rows of list i are offsets[i]:offsets[i + 1]
+        self.centroids = self.offsets = None
+        if os.path.exists(os.path.join(path, 'centroids.npy')):
+            self.centroids = np.load(os.path.join(path, 'centroids.npy'), mmap_mode='r')
+            self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+
+    def __repr__(self):
+        kind = f'{len(self.centroids)} lists' if self.centroids is not None else 'flat'
+        return f'<DenseSegment {self.name}: {self.docs} docs, {kind}>'
+
+
+def _publish(staging: str, path: str, docs: int, ivf_min_rows: Optional[int]):
+    if ivf_min_rows is not None and docs >= ivf_min_rows:
+        cluster_segment(staging, BLOCK_ROWS)
+    with open(os.path.join(staging, 'meta.json'), 'w') as file:
+        json.dump({'docs': docs}, file)
+    os.rename(staging, path)
+
+
+def _staging(path: str) -> str:
+    staging = f'{path}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    return staging
+
+
+class DenseSegmentBuilder:
+    """Embed documents in batches and write them out as one segment."""
+
+    def __init__(self, embedder: Embedder, batch_size: int = 256, ivf_min_rows: Optional[int] = None):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.ivf_min_rows = ivf_min_rows
+        self.chunk_ids: List[int] = []
+        self.job_ids: List[int] = []
+        self._texts: List[str] = []
+        self._vectors: List[np.ndarray] = []
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def add(self, chunk_id: int, job_id: int, text: str):
+        self.chunk_ids.append(chunk_id)
+        self.job_ids.append(job_id)
+        self._texts.append(text)
+        if len(self._texts) >= self.batch_size:
+            self._embed()
+
+    def _embed(self):
+        if self._texts:
+            self._vectors.append(self.embedder.embed(self._texts))
+            self._texts = []
+
+    def write(self, path: str) -> bool:
+        if not self.chunk_ids:
+            return False
+        self._embed()
+        staging = _staging(path)
+        np.save(os.path.join(staging, 'vectors.npy'), np.concatenate(self._vectors))
+        np.save(os.path.join(staging, 'chunks.npy'), np.array(self.chunk_ids, dtype=np.int64))
+        np.save(os.path.join(staging, 'jobs.npy'), np.array(self.job_ids, dtype=np.int64))
+        _publish(staging, path, len(self.chunk_ids), self.ivf_min_rows)
+        return True
+
+
+def merge_dense_segments(
+    segments: List[DenseSegment], path: str, is_live: Callable[[int], bool], ivf_min_rows: Optional[int] = None
+) -> bool:
+    """
+    Merge ``segments`` into one at ``path``, dropping rows of jobs not ``is_live``.
+
+    Rows are copied block by block into a memory-mapped output, so no segment is loaded whole. The
+    result is clustered again when it has at least ``ivf_min_rows`` rows.
+
+    Returns:
+        bool: False when no live row was left and nothing was written
+    """
+    keeps = []
+    for segment in segments:
+        jobs = np.asarray(segment.job_ids)
+        unique = np.unique(jobs)
+        live = np.fromiter((job_id for job_id in unique.tolist() if is_live(job_id)), dtype=np.int64)
+        keeps.append(np.flatnonzero(np.isin(jobs, live)))
+    docs = sum(len(keep) for keep in keeps)
+    if not docs:
+        return False
+    staging = _staging(path)
+    dim = segments[0].vectors.shape[1]
+    outputs = {
+        'vectors.npy': np.lib.format.open_memmap(
+            os.path.join(staging, 'vectors.npy'), mode='w+', dtype=np.float32, shape=(docs, dim)
+        ),
+        'chunks.npy': np.lib.format.open_memmap(
+            os.path.join(staging, 'chunks.npy'), mode='w+', dtype=np.int64, shape=(docs,)
+        ),
+        'jobs.npy': np.lib.format.open_memmap(
+            os.path.join(staging, 'jobs.npy'), mode='w+', dtype=np.int64, shape=(docs,)
+        ),
+    }
+    row = 0
+    for segment, keep in zip(segments, keeps):
+        for start in range(0, len(keep), BLOCK_ROWS):
+            rows = keep[start:start + BLOCK_ROWS]
+            end = row + len(rows)
+            outputs['vectors.npy'][row:end] = segment.vectors[rows]
+            outputs['chunks.npy'][row:end] = segment.chunk_ids[rows]
+            outputs['jobs.npy'][row:end] = segment.job_ids[rows]
+            row = end
+    for output in outputs.values():
+        output.flush()
+    del outputs
+    _publish(staging, path, docs, ivf_min_rows)
+    return True
+
+
+def top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first."""
+    if len(scores) > k:
+        rows = np.argpartition(-scores, k - 1)[:k]
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(-scores[rows], kind='stable')]
+
+
+class _Candidates:
+    """The best rows found so far across blocks, lists and segments."""
+
+    def __init__(self, k: int, vector: np.ndarray, allowed: Optional[np.ndarray], excluded: Optional[np.ndarray]):
+        self.k = k
+        self.vector = vector
+        self.allowed = allowed
+        self.excluded = excluded
+        self.found = 0
+        self.scores, self.chunk_ids, self.job_ids = [], [], []
+
+    def score(self, segment: DenseSegment, start: int, stop: int):
+        """Score rows ``start:stop`` of a segment, keeping the best ``k`` that may be returned."""
+        for block in range(start, stop, BLOCK_ROWS):
+            end = min(stop, block + BLOCK_ROWS)
+            scores = segment.vectors[block:end] @ self.vector
+            jobs = segment.job_ids[block:end]
+            if self.allowed is not None:
+                scores[~np.isin(jobs, self.allowed)] = -np.inf
+            elif self.excluded is not None:
+                scores[np.isin(jobs, self.excluded)] = -np.inf
+            rows = top_rows(scores, self.k)
+            rows = rows[scores[rows] > 0]
+            self.found += len(rows)
+            self.scores.append(scores[rows])
+            self.chunk_ids.append(segment.chunk_ids[block:end][rows])
+            self.job_ids.append(jobs[rows])
+
+    def hits(self) -> List[Hit]:
+        if not self.scores:
+            return []
+        scores = np.concatenate(self.scores)
+        chunk_ids, job_ids = np.concatenate(self.chunk_ids), np.concatenate(self.job_ids)
+        # Best score first, ties towards lower chunk ids like the lexical index
+        order = np.lexsort((chunk_ids, -scores))[:self.k]
+        return [Hit(float(scores[i]), int(chunk_ids[i]), int(job_ids[i])) for i in order]
+
+
+class VectorIndex(SegmentedIndex):
+    """Embeddings of text chunks, searched by cosine similarity."""
+
+    def __init__(
+        self,
+        directory: str,
+        embedder: Embedder,
+        max_segments: int = 8,
+        ivf_min_rows: Optional[int] = None,
+        nprobe: int = 16,
+    ):
+        super().__init__(directory, max_segments)
+        self.embedder = embedder
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+
+    def open_segment(self, path: str) -> DenseSegment:
+        return DenseSegment(path)
+
+    def new_builder(self) -> DenseSegmentBuilder:
+        return DenseSegmentBuilder(self.embedder, ivf_min_rows=self.ivf_min_rows)
+
+    def merge_segments(self, segments: List[DenseSegment], path: str, is_live: Callable[[int], bool]) -> bool:
+        return merge_dense_segments(segments, path, is_live, self.ivf_min_rows)
+
+    def search(
+        self, query: str, k: int, allowed_jobs: Optional[Collection[int]] = None, nprobe: Optional[int] = None
+    ) -> List[Hit]:
+        """
+        The ``k`` chunks most similar to ``query``.
+
+        Args:
+            query: Free text, embedded like the documents
+            k: Number of hits
+            allowed_jobs: Only return chunks of these jobs; None for all
+            nprobe: Lists probed in clustered segments, the index's ``nprobe`` when None. When the
+                allowed jobs leave fewer than ``k`` hits in those lists, more lists are probed.
+
+        Returns:
+            List[Hit]: Cosine similarity, chunk id and job id, best first; chunks sharing no
+            feature with the query are left out
+        """
+        allowed_jobs, excluded_jobs = self.job_filter(allowed_jobs)
+        if k < 1 or (allowed_jobs is not None and not allowed_jobs):
+            return []
+        [vector] = self.embedder.embed([query])
+        if not vector.any():
+            return []
+        candidates = _Candidates(
+            k,
+            vector,
+            None if allowed_jobs is None else np.fromiter(allowed_jobs, dtype=np.int64),
+            np.fromiter(excluded_jobs, dtype=np.int64) if excluded_jobs else None,
+        )
+        nprobe = nprobe or self.nprobe
+        for segment in self.segments:
+            if segment.centroids is None:
+                candidates.score(segment, 0, segment.docs)
+                continue
+            found = candidates.found
+            for probed, lst in enumerate(np.argsort(-(segment.centroids @ vector))):
+                if probed >= nprobe and candidates.found - found >= k:
+                    break
+                candidates.score(segment, segment.offsets[lst], segment.offsets[lst + 1])
+        return candidates.hits()
@@ -0,0 +1,89 @@
+"""
+Text embedders for dense retrieval.
+
+The embedder is pluggable: ``RAG_EMBEDDER`` is the dotted path of a class built with
+``RAG_EMBEDDER_OPTIONS``. The default, ``HashingEmbedder``, needs no model or network: it hashes
+words and their character n-grams into a fixed number of signed buckets, so texts sharing words
+(or parts of words) get similar vectors. Vectors from different embedders cannot be compared, so
+each embedder's vectors are indexed in their own directory, named after ``Embedder.name``.
+"""
+
+import math
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from chat.rag.analysis import analyze
+
+
+class Embedder:
+    """Turns texts into unit-length float32 vectors whose dot product measures similarity."""
+
+    #: Identifies the vector space; indexes built with another name are not used
+    name: str = ''
+    dim: int = 0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Returns:
+            np.ndarray: float32 array of shape ``(len(texts), dim)``, rows of length 1, or 0 for a
+            text with nothing to embed
+        """
+        raise NotImplementedError
+
+
+@lru_cache(maxsize=200000)
+def _word_features(word: str, dim: int, ngram: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Buckets and signs of a word and its character n-grams, cached since words repeat a lot."""
+    padded = f'<{word}>'
+    features = [word, *(padded[i:i + ngram] for i in range(max(1, len(padded) - ngram + 1)))]
+    hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.uint32)
+    # Low bits pick the bucket, the top bit the sign, so collisions cancel out instead of piling up
+    signs = np.where(hashes >> 31, 1.0, -1.0).astype(np.float32)
+    # The whole word weighs as much as all its n-grams together
+    signs[1:] /= len(features) - 1
+    return (hashes % dim).astype(np.intp), signs
+
+
+class HashingEmbedder(Embedder):
+    """Signed feature hashing of words and their character n-grams, with log-scaled counts."""
+
+    def __init__(self, dim: int = 256, ngram: int = 3):
+        if dim < 1 or ngram < 1:
+            raise ValueError('dim and ngram must be positive')
+        self.dim = dim
+        self.ngram = ngram
+        self.name = f'hashing-{dim}-{ngram}'
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = Counter(analyze(text))
+            if not counts:
+                continue
+            buckets, weights = [], []
+            for word, count in counts.items():
+                word_buckets, signs = _word_features(word, self.dim, self.ngram)
+                buckets.append(word_buckets)
+                weights.append(signs * (1 + math.log(count)))
+            vectors[row] = np.bincount(np.concatenate(buckets), np.concatenate(weights), minlength=self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def get_embedder() -> Embedder:
+    """The embedder configured by ``RAG_EMBEDDER`` and ``RAG_EMBEDDER_OPTIONS``."""
+    return _load_embedder(settings.RAG_EMBEDDER, tuple(sorted(settings.RAG_EMBEDDER_OPTIONS.items())))
+
+
+@lru_cache(maxsize=None)
+def _load_embedder(path: str, options: tuple) -> Embedder:
+    return import_string(path)(**dict(options))
@@ -0,0 +1,34 @@
+"""
+Reciprocal-rank fusion of rankings from different retrievers.
+
+BM25 scores and cosine similarities are not on comparable scales, so results are combined by rank
+instead: a chunk scores ``sum(1 / (constant + rank))`` over the rankings it appears in (ranks from
+1). A chunk ranked well by both retrievers beats one ranked first by only one of them, and the
+constant (60 in the original paper) damps the weight of the very first ranks.
+"""
+
+from typing import Dict, List, Sequence
+
+from chat.rag.bm25 import Hit
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hit]], k: int, constant: int = 60) -> List[Hit]:
+    """
+    Fuse rankings into one.
+
+    Args:
+        rankings: Hits of each retriever, best first
+        k: Number of hits to return
+        constant: Added to every rank; larger values flatten the difference between ranks
+
+    Returns:
+        List[Hit]: The ``k`` best chunks with their fused score, ties broken towards lower chunk ids
+    """
+    scores: Dict[int, float] = {}
+    jobs: Dict[int, int] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            scores[hit.chunk_id] = scores.get(hit.chunk_id, 0.0) + 1.0 / (constant + rank)
+            jobs[hit.chunk_id] = hit.job_id
+    best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return [Hit(score, chunk_id, jobs[chunk_id]) for chunk_id, score in best]
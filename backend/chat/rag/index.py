@@ -0,0 +1,320 @@
+"""
+Indexes as directories of immutable segments listed by a manifest, and the lexical (BM25) index.
+
+``manifest.json`` names the live segments and a generation number bumped by every change. Writers
+(indexing by ``process_files``, ``rebuild_rag_index``) take an exclusive ``flock`` on the directory,
+write new segments, then replace the manifest atomically; readers only look at the manifest, and
+re-open segments when it changed, so searches never wait for writers. Replaced segments are
+deleted once the new manifest is in place; processes that still have them mapped keep reading the
+unlinked files until they refresh.
+
+Adding documents writes a new small segment, so an index only ever appends. Deleting the documents
+of a job records the job in the manifest, and searches skip it. Once there are more than
+``RAG_INDEX_MAX_SEGMENTS``, the smaller half is merged into one, and documents of deleted jobs, or
+of jobs that no longer exist, are dropped then. Adding documents of a deleted job again first merges
+every segment, dropping its old documents, and then takes the job out of the deleted ones.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Collection, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from chat.rag.analysis import analyze
+from chat.rag.bm25 import BM25, Hit, search_segments
+from chat.rag.segments import Segment, SegmentBuilder, merge_segments
+
+
+def directory_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class SegmentedIndex(ABC):
+    """
+    Documents in immutable segments listed by a manifest, shared through the filesystem by every process.
+
+    Subclasses say how a segment is opened, built from ``(chunk_id, job_id, text)`` documents, and
+    merged; segments have a ``name`` and a ``docs`` count.
+    """
+
+    def __init__(self, directory: str, max_segments: int = 8):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._segments: Dict[str, Any] = {}
+        self._sizes: Dict[str, int] = {}
+        self._deleted: FrozenSet[int] = frozenset()
+        self._generation = 0
+        self._signature = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def open_segment(self, path: str):
+        """Open the segment stored at ``path``."""
+
+    @abstractmethod
+    def new_builder(self):
+        """An empty builder with ``add(chunk_id, job_id, text)``, ``__len__`` and ``write(path) -> bool``."""
+
+    @abstractmethod
+    def merge_segments(self, segments: List[Any], path: str, is_live: Callable[[int], bool]) -> bool:
+        """Write ``segments`` merged into one at ``path``, without documents of jobs not ``is_live``."""
+
+    # Reading
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'generation': 0, 'segments': [], 'next': 1}
+
+    def refresh(self):
+        """Pick up changes made by other processes since the last call."""
+        try:
+            stat = os.stat(self.manifest_path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            for _ in range(3):
+                manifest = self._read_manifest()
+                try:
+                    segments = {
+                        name: self._segments.get(name) or self.open_segment(os.path.join(self.directory, name))
+                        for name in manifest['segments']
+                    }
+                except FileNotFoundError:
+                    # A merge removed a segment between reading the manifest and opening it
+                    continue
+                break
+            else:
+                raise RuntimeError(f'Could not load a consistent index from {self.directory}')
+            self._sizes = {
+                name: self._sizes.get(name) or directory_size(segment.path) for name, segment in segments.items()
+            }
+            self._segments = segments
+            self._deleted = frozenset(manifest.get('deleted', ()))
+            self._generation = manifest['generation']
+            self._signature = signature
+
+    @property
+    def generation(self) -> int:
+        self.refresh()
+        return self._generation
+
+    def stored_generation(self) -> int:
+        """The generation on disk, read without opening any segment."""
+        return self._read_manifest()['generation']
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the segments opened so far, which their maps and dictionaries may take in memory."""
+        return sum(self._sizes.values())
+
+    @property
+    def segments(self) -> List[Any]:
+        self.refresh()
+        return list(self._segments.values())
+
+    @property
+    def deleted_jobs(self) -> FrozenSet[int]:
+        """Jobs whose documents are skipped until a merge drops them."""
+        self.refresh()
+        return self._deleted
+
+    def __len__(self):
+        return sum(segment.docs for segment in self.segments)
+
+    def job_filter(self, allowed_jobs: Optional[Collection[int]]) -> Tuple[Optional[Collection[int]], FrozenSet[int]]:
+        """
+        What a search may return, given the jobs the caller allows.
+
+        Returns:
+            Tuple: The allowed jobs without the deleted ones (None for all), and the jobs to skip when
+            every job is allowed
+        """
+        deleted = self.deleted_jobs
+        if allowed_jobs is None:
+            return None, deleted
+        if deleted:
+            return set(allowed_jobs) - deleted, frozenset()
+        return allowed_jobs, frozenset()
+
+    # Writing
+
+    @contextmanager
+    def _writing(self):
+        """Hold the directory's write lock, yielding the current manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self._read_manifest()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _commit(
+        self, manifest: dict, segments: List[str], removed: Iterable[str] = (), deleted: Iterable[int] = None
+    ):
+        manifest = {**manifest, 'generation': manifest['generation'] + 1, 'segments': segments}
+        if deleted is not None:
+            manifest['deleted'] = sorted(deleted)
+        staging = f'{self.manifest_path}.tmp'
+        with open(staging, 'w') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(staging, self.manifest_path)
+        for name in removed:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self.refresh()
+
+    def _new_segment_name(self, manifest: dict) -> str:
+        name = f"seg-{manifest['next']:08d}"
+        manifest['next'] += 1
+        return name
+
+    def add(self, documents: Iterable[Tuple[int, int, str]], live_jobs: Optional[Collection[int]] = None) -> int:
+        """
+        Index ``(chunk_id, job_id, text)`` documents as a new segment.
+
+        Args:
+            documents: Documents to add; a document must not already be in the index
+            live_jobs: Jobs that still exist, used to drop the dead ones' documents if segments are merged
+
+        Returns:
+            int: Number of documents added
+        """
+        builder = self.new_builder()
+        jobs = set()
+        for chunk_id, job_id, text in documents:
+            builder.add(chunk_id, job_id, text)
+            jobs.add(job_id)
+        if not len(builder):
+            return 0
+        with self._writing() as manifest:
+            deleted = set(manifest.get('deleted', ()))
+            if jobs & deleted:
+                # A deleted job indexed again: its old documents must be gone before it stops being skipped
+                self.refresh()
+                if self.segments:
+                    self._merge(manifest, self.segments, live_jobs)
+                    manifest = self._read_manifest()
+                    deleted = set(manifest.get('deleted', ()))
+            name = self._new_segment_name(manifest)
+            builder.write(os.path.join(self.directory, name))
+            segments = [*manifest['segments'], name]
+            self._commit(manifest, segments, deleted=deleted - jobs if jobs & deleted else None)
+            if len(segments) > self.max_segments:
+                self._merge_smallest(self._read_manifest(), live_jobs)
+        return len(builder)
+
+    def delete_jobs(self, job_ids: Iterable[int]):
+        """Stop returning the documents of ``job_ids``; they are dropped when their segment is merged."""
+        job_ids = set(job_ids)
+        if not job_ids or not os.path.exists(self.manifest_path):
+            return
+        with self._writing() as manifest:
+            deleted = set(manifest.get('deleted', ()))
+            if not job_ids <= deleted:
+                self._commit(manifest, manifest['segments'], deleted=deleted | job_ids)
+
+    def _merge_smallest(self, manifest: dict, live_jobs: Optional[Collection[int]]):
+        by_size = sorted(self.segments, key=lambda segment: segment.docs)
+        self._merge(manifest, by_size[:max(2, len(by_size) // 2)], live_jobs)
+
+    def _merge(self, manifest: dict, segments: List[Any], live_jobs: Optional[Collection[int]]):
+        name = self._new_segment_name(manifest)
+        deleted = set(manifest.get('deleted', ()))
+
+        def is_live(job_id: int) -> bool:
+            return job_id not in deleted and (live_jobs is None or job_id in live_jobs)
+
+        written = self.merge_segments(segments, os.path.join(self.directory, name), is_live)
+        merged = {segment.name for segment in segments}
+        # The merged segment takes the place of the first merged one, keeping document order by age
+        kept = []
+        for existing in manifest['segments']:
+            if existing not in merged:
+                kept.append(existing)
+            elif written and name not in kept:
+                kept.append(name)
+        # Once every segment was merged, no deleted job has documents left
+        everything = merged >= set(manifest['segments'])
+        self._commit(manifest, kept, removed=merged, deleted=() if everything else None)
+
+    def compact(self, live_jobs: Optional[Collection[int]] = None):
+        """Merge every segment into one, dropping documents of jobs not in ``live_jobs``."""
+        with self._writing() as manifest:
+            self.refresh()
+            segments = self.segments
+            if segments:
+                self._merge(manifest, segments, live_jobs)
+
+    def rebuild(self, documents: Iterable[Tuple[int, int, str]], batch_size: int = 50000) -> int:
+        """
+        Replace the whole index with ``documents``, written in segments of ``batch_size``.
+
+        Searches keep using the old segments until the new manifest is in place.
+        """
+        with self._writing() as manifest:
+            old = list(manifest['segments'])
+            names, count = [], 0
+            builder = self.new_builder()
+            for chunk_id, job_id, text in documents:
+                builder.add(chunk_id, job_id, text)
+                if len(builder) >= batch_size:
+                    count += self._flush(builder, manifest, names)
+                    builder = self.new_builder()
+            count += self._flush(builder, manifest, names)
+            self._commit(manifest, names, removed=old, deleted=())
+        return count
+
+    def _flush(self, builder, manifest: dict, names: List[str]) -> int:
+        name = self._new_segment_name(manifest)
+        if builder.write(os.path.join(self.directory, name)):
+            names.append(name)
+        return len(builder)
+
+
+class LexicalIndex(SegmentedIndex):
+    """BM25 index over text chunks."""
+
+    def __init__(self, directory: str, max_segments: int = 8, bm25: BM25 = BM25()):
+        super().__init__(directory, max_segments)
+        self.bm25 = bm25
+
+    def open_segment(self, path: str) -> Segment:
+        return Segment(path)
+
+    def new_builder(self) -> SegmentBuilder:
+        return SegmentBuilder(analyze)
+
+    def merge_segments(self, segments: List[Segment], path: str, is_live: Callable[[int], bool]) -> bool:
+        return merge_segments(segments, path, is_live)
+
+    def search(self, query: str, k: int, allowed_jobs: Optional[Collection[int]] = None) -> List[Hit]:
+        """
+        The ``k`` best chunks for ``query``.
+
+        Args:
+            query: Free text, analyzed like the documents
+            k: Number of hits
+            allowed_jobs: Only return chunks of these jobs; None for all
+
+        Returns:
+            List[Hit]: Score, chunk id and job id, best first
+        """
+        allowed_jobs, excluded_jobs = self.job_filter(allowed_jobs)
+        if allowed_jobs is not None and not allowed_jobs:
+            return []
+        return search_segments(self.segments, analyze(query), k, self.bm25, allowed_jobs, excluded_jobs)
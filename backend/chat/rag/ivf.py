@@ -0,0 +1,94 @@
+"""
+Inverted file (IVF) clustering of dense segments, for approximate nearest-neighbour search.
+
+Large segments are clustered with spherical k-means into about ``sqrt(rows)`` lists, and their rows
+are stored grouped by list, so a list is one contiguous range of the memory-mapped matrix. A query
+scores the centroids, then only the rows of the ``nprobe`` closest lists: a larger ``nprobe`` trades
+latency for recall, up to exact search when every list is probed.
+
+Centroids are trained on a sample of the rows, and rows are assigned and reordered block by block,
+so clustering holds a few blocks of the matrix in memory, not all of it.
+"""
+
+import math
+import os
+from typing import Tuple
+
+import numpy as np
+
+# Rows sampled per list to train centroids, and k-means iterations
+SAMPLE_PER_LIST = 64
+ITERATIONS = 10
+# Bytes of scores computed at once when assigning rows to lists
+ASSIGN_BLOCK_BYTES = 2**26
+
+
+def list_count(rows: int) -> int:
+    """Number of lists for a segment: about the square root of its rows, so lists and probes stay balanced."""
+    return max(1, min(rows, int(math.sqrt(rows))))
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """The closest centroid of every row, computed block by block."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    block = max(1, ASSIGN_BLOCK_BYTES // (4 * len(centroids)))
+    for start in range(0, len(vectors), block):
+        labels[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors: np.ndarray, lists: int, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on a sample of ``vectors``.
+
+    Returns:
+        np.ndarray: ``(lists, dim)`` unit-length float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    size = min(len(vectors), lists * SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), size=size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(size, size=lists, replace=False)].copy()
+    for _ in range(ITERATIONS):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        centroids[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        # An empty list restarts from a random row rather than staying empty
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = sample[rng.choice(size, size=len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        np.divide(centroids, norms, out=centroids, where=norms > 0)
+    return centroids
+
+
+def cluster_segment(path: str, block_rows: int, seed: int = 0) -> Tuple[int, int]:
+    """
+    Cluster a flat segment's files at ``path`` in place, before it is published.
+
+    Rows of ``vectors.npy``, ``chunks.npy`` and ``jobs.npy`` are reordered by list, and
+    ``centroids.npy`` and ``offsets.npy`` (where each list starts, plus the row count) are added.
+
+    Returns:
+        Tuple[int, int]: Rows and lists
+    """
+    vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+    lists = list_count(len(vectors))
+    centroids = train_centroids(vectors, lists, seed)
+    labels = assign(vectors, centroids)
+    order = np.argsort(labels, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=lists))]).astype(np.int64)
+    del vectors
+    for filename in ('vectors.npy', 'chunks.npy', 'jobs.npy'):
+        source = np.load(os.path.join(path, filename), mmap_mode='r')
+        staging = os.path.join(path, f'{filename}.tmp')
+        target = np.lib.format.open_memmap(staging, mode='w+', dtype=source.dtype, shape=source.shape)
+        for start in range(0, len(order), block_rows):
+            target[start:start + block_rows] = source[order[start:start + block_rows]]
+        target.flush()
+        del source, target
+        os.replace(staging, os.path.join(path, filename))
+    np.save(os.path.join(path, 'centroids.npy'), centroids)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    return len(order), lists
@@ -0,0 +1,223 @@
+"""
+Retrieval for a user: index the chunks of finished jobs in their uploaders' shards, and search the
+caller's shard.
+
+Chunks belong to content (one ``FileProcessingJob`` per hash), not to uploads, so they are
+extracted once however many users upload the same bytes, and indexed in the shard
+(``chat.rag.shards``) of each user with a live upload of them. ``IndexedJob`` records which jobs
+each shard holds; ``index_pending`` adds the missing ones, whether their job just finished or the
+user uploaded content extracted earlier. Searches are still limited to the jobs of the user's live
+uploads, read from the database on every query, so deleting an upload takes its chunks out of the
+results at once; deleting it for good also marks its job deleted in the shard, whose merges then
+drop the documents.
+
+Every chunk is in each of the shard's ``INDEXES``: BM25 over words (``lexical``) and embedding
+similarity (``dense``); the ``hybrid`` mode fuses both rankings. Results are cached per user,
+normalized query and options, under a key holding the user's ``files`` cache version, bumped by
+every upload and delete, and the generation of each of the user's indexes, bumped by every change
+to it: a repeated question is answered from the cache until something that could change its
+answer happens.
+"""
+
+import hashlib
+import logging
+import unicodedata
+from collections import defaultdict
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+
+from chat.models import FileProcessingJob, FileUpload, IndexedJob, TextChunk
+from chat.rag.fusion import reciprocal_rank_fusion
+from chat.rag.shards import SHARD_INDEXES, UserShard, get_shard
+from chat.utils.cache import FILES, get_cache_version
+from src.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+INDEXES = SHARD_INDEXES
+RETRIEVAL_MODES = (*INDEXES, 'hybrid')
+
+
+def chunk_documents(job_ids: Iterable[int] = None) -> Iterable[Tuple[int, int, str]]:
+    """``(chunk_id, job_id, text)`` of the chunks of done jobs, all of them when ``job_ids`` is None."""
+    chunks = TextChunk.objects.filter(job__status=FileProcessingJob.DONE)
+    if job_ids is not None:
+        chunks = chunks.filter(job_id__in=list(job_ids))
+    return chunks.order_by('id').values_list('id', 'job_id', 'text').iterator(chunk_size=2000)
+
+
+def _done_job():
+    """Subquery of the done job of an upload's content."""
+    return FileProcessingJob.objects.filter(hash=OuterRef('hash'), status=FileProcessingJob.DONE).values('id')[:1]
+
+
+def user_jobs(user_id: int) -> List[int]:
+    """Done jobs of the user's live uploads: what their shard should hold."""
+    return list(
+        FileUpload.objects.filter(uploader_id=user_id, deleted_at__isnull=True)
+        .annotate(job_id=Subquery(_done_job()))
+        .exclude(job_id=None)
+        .values_list('job_id', flat=True)
+    )
+
+
+def pending_jobs(job_ids: Optional[Iterable[int]] = None) -> Dict[int, List[int]]:
+    """
+    User id -> done jobs of their live uploads missing from their shard.
+
+    Args:
+        job_ids: Only look at uploads of these jobs' content, None for every upload
+    """
+    uploads = FileUpload.objects.filter(deleted_at__isnull=True)
+    if job_ids is not None:
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        uploads = uploads.filter(hash__in=FileProcessingJob.objects.filter(id__in=job_ids).values('hash'))
+    pairs = (
+        uploads.annotate(job_id=Subquery(_done_job()))
+        .exclude(job_id=None)
+        .exclude(Exists(IndexedJob.objects.filter(user=OuterRef('uploader'), job=OuterRef('job_id'))))
+        .order_by()
+        .values_list('uploader_id', 'job_id')
+        .distinct()
+    )
+    pending = defaultdict(list)
+    for user_id, job_id in pairs:
+        pending[user_id].append(job_id)
+    return pending
+
+
+def index_user_jobs(user_id: int, job_ids: List[int]) -> int:
+    """
+    Add the chunks of jobs to the user's shard and record them; returns the number of chunks added.
+
+    The jobs are recorded once indexed: a crash in between indexes them again on the next run.
+    """
+    shard = get_shard(user_id)
+    live = None
+    added = 0
+    for index in shard.indexes.values():
+        # Liveness only matters if the new segment triggers a merge
+        if live is None and len(index.segments) >= index.max_segments:
+            live = {*IndexedJob.objects.filter(user_id=user_id).values_list('job_id', flat=True), *job_ids}
+        added = index.add(chunk_documents(job_ids), live_jobs=live)
+    IndexedJob.objects.bulk_create(
+        [IndexedJob(user_id=user_id, job_id=job_id) for job_id in job_ids], ignore_conflicts=True
+    )
+    return added
+
+
+def index_pending(job_ids: Optional[Iterable[int]] = None) -> int:
+    """Index every pending ``(user, job)`` (limited to ``job_ids`` if given); returns chunks added."""
+    return sum(index_user_jobs(user_id, jobs) for user_id, jobs in pending_jobs(job_ids).items())
+
+
+def forget_jobs(user_id: int, job_ids: Iterable[int]):
+    """Take the chunks of jobs out of the user's shard; a failure leaves them to compaction."""
+    for mode, index in get_shard(user_id).indexes.items():
+        try:
+            index.delete_jobs(job_ids)
+        except Exception:
+            logger.exception('Removing jobs from the %s index of user %s failed', mode, user_id)
+
+
+def forget_upload(upload: FileUpload):
+    """An upload was deleted for good: its content leaves the uploader's shard once that commits."""
+    indexed = IndexedJob.objects.filter(user_id=upload.uploader_id, job__hash=upload.hash)
+    job_ids = list(indexed.values_list('job_id', flat=True))
+    if job_ids:
+        indexed.delete()
+        transaction.on_commit(partial(forget_jobs, upload.uploader_id, job_ids))
+
+
+def visible_jobs(user) -> Dict[int, List[Tuple[int, str]]]:
+    """Job id -> ``(file id, name)`` of the user's live uploads whose text was extracted."""
+    uploads = (
+        FileUpload.objects.filter(uploader=user, deleted_at__isnull=True)
+        .annotate(job_id=Subquery(_done_job()))
+        .exclude(job_id=None)
+        .order_by('id')
+        .values_list('job_id', 'id', 'name')
+    )
+    jobs = defaultdict(list)
+    for job_id, file_id, name in uploads:
+        jobs[job_id].append((file_id, name))
+    return jobs
+
+
+def search_hits(shard: UserShard, query: str, k: int, mode: str, allowed_jobs: Iterable[int]) -> List:
+    """The ``k`` best hits of a mode in a shard, fusing the rankings of every index for ``hybrid``."""
+    if mode != 'hybrid':
+        return shard.indexes[mode].search(query, k, allowed_jobs=allowed_jobs)
+    # Look deeper than k in each ranking, so chunks ranked fairly well by both can surface
+    depth = max(k, settings.RAG_HYBRID_DEPTH)
+    rankings = [index.search(query, depth, allowed_jobs=allowed_jobs) for index in shard.indexes.values()]
+    return reciprocal_rank_fusion(rankings, k, settings.RAG_RRF_CONSTANT)
+
+
+def retrieve(user, query: str, k: int, mode: str = 'lexical', dedupe: bool = False) -> List[dict]:
+    """
+    The ``k`` chunks of the user's files that best match ``query``.
+
+    Args:
+        user: Whose live uploads are searched
+        query: Free text
+        k: Number of results
+        mode: One of ``RETRIEVAL_MODES``
+        dedupe: Return a passage once when different content holds it word for word (content that is
+            byte for byte the same is indexed once anyway), with the file ids of all of them
+
+    Returns:
+        List[dict]: ``chunk_id``, ``score``, ``text``, byte offsets, and the ``file_ids`` and
+        ``name`` of the user's uploads the chunk comes from, best first
+    """
+    jobs = visible_jobs(user)
+    if not jobs:
+        return []
+    hits = search_hits(get_shard(user.pk), query, k * 2 if dedupe else k, mode, jobs.keys())
+    chunks = TextChunk.objects.in_bulk([hit.chunk_id for hit in hits])
+    results, seen = [], {}
+    for hit in hits:
+        chunk = chunks.get(hit.chunk_id)
+        if chunk is None:
+            # Deleted with its job since the query started
+            continue
+        files = jobs[hit.job_id]
+        if dedupe:
+            digest = hashlib.sha1(' '.join(chunk.text.split()).encode()).digest()
+            if digest in seen:
+                seen[digest]["file_ids"].extend(file_id for file_id, _ in files)
+                continue
+        result = {
+            "chunk_id": chunk.id,
+            "score": round(hit.score, 4),
+            "text": chunk.text,
+            "start_offset": chunk.start_offset,
+            "end_offset": chunk.end_offset,
+            "file_ids": [file_id for file_id, _ in files],
+            "name": files[0][1],
+        }
+        if dedupe:
+            seen[digest] = result
+        results.append(result)
+    return results[:k]
+
+
+def normalize_query(query: str) -> str:
+    """Case, Unicode form and spacing do not change results, so they do not split the cache."""
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def cached_retrieve(user, query: str, k: int, mode: str = 'lexical', dedupe: bool = False) -> List[dict]:
+    """``retrieve`` for the normalized query, cached until the user's files or an index change."""
+    query = normalize_query(query)
+    indexes = get_shard(user.pk).indexes.values()
+    versions = [get_cache_version(user.pk, FILES), *(index.stored_generation() for index in indexes)]
+    digest = hashlib.sha1(repr((query, k, mode, dedupe)).encode()).hexdigest()
+    key = f"rag:results:{user.pk}:{'.'.join(map(str, versions))}:{digest}"
+    return cache.get_or_compute(key, lambda: retrieve(user, query, k, mode, dedupe), settings.RAG_CACHE_TIMEOUT)
@@ -0,0 +1,178 @@
+"""
+Immutable on-disk segments of the lexical index.
+
+A segment is a directory of flat arrays in native byte order, memory-mapped when opened, so a
+segment costs only its term dictionary in memory and the OS page cache shares it between processes:
+
+- ``chunks.bin`` (int64), ``jobs.bin`` (int64), ``lengths.bin`` (uint32): per document, by ordinal
+- ``postings.bin`` (uint32): document ordinals of every term, ascending, terms one after the other
+- ``freqs.bin`` (uint16): the term frequency of each posting, capped at 65535
+- ``terms.json``: term -> ``[offset, count, max_tf]`` into the postings
+- ``meta.json``: document count, total and minimum document length
+
+Segments are written to a temporary directory and renamed into place, so a reader never sees a
+partial one. New documents go into new segments; merging rewrites segments into one.
+"""
+
+import json
+import mmap
+import os
+import shutil
+from array import array
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAX_FREQ = 2**16 - 1
+
+
+class Segment:
+    """A read-only segment, memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        with open(os.path.join(path, 'terms.json')) as file:
+            self.terms: Dict[str, List[int]] = json.load(file)
+        self.docs = meta['docs']
+        self.total_length = meta['total_length']
+        self.min_length = meta['min_length']
+        self._maps = []
+        self.chunk_ids = self._map('chunks.bin', 'q')
+        self.job_ids = self._map('jobs.bin', 'q')
+        self.lengths = self._map('lengths.bin', 'I')
+        self.postings = self._map('postings.bin', 'I')
+        self.freqs = self._map('freqs.bin', 'H')
+
+    def _map(self, filename: str, typecode: str):
+        with open(os.path.join(self.path, filename), 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return array(typecode)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def term_postings(self, term: str) -> Optional[Tuple[memoryview, memoryview, int]]:
+        """``(document ordinals, frequencies, max frequency)`` of a term, None if no document has it."""
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        offset, count, max_tf = entry
+        return self.postings[offset:offset + count], self.freqs[offset:offset + count], max_tf
+
+    def __repr__(self):
+        return f'<Segment {self.name}: {self.docs} docs, {len(self.terms)} terms>'
+
+
+def write_segment(
+    path: str,
+    chunk_ids: array,
+    job_ids: array,
+    lengths: array,
+    postings: Iterable[Tuple[str, array, array]],
+) -> bool:
+    """
+    Write a segment to ``path`` atomically.
+
+    Args:
+        path: Directory to create; must not exist
+        chunk_ids, job_ids, lengths: Per-document arrays, by ordinal
+        postings: ``(term, ordinals, frequencies)`` in ascending term order
+
+    Returns:
+        bool: False when there were no documents and nothing was written
+    """
+    if not len(chunk_ids):
+        return False
+    staging = f'{path}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    terms = {}
+    offset = 0
+    with open(os.path.join(staging, 'postings.bin'), 'wb') as docs_file, \
+            open(os.path.join(staging, 'freqs.bin'), 'wb') as freqs_file:
+        for term, docs, freqs in postings:
+            docs.tofile(docs_file)
+            freqs.tofile(freqs_file)
+            terms[term] = [offset, len(docs), max(freqs)]
+            offset += len(docs)
+    for filename, values in (('chunks.bin', chunk_ids), ('jobs.bin', job_ids), ('lengths.bin', lengths)):
+        with open(os.path.join(staging, filename), 'wb') as file:
+            values.tofile(file)
+    with open(os.path.join(staging, 'terms.json'), 'w') as file:
+        json.dump(terms, file, separators=(',', ':'))
+    with open(os.path.join(staging, 'meta.json'), 'w') as file:
+        json.dump({'docs': len(chunk_ids), 'total_length': sum(lengths), 'min_length': min(lengths)}, file)
+    os.rename(staging, path)
+    return True
+
+
+class SegmentBuilder:
+    """Analyze documents, collect them in memory and write them out as one segment."""
+
+    def __init__(self, analyzer: Callable[[str], List[str]]):
+        self.analyzer = analyzer
+        self.chunk_ids = array('q')
+        self.job_ids = array('q')
+        self.lengths = array('I')
+        self._postings = defaultdict(lambda: (array('I'), array('H')))
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def add(self, chunk_id: int, job_id: int, text: str):
+        terms = self.analyzer(text)
+        ordinal = len(self.chunk_ids)
+        self.chunk_ids.append(chunk_id)
+        self.job_ids.append(job_id)
+        # Empty documents still count towards the corpus, with length 1 so normalization stays finite
+        self.lengths.append(max(1, len(terms)))
+        for term, tf in Counter(terms).items():
+            docs, freqs = self._postings[term]
+            docs.append(ordinal)
+            freqs.append(min(tf, MAX_FREQ))
+
+    def write(self, path: str) -> bool:
+        postings = ((term, *self._postings[term]) for term in sorted(self._postings))
+        return write_segment(path, self.chunk_ids, self.job_ids, self.lengths, postings)
+
+
+def merge_segments(segments: List[Segment], path: str, is_live: Callable[[int], bool]) -> bool:
+    """
+    Merge ``segments`` into one new segment at ``path``, dropping documents of jobs not ``is_live``.
+
+    Postings are merged one term at a time, so memory holds the merged term dictionary and one
+    posting list, not the segments.
+
+    Returns:
+        bool: False when no live document was left and nothing was written
+    """
+    chunk_ids, job_ids, lengths = array('q'), array('q'), array('I')
+    remaps = []
+    for segment in segments:
+        remap = array('q', [-1]) * segment.docs
+        for ordinal in range(segment.docs):
+            if is_live(segment.job_ids[ordinal]):
+                remap[ordinal] = len(chunk_ids)
+                chunk_ids.append(segment.chunk_ids[ordinal])
+                job_ids.append(segment.job_ids[ordinal])
+                lengths.append(segment.lengths[ordinal])
+        remaps.append(remap)
+
+    def postings() -> Iterator[Tuple[str, array, array]]:
+        for term in sorted(set().union(*(segment.terms for segment in segments))):
+            docs, freqs = array('I'), array('H')
+            # New ordinals follow segment order, so concatenating keeps postings ascending
+            for segment, remap in zip(segments, remaps):
+                entry = segment.term_postings(term)
+                if entry is None:
+                    continue
+                for ordinal, tf in zip(*entry[:2]):
+                    if remap[ordinal] >= 0:
+                        docs.append(remap[ordinal])
+                        freqs.append(tf)
+            if docs:
+                yield term, docs, freqs
+
+    return write_segment(path, chunk_ids, job_ids, lengths, postings())
@@ -0,0 +1,130 @@
+"""
+Per-user retrieval shards.
+
+Uploads belong to their uploader, and a query only ever sees the caller's files, so every user has
+their own shard: a directory under ``RAG_INDEX_DIR/users/`` holding one index of each type in
+``SHARD_INDEXES``. A query scores the caller's chunks only, so its cost follows the caller's
+corpus, not everyone's. Content uploaded by several users is indexed in each of their shards.
+
+A process opens shards on first use and keeps them in an LRU, weighed by the size of the segments
+they opened (memory-mapped files and term dictionaries). Past ``RAG_SHARD_MEMORY_BYTES``, the least
+recently used shards are dropped, releasing their maps once in-flight searches finish, so users
+who are not querying cost no memory.
+"""
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from django.conf import settings
+
+from chat.rag.bm25 import BM25
+from chat.rag.dense import VectorIndex
+from chat.rag.embeddings import get_embedder
+from chat.rag.index import LexicalIndex, SegmentedIndex
+
+SHARD_INDEXES = ('lexical', 'dense')
+
+
+class UserShard:
+    """The retrieval indexes of one user's files."""
+
+    def __init__(self, user_id: int, directory: str):
+        self.user_id = user_id
+        self.directory = directory
+        embedder = get_embedder()
+        self.indexes: Dict[str, SegmentedIndex] = {
+            'lexical': LexicalIndex(
+                os.path.join(directory, 'lexical'),
+                max_segments=settings.RAG_INDEX_MAX_SEGMENTS,
+                bm25=BM25(k1=settings.RAG_BM25_K1, b=settings.RAG_BM25_B),
+            ),
+            'dense': VectorIndex(
+                # Vectors of another embedder are not comparable: each gets its own directory
+                os.path.join(directory, 'dense', embedder.name),
+                embedder,
+                max_segments=settings.RAG_INDEX_MAX_SEGMENTS,
+                ivf_min_rows=settings.RAG_IVF_MIN_ROWS,
+                nprobe=settings.RAG_IVF_NPROBE,
+            ),
+        }
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(index.memory_bytes for index in self.indexes.values())
+
+    def __repr__(self):
+        return f'<UserShard {self.user_id}: {self.memory_bytes} bytes open>'
+
+
+class ShardCache:
+    """Shards opened by this process, least recently used first, evicted past a byte budget."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._shards: 'OrderedDict[int, UserShard]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def directory(self, user_id: int) -> str:
+        return os.path.join(self.root, str(user_id))
+
+    def get(self, user_id: int) -> UserShard:
+        """The user's shard, opened if needed; opening is cheap, segments are mapped on first search."""
+        with self._lock:
+            shard = self._shards.pop(user_id, None) or UserShard(user_id, self.directory(user_id))
+            self._shards[user_id] = shard
+            self._evict()
+            return shard
+
+    def _evict(self):
+        # Sizes grow as shards are searched, so the budget is checked on every access. The shard
+        # just requested stays, even when it alone is over budget.
+        total = sum(shard.memory_bytes for shard in self._shards.values())
+        while total > self.max_bytes and len(self._shards) > 1:
+            _, shard = self._shards.popitem(last=False)
+            total -= shard.memory_bytes
+
+    def discard(self, user_id: int):
+        with self._lock:
+            self._shards.pop(user_id, None)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._shards
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(shard.memory_bytes for shard in self._shards.values())
+
+    def user_ids(self) -> List[int]:
+        """Users with a shard on disk."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(name) for name in os.listdir(self.root) if name.isdigit())
+
+
+_caches: Dict[str, ShardCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_shards() -> ShardCache:
+    """This process's shards under ``RAG_INDEX_DIR``."""
+    root = os.path.join(str(settings.RAG_INDEX_DIR), 'users')
+    with _caches_lock:
+        if root not in _caches:
+            _caches[root] = ShardCache(root, settings.RAG_SHARD_MEMORY_BYTES)
+        return _caches[root]
+
+
+def get_shard(user_id: int) -> UserShard:
+    return get_shards().get(user_id)
+
+
+def remove_shard(user_id: int):
+    """Delete a user's shard from disk, for a deleted user or before a rebuild."""
+    shards = get_shards()
+    shards.discard(user_id)
+    shutil.rmtree(shards.directory(user_id), ignore_errors=True)
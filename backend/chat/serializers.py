@@ -1,8 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from rest_framework import serializers
 
-from chat.models import Conversation, Message, Role, Version, FileUpload
+from chat.models import Conversation, Message, Role, Version, FileProcessingJob, FileUpload, UploadSession
+
+
+def validate_sha256(value: str) -> str:
+    value = value.lower()
+    if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+        raise serializers.ValidationError("Must be a hex SHA-256 digest.")
+    return value
 
 
 def should_serialize(validated_data, field_name) -> bool:
@@ -178,3 +188,88 @@ class FileUploadSerializer(serializers.ModelSerializer):
             'file',
         ]
         read_only_fields = ['id', 'name', 'size', 'hash', 'uploader', 'uploaded_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.IntegerField(required=False)
+    received_bytes = serializers.SerializerMethodField()
+    received_chunks = serializers.SerializerMethodField()
+    missing_chunks = serializers.SerializerMethodField()
+    expires_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'name',
+            'size',
+            'chunk_size',
+            'sha256',
+            'created_at',
+            'received_bytes',
+            'received_chunks',
+            'missing_chunks',
+            'expires_at',
+        ]
+        read_only_fields = ['id', 'created_at']
+        extra_kwargs = {'size': {'min_value': 1}}
+
+    def validate_size(self, value):
+        if value > settings.FILE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files can be at most {settings.FILE_UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_chunk_size(self, value):
+        if not settings.FILE_UPLOAD_MIN_CHUNK_SIZE <= value <= settings.FILE_UPLOAD_MAX_CHUNK_SIZE:
+            raise serializers.ValidationError(
+                f"Chunk size must be between {settings.FILE_UPLOAD_MIN_CHUNK_SIZE} "
+                f"and {settings.FILE_UPLOAD_MAX_CHUNK_SIZE} bytes."
+            )
+        return value
+
+    def validate_sha256(self, value):
+        return validate_sha256(value) if value else value
+
+    def create(self, validated_data):
+        validated_data.setdefault('chunk_size', settings.FILE_UPLOAD_CHUNK_SIZE)
+        return super().create(validated_data)
+
+    def _chunks(self, obj):
+        # One query per serialization, however many of the fields below use it
+        if getattr(obj, '_received', None) is None:
+            obj._received = list(obj.chunks.values_list('index', 'size'))
+        return obj._received
+
+    def get_received_bytes(self, obj):
+        return sum(size for _, size in self._chunks(obj))
+
+    def get_received_chunks(self, obj):
+        return [index for index, _ in self._chunks(obj)]
+
+    def get_missing_chunks(self, obj):
+        received = set(self.get_received_chunks(obj))
+        return [index for index in range(obj.chunk_count) if index not in received]
+
+    def get_expires_at(self, obj):
+        return obj.updated_at + timedelta(hours=settings.FILE_UPLOAD_SESSION_TTL_HOURS)
+
+
+class FileProcessingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FileProcessingJob
+        fields = ['id', 'status', 'attempts', 'error', 'chunk_count', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class DedupeProbeSerializer(serializers.Serializer):
+    hash = serializers.CharField(max_length=64, validators=[validate_sha256])
+    size = serializers.IntegerField(min_value=0)
+    name = serializers.CharField(max_length=255)
+    challenge = serializers.CharField(required=False)
+    proof = serializers.CharField(max_length=64, required=False, validators=[validate_sha256])
+
+    def validate_hash(self, value):
+        return value.lower()
+
+    def validate_proof(self, value):
+        return value.lower()
@@ -0,0 +1,49 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from chat.models import FileProcessingJob, FileUpload
+
+
+@receiver(post_delete, sender=FileUpload)
+def release_file_blob(sender, instance, **kwargs):
+    """Release the upload's blob however the row was deleted (view, admin, cascade from its user)."""
+    if instance.blob_id:
+        from chat.utils.blobs import release_blob
+
+        release_blob(instance.blob_id)
+    from chat.rag.retrieval import forget_upload
+
+    # The content leaves the uploader's retrieval shard, before its job may be deleted below
+    forget_upload(instance)
+    # Extracted text goes with the last upload of its content
+    if not FileUpload.objects.filter(hash=instance.hash).exists():
+        FileProcessingJob.objects.filter(hash=instance.hash).delete()
+
+
+@receiver([post_save, post_delete], sender=FileUpload)
+def invalidate_file_results(sender, instance, **kwargs):
+    """Uploads created, renamed or deleted row by row change what retrieval may return to their owner."""
+    from chat.utils.cache import bump_file_cache_version
+
+    bump_file_cache_version(instance.uploader_id)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def remove_retrieval_shard(sender, instance, **kwargs):
+    """A deleted user's retrieval shard goes once the deletion is committed."""
+    from chat.rag.shards import remove_shard
+
+    transaction.on_commit(partial(remove_shard, instance.pk))
+
+
+@receiver(request_finished)
+def flush_audit_log(sender, **kwargs):
+    """Write the file events buffered during the request once its response has been sent."""
+    from chat.utils.audit import audit_log
+
+    audit_log.flush()
@@ -0,0 +1,7 @@
+# Tests run against an in-memory cache, never the file cache the dev server shares
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "chat-tests",
+    }
+}
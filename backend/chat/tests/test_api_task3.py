@@ -2,15 +2,20 @@ from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.test import override_settings
+from src.utils.cache import cache
 from chat.models import Conversation, FileUpload, Version, Role, FileEventLog
+from chat.tests import TEST_CACHES
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 import io
 
 User = get_user_model()
 
+@override_settings(CACHES=TEST_CACHES)
 class Task3APITests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(email='test@example.com', password='testpass')
         self.user2 = User.objects.create_user(email='other@example.com', password='testpass')
         self.role = Role.objects.create(name='user')
@@ -95,8 +100,8 @@ class Task3APITests(APITestCase):
         url = reverse('file-delete', args=[file_id])
         response = self.client.delete(url)
         self.assertEqual(response.status_code, 204)
-        # Ensure it's gone
-        self.assertFalse(FileUpload.objects.filter(id=file_id).exists())
+        # Ensure it's gone; the row itself waits for the reaper
+        self.assertFalse(FileUpload.objects.filter(id=file_id, deleted_at__isnull=True).exists())
 
     def test_file_upload_rbac(self):
         # Only allowed roles can upload
@@ -134,8 +139,9 @@ class Task3APITests(APITestCase):
         data = {"query": "What is RAG?"}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 200)
-        self.assertIn('answer', response.data)
-        self.assertIn('RAG answer', response.data['answer'])
+        # Nothing was uploaded, so nothing can match
+        self.assertEqual(response.data['answer'], '')
+        self.assertEqual(response.data['results'], [])
 
     def test_file_process_endpoint(self):
         # Upload a file
@@ -145,9 +151,10 @@ class Task3APITests(APITestCase):
         file_id = response.data['id']
         url = reverse('file-process', args=[file_id])
         response = self.client.post(url)
-        self.assertEqual(response.status_code, 200)
-        self.assertIn('result', response.data)
-        self.assertIn('Processed file', response.data['result'])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        job_url = reverse('file-process-job', args=[response.data['id']])
+        self.assertEqual(self.client.get(job_url).data['status'], 'queued')
 
     def test_conversation_summaries_caching(self):
         # This test checks that repeated calls return the same data (cache hit)
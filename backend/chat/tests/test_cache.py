@@ -0,0 +1,134 @@
+"""
+Tests for the two-tier cache and versioned response caching.
+"""
+
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from chat.models import Conversation
+from chat.tests import TEST_CACHES
+from chat.utils.cache import VersionedCacheMixin, get_cache_version
+from src.utils.cache import TwoTierCache, cache
+
+User = get_user_model()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VersionedCacheTests(APITestCase):
+    """Test cases for conversation summary caching."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='cache@example.com', password='testpass')
+        self.user2 = User.objects.create_user(email='cache2@example.com', password='testpass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('conversation-summaries')
+
+    def test_write_invalidates_cached_page(self):
+        Conversation.objects.create(title="First", summary="s", user=self.user)
+        self.assertEqual(self.client.get(self.url).data['count'], 1)
+        Conversation.objects.create(title="Second", summary="s", user=self.user)
+        self.assertEqual(self.client.get(self.url).data['count'], 2)
+
+    def test_user_filtered_page_only_depends_on_that_user(self):
+        conversation = Conversation.objects.create(title="Mine", summary="s", user=self.user)
+        response = self.client.get(self.url, {'user': self.user.id})
+        self.assertEqual(response.data['count'], 1)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'user': self.user.id})
+        Conversation.objects.create(title="Theirs", summary="s", user=self.user2)
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'user': self.user.id})
+
+        conversation.title = "Renamed"
+        conversation.save()
+        response = self.client.get(self.url, {'user': self.user.id})
+        self.assertEqual(response.data['results'][0]['title'], "Renamed")
+
+    def test_cache_is_keyed_per_requesting_user(self):
+        Conversation.objects.create(title="Shared", summary="s", user=self.user)
+        self.client.get(self.url)
+        other = APIClient()
+        other.force_authenticate(user=self.user2)
+        # Page query runs again for the other user; only the count is shared
+        with self.assertNumQueries(1):
+            other.get(self.url)
+
+    def test_queryset_update_and_delete_invalidate_cached_page(self):
+        Conversation.objects.create(title="Old", summary="s", user=self.user)
+        self.client.get(self.url)
+        Conversation.objects.filter(user=self.user).update(title="New")
+        self.assertEqual(self.client.get(self.url).data['results'][0]['title'], "New")
+        Conversation.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(self.url).data['count'], 0)
+
+    def test_default_scope_is_requesting_user(self):
+        view = VersionedCacheMixin()
+        view.request = type('Request', (), {'user': self.user})()
+        self.assertEqual(view.get_cache_scopes(), [self.user.pk])
+        self.assertEqual(view.get_cache_versions(), [get_cache_version(self.user.pk)])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+    """Test cases for the two-tier cache layer."""
+
+    def setUp(self):
+        self.cache = TwoTierCache(local_max_entries=2, local_timeout=60, jitter=0)
+        self.cache.clear()
+
+    def test_local_tier_serves_repeated_reads(self):
+        self.cache.set("a", 1, 60)
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("missing"))
+        stats = self.cache.stats()
+        self.assertEqual((stats["shared_hits"], stats["local_hits"], stats["misses"]), (1, 1, 1))
+
+    def test_lru_eviction_is_bounded_and_counted(self):
+        for key in "abc":
+            self.cache.set(key, key, 60)
+        self.assertEqual(len(self.cache.local), 2)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        # Evicted from the LRU, still served by the shared tier
+        self.assertEqual(self.cache.get("a"), "a")
+
+    def test_cached_none_is_not_recomputed(self):
+        calls = []
+        for _ in range(2):
+            self.cache.get_or_compute("none", lambda: calls.append(1), 60)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_runs_once_for_concurrent_callers(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_compute("stampede", compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def test_ttl_jitter_stays_in_bounds(self):
+        jittered = TwoTierCache(jitter=0.2)
+        timeouts = {jittered._jittered(100) for _ in range(200)}
+        self.assertTrue(all(80 <= timeout <= 120 for timeout in timeouts))
+        self.assertGreater(len(timeouts), 1)
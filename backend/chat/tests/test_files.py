@@ -0,0 +1,672 @@
+"""
+Tests for file upload storage and handling.
+"""
+
+import errno
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from chat.models import FileBlob, FileEventLog, FileRemoval, FileUpload, UploadSession
+from chat.tests import TEST_CACHES
+from chat.utils.audit import AuditLogWriter, audit_log
+from chat.utils.blobs import acquire_blobs
+from chat.utils.deletion import reap_deleted_uploads
+from chat.utils.scrub import scrub_media
+from chat.utils.uploads import hash_uploaded_files, running_hashes
+from src.utils.cache import cache
+
+User = get_user_model()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FileStorageTestCase(APITestCase):
+    """Base test case uploading into a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, RAG_INDEX_DIR=os.path.join(self.media_root, '.rag_index')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user(email='files@example.com', password='testpass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, name, content, client=None):
+        return (client or self.client).post(
+            reverse('file-upload'), {'file': SimpleUploadedFile(name, content)}, format='multipart'
+        )
+
+    def staged_files(self):
+        staging = os.path.join(self.media_root, 'uploads', '.incoming')
+        return os.listdir(staging) if os.path.isdir(staging) else []
+
+
+class HashingUploadHandlerTests(FileStorageTestCase):
+    """Test cases for the single-pass hashing upload handler."""
+
+    def test_upload_is_hashed_while_streaming(self):
+        content = os.urandom(700 * 1024)
+        response = self.upload('big.bin', content)
+        self.assertEqual(response.status_code, 201)
+        upload = FileUpload.objects.get(id=response.data['id'])
+        self.assertEqual(upload.hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload.size, len(content))
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertEqual(self.staged_files(), [])
+
+    def test_rejected_duplicate_leaves_no_staged_file(self):
+        self.upload('a.txt', b'same bytes')
+        response = self.upload('b.txt', b'same bytes')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.staged_files(), [])
+
+
+class BlobStoreTests(FileStorageTestCase):
+    """Test cases for content-addressed storage shared between uploads."""
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(email='other@example.com', password='testpass')
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(user=self.other)
+
+    def test_identical_uploads_share_one_blob(self):
+        content = b'shared report'
+        first = self.upload('mine.txt', content)
+        second = self.upload('theirs.txt', content, client=self.other_client)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+
+        blob = FileBlob.objects.get(hash=hashlib.sha256(content).hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.uploads.count(), 2)
+        blob_dir = os.path.dirname(blob.file.path)
+        self.assertEqual(os.listdir(blob_dir), [blob.hash])
+        self.assertEqual(FileUpload.objects.get(id=second.data['id']).file.name, blob.file.name)
+
+    def test_last_delete_removes_blob(self):
+        first = self.upload('mine.txt', b'short lived')
+        second = self.upload('theirs.txt', b'short lived', client=self.other_client)
+        blob = FileBlob.objects.get()
+        path = blob.file.path
+
+        response = self.client.delete(reverse('file-delete', args=[first.data['id']]))
+        self.assertEqual(response.status_code, 204)
+        reap_deleted_uploads()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        self.other_client.delete(reverse('file-delete', args=[second.data['id']]))
+        reap_deleted_uploads()
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_concurrent_duplicate_upload_is_rejected(self):
+        raced = []
+
+        def racing_revive(user, file_hash, name):
+            # Another request of this user uploads the same content after the duplicate check
+            if not raced:
+                raced.append(name)
+                self.upload('racer.txt', b'raced')
+            return None
+
+        with mock.patch('chat.views.revive_upload', side_effect=racing_revive):
+            response = self.upload('mine.txt', b'raced')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(FileUpload.objects.values_list('name', flat=True)), ['racer.txt'])
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+
+    def test_rolled_back_upload_leaves_no_blob_file(self):
+        with mock.patch('chat.views.FileUploadSerializer.save', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.upload('doomed.txt', b'never committed')
+        self.assertFalse(FileBlob.objects.exists())
+        blob_root = os.path.join(self.media_root, 'blobs')
+        self.assertEqual([files for _, _, files in os.walk(blob_root) if files], [])
+
+
+class ResumableUploadTests(FileStorageTestCase):
+    """Test cases for the chunked upload session API."""
+
+    chunk_size = 256 * 1024
+
+    def setUp(self):
+        super().setUp()
+        self.content = os.urandom(2 * self.chunk_size + 1000)
+
+    def start(self, **extra):
+        response = self.client.post(
+            reverse('upload-session-create'),
+            {'name': 'big.bin', 'size': len(self.content), 'chunk_size': self.chunk_size, **extra},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, data=None, **headers):
+        start = index * self.chunk_size
+        data = self.content[start:start + self.chunk_size] if data is None else data
+        return self.client.put(
+            reverse('upload-session', args=[session_id]),
+            data,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{len(self.content)}',
+            **headers,
+        )
+
+    def complete(self, session_id):
+        return self.client.post(reverse('upload-session-complete', args=[session_id]))
+
+    def test_out_of_order_chunks_assemble_the_file(self):
+        session_id = self.start()
+        self.assertEqual(self.put_chunk(session_id, 2).status_code, 200)
+        response = self.put_chunk(session_id, 0)
+        self.assertEqual(response.data['received_chunks'], [0, 2])
+        self.assertEqual(response.data['missing_chunks'], [1])
+
+        self.assertEqual(self.complete(session_id).status_code, 409)
+        self.put_chunk(session_id, 1)
+        response = self.complete(session_id)
+
+        self.assertEqual(response.status_code, 201)
+        upload = FileUpload.objects.get(id=response.data['id'])
+        self.assertEqual(upload.hash, hashlib.sha256(self.content).hexdigest())
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', '.sessions')), [])
+
+    def test_resent_chunk_replaces_earlier_bytes(self):
+        session_id = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        self.put_chunk(session_id, 0, data=os.urandom(self.chunk_size))
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['hash'], hashlib.sha256(self.content).hexdigest())
+
+    def test_chunk_rewritten_by_another_process_is_not_trusted(self):
+        session_id = self.start()
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        # Another worker rewrites chunk 0; this process still holds the running hash of the old bytes
+        hasher, position, digests = running_hashes.pop(session_id)
+        self.put_chunk(session_id, 0, data=os.urandom(self.chunk_size))
+        running_hashes.pop(session_id)
+        running_hashes._states[session_id] = (hasher, position, digests, None)
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+        upload = FileUpload.objects.get(id=response.data['id'])
+        with upload.file.open('rb') as stored:
+            self.assertEqual(upload.hash, hashlib.sha256(stored.read()).hexdigest())
+        self.assertNotEqual(upload.hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_session_size_and_open_sessions_are_limited(self):
+        with override_settings(FILE_UPLOAD_MAX_SIZE=len(self.content) - 1):
+            response = self.client.post(
+                reverse('upload-session-create'), {'name': 'big.bin', 'size': len(self.content)}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.data)
+
+        with override_settings(FILE_UPLOAD_MAX_OPEN_SESSIONS=1):
+            self.start()
+            response = self.client.post(
+                reverse('upload-session-create'), {'name': 'more.bin', 'size': 10}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        with override_settings(FILE_UPLOAD_MAX_OPEN_SESSION_BYTES=len(self.content) + 5):
+            response = self.client.post(
+                reverse('upload-session-create'), {'name': 'more.bin', 'size': 10}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+    def test_full_disk_returns_507(self):
+        with mock.patch('chat.views.preallocate', side_effect=OSError(errno.ENOSPC, 'No space left on device')):
+            response = self.client.post(
+                reverse('upload-session-create'), {'name': 'big.bin', 'size': len(self.content)}, format='json'
+            )
+        self.assertEqual(response.status_code, 507)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_chunk_failing_its_digest_is_rejected(self):
+        session_id = self.start()
+        response = self.put_chunk(session_id, 0, HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        status = self.client.get(reverse('upload-session', args=[session_id]))
+        self.assertEqual(status.data['received_chunks'], [])
+
+    def test_misaligned_offset_is_rejected(self):
+        session_id = self.start()
+        response = self.client.put(
+            reverse('upload-session', args=[session_id]) + '?offset=10', b'x', content_type='application/octet-stream'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_cleanup_removes_abandoned_sessions(self):
+        session_id = self.start()
+        self.put_chunk(session_id, 0)
+        UploadSession.objects.filter(id=session_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('cleanup_upload_sessions', stdout=io.StringIO())
+
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', '.sessions')), [])
+
+
+class DedupeProbeTests(FileStorageTestCase):
+    """Test cases for the pre-upload dedupe probe."""
+
+    def setUp(self):
+        super().setUp()
+        self.content = b'quarterly numbers'
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        self.other = User.objects.create_user(email='other@example.com', password='testpass')
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(user=self.other)
+
+    def probe(self, client=None, **data):
+        payload = {'hash': self.digest, 'size': len(self.content), 'name': 'numbers.txt', **data}
+        return (client or self.client).post(reverse('file-probe'), payload, format='json')
+
+    def prove(self, content=None, **data):
+        """Probe, then answer the possession challenge with the bytes of ``content``."""
+        content = self.content if content is None else content
+        challenge = self.probe(**data).data['challenge']
+        proof = hashlib.sha256(content[challenge['offset']:challenge['offset'] + challenge['length']]).hexdigest()
+        return self.probe(challenge=challenge['token'], proof=proof, **data)
+
+    def test_unknown_content_must_be_uploaded(self):
+        response = self.probe()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['exists'])
+        self.assertNotIn('challenge', response.data)
+        self.assertFalse(FileUpload.objects.exists())
+
+    def test_user_scope_hides_other_users_content(self):
+        self.upload('theirs.txt', self.content, client=self.other_client)
+        self.assertFalse(self.probe().data['exists'])
+        self.upload('mine.txt', self.content)
+        self.assertTrue(self.probe().data['exists'])
+
+    @override_settings(FILE_DEDUPE_PROBE_SCOPE='global')
+    def test_known_content_is_linked_with_proof_of_possession(self):
+        self.upload('theirs.txt', self.content, client=self.other_client)
+
+        response = self.prove()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['created'])
+        upload = FileUpload.objects.get(id=response.data['file']['id'])
+        self.assertEqual((upload.uploader, upload.name), (self.user, 'numbers.txt'))
+        self.assertEqual(FileBlob.objects.get().ref_count, 2)
+        self.assertTrue(upload.logs.filter(event_type='upload', user=self.user).exists())
+
+        again = self.probe()
+        self.assertEqual(again.status_code, 200)
+        self.assertFalse(again.data['created'])
+        self.assertEqual(FileUpload.objects.filter(uploader=self.user).count(), 1)
+
+    @override_settings(FILE_DEDUPE_PROBE_SCOPE='global', FILE_DEDUPE_PROOF_BYTES=4)
+    def test_digest_alone_does_not_link_content(self):
+        self.upload('theirs.txt', self.content, client=self.other_client)
+        # The challenge does not reveal whether the content is stored
+        first = self.probe()
+        self.assertFalse(first.data['exists'])
+        self.assertEqual(first.data['challenge']['length'], 4)
+
+        wrong = self.probe(challenge=first.data['challenge']['token'], proof=self.digest)
+        self.assertFalse(wrong.data['exists'])
+        forged = self.probe(challenge='forged:token', proof=self.digest)
+        self.assertFalse(forged.data['exists'])
+        challenge = first.data['challenge']
+        proof = hashlib.sha256(self.content[challenge['offset']:challenge['offset'] + 4]).hexdigest()
+        third = APIClient()
+        third.force_authenticate(user=User.objects.create_user(email='third@example.com', password='testpass'))
+        self.assertFalse(self.probe(client=third, challenge=challenge['token'], proof=proof).data['exists'])
+        self.assertEqual(FileUpload.objects.count(), 1)
+
+    @override_settings(FILE_DEDUPE_PROBE_SCOPE='global')
+    def test_size_mismatch_is_not_linked(self):
+        self.upload('theirs.txt', self.content, client=self.other_client)
+        response = self.prove(content=self.content + b'!', size=len(self.content) + 1)
+        self.assertFalse(response.data['exists'])
+
+
+class AuditLogTests(FileStorageTestCase):
+    """Test cases for buffered file event logging."""
+
+    def setUp(self):
+        super().setUp()
+        audit_log.flush()
+        for i in range(15):
+            self.upload(f'f{i}.txt', f'file {i}'.encode())
+
+    def test_list_logs_access_for_returned_page_only(self):
+        with self.assertNumQueries(6):
+            # Page rows, count, live file check and one batched insert of the access events in a savepoint
+            response = self.client.get(reverse('file-list'), {'page_size': 5})
+        returned = {file['id'] for file in response.data['results']}
+        logged = set(FileEventLog.objects.filter(event_type='access').values_list('file_id', flat=True))
+        self.assertEqual(logged, returned)
+        self.assertEqual(audit_log.pending(), 0)
+
+    def test_events_for_deleted_files_keep_the_event(self):
+        file = FileUpload.objects.first()
+        writer = AuditLogWriter(max_batch=100)
+        writer.log('access', file.id, self.user.id)
+        writer.log('access', file.id, self.user.id)
+        FileUpload.objects.filter(id=file.id).delete()
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(FileEventLog.objects.filter(event_type='access', file__isnull=True).count(), 2)
+
+    def test_full_buffer_flushes_immediately(self):
+        writer = AuditLogWriter(max_batch=3)
+        file_id = FileUpload.objects.values_list('id', flat=True).first()
+        writer.log('access', file_id, self.user.id)
+        writer.log('access', file_id, self.user.id)
+        self.assertEqual(writer.pending(), 2)
+        writer.log('access', file_id, self.user.id)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(FileEventLog.objects.filter(event_type='access').count(), 3)
+
+
+class FileDownloadTests(FileStorageTestCase):
+    """Test cases for the range-capable download endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.content = os.urandom(100 * 1024)
+        self.file_id = self.upload('data.bin', self.content).data['id']
+        self.url = reverse('file-download', args=[self.file_id])
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()}"'
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.body(response), self.content)
+        self.assertTrue(FileEventLog.objects.filter(event_type='access', file_id=self.file_id).exists())
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(self.body(response), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(response), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_conditional_requests(self):
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag).status_code, 304)
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.body(stale), self.content)
+
+    def test_other_users_cannot_download(self):
+        other = User.objects.create_user(email='other@example.com', password='testpass')
+        client = APIClient()
+        client.force_authenticate(user=other)
+        self.assertEqual(client.get(self.url).status_code, 404)
+
+    @override_settings(FILE_DOWNLOAD_OFFLOAD='x-accel-redirect')
+    def test_offload_to_web_server(self):
+        response = self.client.get(self.url)
+        upload = FileUpload.objects.get(id=self.file_id)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{upload.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class BulkDeleteTests(FileStorageTestCase):
+    """Test cases for batch soft deletion and the storage reaper."""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.upload(f'f{i}.txt', f'file {i}'.encode()).data['id'] for i in range(4)]
+
+    def bulk_delete(self, ids):
+        return self.client.post(reverse('file-bulk-delete'), {'ids': ids}, format='json')
+
+    def test_bulk_delete_marks_rows_and_logs_events(self):
+        with self.assertNumQueries(5):
+            # Locking select, one UPDATE and one bulk INSERT of the events, in a savepoint
+            response = self.bulk_delete(self.ids[:3] + [999999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'deleted': sorted(self.ids[:3]), 'not_found': [999999]})
+        self.assertEqual(FileEventLog.objects.filter(event_type='delete').count(), 3)
+
+        listed = self.client.get(reverse('file-list')).data['results']
+        self.assertEqual([file['id'] for file in listed], [self.ids[3]])
+        self.assertEqual(self.client.get(reverse('file-download', args=[self.ids[0]])).status_code, 404)
+
+    def test_reaper_reclaims_storage_after_grace(self):
+        paths = [FileUpload.objects.get(id=file_id).file.path for file_id in self.ids[:2]]
+        self.bulk_delete(self.ids[:2])
+
+        self.assertEqual(reap_deleted_uploads(grace_seconds=3600), (0, 0))
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        self.assertEqual(reap_deleted_uploads(), (2, 2))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertEqual(FileUpload.objects.count(), 2)
+        self.assertFalse(FileRemoval.objects.exists())
+
+    def test_reupload_before_reaping_revives_the_file(self):
+        self.bulk_delete(self.ids[:1])
+        response = self.upload('again.txt', b'file 0')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], self.ids[0])
+        self.assertEqual(response.data['name'], 'again.txt')
+        self.assertEqual(reap_deleted_uploads(), (0, 0))
+
+    def test_single_delete_is_soft_and_can_be_revived(self):
+        response = self.client.delete(reverse('file-delete', args=[self.ids[0]]))
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNotNone(FileUpload.objects.get(id=self.ids[0]).deleted_at)
+        self.assertEqual(FileEventLog.objects.filter(event_type='delete', file_id=self.ids[0]).count(), 1)
+        self.assertEqual(self.client.delete(reverse('file-delete', args=[self.ids[0]])).status_code, 404)
+
+        self.assertEqual(self.upload('again.txt', b'file 0').data['id'], self.ids[0])
+        self.client.delete(reverse('file-delete', args=[self.ids[1]]))
+        self.assertEqual(reap_deleted_uploads(), (1, 1))
+
+    def test_removals_survive_a_crash_before_unlink(self):
+        upload = FileUpload.objects.get(id=self.ids[0])
+        path = upload.file.path
+        FileUpload.objects.filter(id=upload.id).delete()
+        # The process died before unlinking: the queued removal is still there
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(FileRemoval.objects.count(), 1)
+
+        call_command('reap_deleted_files', stdout=io.StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(FileRemoval.objects.exists())
+
+
+class ScrubMediaTests(FileStorageTestCase):
+    """Test cases for the media integrity scrub."""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.upload(f'f{i}.txt', os.urandom(2048)).data['id'] for i in range(3)]
+        self.paths = [FileUpload.objects.get(id=file_id).file.path for file_id in self.ids]
+
+    def orphan(self, name, age_hours):
+        path = os.path.join(self.media_root, 'blobs', 'zz', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'orphan')
+        stamp = time.time() - age_hours * 3600
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_consistent_store(self):
+        report = scrub_media(workers=2)
+        self.assertEqual(report.files, 3)
+        self.assertEqual(report.bytes, 3 * 2048)
+        self.assertEqual((report.mismatched, report.missing, report.orphans), ([], [], []))
+
+    def test_reports_damage_and_collects_old_orphans(self):
+        with open(self.paths[0], 'r+b') as file:
+            file.write(b'bitrot')
+        os.remove(self.paths[1])
+        old = self.orphan('old', age_hours=48)
+        young = self.orphan('young', age_hours=1)
+
+        report = scrub_media(workers=2, rate_limit=10 * 2**20)
+
+        self.assertEqual([name for name, _, _ in report.mismatched], [FileUpload.objects.get(id=self.ids[0]).file.name])
+        self.assertEqual(report.missing, [FileUpload.objects.get(id=self.ids[1]).file.name])
+        self.assertEqual(report.orphans, ['blobs/zz/old'])
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(young))
+
+    def test_command_fails_on_damage(self):
+        os.remove(self.paths[2])
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('scrub_media', '--dry-run', stdout=out)
+        self.assertIn('MISSING', out.getvalue())
+        self.assertIn('MB/s', out.getvalue())
+
+
+class BatchUploadTests(FileStorageTestCase):
+    """Test cases for multi-file uploads."""
+
+    def batch(self, contents):
+        files = [SimpleUploadedFile(name, content) for name, content in contents]
+        return self.client.post(reverse('file-batch-upload'), {'files': files}, format='multipart')
+
+    def test_batch_creates_files_with_constant_queries(self):
+        self.upload('known.txt', b'already here')
+        contents = [(f'doc{i}.txt', f'document {i}'.encode()) for i in range(20)]
+        contents += [('copy.txt', b'document 0'), ('known-again.txt', b'already here')]
+
+        with self.assertNumQueries(14):
+            # One dedupe query, one blob lookup and one bulk insert each for blobs, uploads, events and
+            # text extraction jobs, plus savepoints: the count does not depend on the number of files
+            response = self.batch(contents)
+
+        self.assertEqual(response.status_code, 201)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['created'] * 20 + ['duplicate', 'duplicate'])
+        self.assertEqual(results[20]['file']['id'], results[0]['file']['id'])
+        self.assertEqual(FileUpload.objects.filter(uploader=self.user).count(), 21)
+        self.assertEqual(FileEventLog.objects.filter(event_type='upload').count(), 21)
+        upload = FileUpload.objects.get(id=results[7]['file']['id'])
+        self.assertEqual(upload.hash, hashlib.sha256(b'document 7').hexdigest())
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'document 7')
+        self.assertEqual(self.staged_files(), [])
+
+    def test_batch_shares_blobs_and_revives_deleted_files(self):
+        other = User.objects.create_user(email='other@example.com', password='testpass')
+        other_client = APIClient()
+        other_client.force_authenticate(user=other)
+        self.upload('shared.txt', b'shared', client=other_client)
+        deleted_id = self.upload('old.txt', b'deleted').data['id']
+        self.client.post(reverse('file-bulk-delete'), {'ids': [deleted_id]}, format='json')
+
+        response = self.batch([('shared.txt', b'shared'), ('back.txt', b'deleted')])
+
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'revived'])
+        self.assertEqual(FileBlob.objects.get(hash=hashlib.sha256(b'shared').hexdigest()).ref_count, 2)
+        self.assertEqual(response.data['results'][1]['file']['id'], deleted_id)
+        self.assertEqual(response.data['results'][1]['file']['name'], 'back.txt')
+
+    def test_concurrent_upload_of_same_content_is_a_duplicate(self):
+        def racing_acquire_blobs(contents):
+            # Another request of this user commits the same content after the dedupe lookup
+            self.upload('racer.txt', b'raced')
+            return acquire_blobs(contents)
+
+        with mock.patch('chat.views.acquire_blobs', side_effect=racing_acquire_blobs):
+            response = self.batch([('mine.txt', b'raced'), ('other.txt', b'not raced')])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['status'] for r in response.data['results']], ['duplicate', 'created'])
+        self.assertEqual(response.data['results'][0]['file']['name'], 'racer.txt')
+        self.assertEqual(FileUpload.objects.filter(uploader=self.user).count(), 2)
+        self.assertEqual(FileBlob.objects.get(hash=hashlib.sha256(b'raced').hexdigest()).ref_count, 1)
+
+    def test_files_without_streamed_digest_are_hashed_in_pool(self):
+        files = [SimpleUploadedFile(f'{i}.txt', f'pool {i}'.encode()) for i in range(5)]
+        self.assertEqual(
+            hash_uploaded_files(files, workers=3), [hashlib.sha256(f'pool {i}'.encode()).hexdigest() for i in range(5)]
+        )
+
+
+class ZipExportTests(FileStorageTestCase):
+    """Test cases for the streaming ZIP export."""
+
+    def setUp(self):
+        super().setUp()
+        self.text = b'plain text ' * 5000
+        self.image = os.urandom(300 * 1024)
+        self.text_id = self.upload('notes.txt', self.text).data['id']
+        self.image_id = self.upload('photo.jpg', self.image).data['id']
+
+    def export(self, **params):
+        response = self.client.get(reverse('file-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        return chunks, zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+    def test_export_all_files(self):
+        chunks, archive = self.export()
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('notes.txt'), self.text)
+        self.assertEqual(archive.read('photo.jpg'), self.image)
+        self.assertEqual(archive.getinfo('notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('photo.jpg').compress_type, zipfile.ZIP_STORED)
+        # Streamed in pieces, never as one buffer of the whole archive
+        self.assertLess(max(len(chunk) for chunk in chunks), 300 * 1024)
+        self.assertEqual(FileEventLog.objects.filter(event_type='access', extra='export').count(), 2)
+
+    def test_export_selected_files(self):
+        _, archive = self.export(ids=str(self.text_id))
+        self.assertEqual(archive.namelist(), ['notes.txt'])
+
+    def test_duplicate_names_are_numbered(self):
+        self.upload('notes.txt', b'other notes')
+        _, archive = self.export()
+        self.assertEqual(sorted(archive.namelist()), ['notes (2).txt', 'notes.txt', 'photo.jpg'])
+
+    def test_nothing_to_export(self):
+        response = self.client.get(reverse('file-export'), {'ids': '999999'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,27 @@
+"""
+Tests for the index advisor.
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from chat.tests import TEST_CACHES
+from chat.utils.indexes import HOT_QUERIES, explain, find_plan_issues, sample_context
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IndexAdvisorTests(TestCase):
+    """Test cases for hot-path index coverage."""
+
+    def test_hot_queries_use_indexes(self):
+        context = sample_context()
+        for hot_query in HOT_QUERIES:
+            with self.subTest(hot_query.name):
+                self.assertEqual(find_plan_issues(explain(hot_query.build(context))), [])
+
+    def test_command_reports_ok(self):
+        out = StringIO()
+        call_command('advise_indexes', '--runs', '1', stdout=out)
+        self.assertNotIn('NEEDS INDEX', out.getvalue())
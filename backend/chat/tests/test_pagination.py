@@ -0,0 +1,78 @@
+"""
+Tests for count-free pagination.
+"""
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from src.utils.cache import cache
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from chat.models import Conversation
+from chat.pagination import CountFreePagination
+from chat.tests import TEST_CACHES
+
+User = get_user_model()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CountFreePaginationTests(APITestCase):
+    """Test cases for CountFreePagination."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='pages@example.com', password='testpass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('conversation-summaries')
+        Conversation.objects.bulk_create(
+            [Conversation(title=f"Conv {i}", summary="s", user=self.user) for i in range(7)]
+        )
+
+    def test_response_shape_and_links(self):
+        response = self.client.get(self.url, {'page_size': 3, 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'count', 'next', 'previous', 'results'})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIn('page=3', response.data['next'])
+        self.assertNotIn('page=', response.data['previous'])
+
+    def test_last_page_count_needs_no_count_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 3, 'page': 3})
+        self.assertEqual(response.data['count'], 7)
+        self.assertIsNone(response.data['next'])
+
+    def test_count_is_cached_between_pages(self):
+        self.client.get(self.url, {'page_size': 3, 'page': 1})
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 3, 'page': 2})
+        self.assertEqual(response.data['count'], 7)
+
+    def test_count_mode_none(self):
+        paginator = CountFreePagination()
+        paginator.count_mode = 'none'
+        request = Request(APIRequestFactory().get('/', {'page_size': 3}))
+        with self.assertNumQueries(1):
+            rows = paginator.paginate_queryset(Conversation.objects.order_by('title'), request)
+        response = paginator.get_paginated_response([row.title for row in rows])
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(response.data['results'], ["Conv 0", "Conv 1", "Conv 2"])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_stale_estimate_is_clamped_to_rows_seen(self):
+        paginator = CountFreePagination()
+        request = Request(APIRequestFactory().get('/', {'page_size': 3, 'page': 2}))
+        with mock.patch.object(CountFreePagination, 'get_count', return_value=2):
+            paginator.paginate_queryset(Conversation.objects.order_by('title'), request)
+        response = paginator.get_paginated_response([])
+        self.assertEqual(response.data['count'], 7)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_out_of_range_page(self):
+        self.assertEqual(self.client.get(self.url, {'page': 5}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'page': 'abc'}).status_code, 404)
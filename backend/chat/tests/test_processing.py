@@ -0,0 +1,307 @@
+"""
+Tests for text extraction, chunking and the background processing queue.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chat.models import FileProcessingJob, FileUpload, TextChunk
+from chat.tests.test_files import FileStorageTestCase
+from chat.utils import extraction
+from chat.utils.chunking import Chunk, chunk_blocks, chunk_file, count_tokens, normalize_text
+from chat.utils.deletion import reap_deleted_uploads
+from chat.utils.extraction import Block, DocumentTooLarge, UnsupportedFileType, read_blocks
+from chat.utils.processing import claim_jobs, finish_job, process_jobs
+
+
+class ExtractionTests(SimpleTestCase):
+    """Test cases for the streaming readers and normalization."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(content.encode() if isinstance(content, str) else content)
+        return path
+
+    def extract(self, name, content, max_tokens=2000):
+        return [chunk.text for chunk in chunk_file(self.write(name, content), name, max_tokens)]
+
+    def test_text_paragraphs_are_normalized(self):
+        chunks = self.extract('a.txt', '\ufeffFirst   line\r\nsame\tparagraph\n\n\nＡ second\x00 one\n')
+        self.assertEqual(chunks, ['First line\nsame paragraph\n\nA second one'])
+
+    def test_markdown_syntax_is_stripped(self):
+        chunks = self.extract(
+            'a.md', '# Title\n\nSome **bold** and [a link](http://x) in `code`, my_var stays.\n\n- item\n'
+        )
+        self.assertEqual(chunks, ['Title\n\nSome bold and a link in code, my_var stays.\n\nitem'])
+
+    def test_csv_rows_are_labelled(self):
+        chunks = self.extract('a.csv', 'name,city\nAda,London\n"Smith, J",\n')
+        self.assertEqual(chunks, ['name: Ada; city: London\n\nname: Smith, J'])
+
+    def test_html_skips_scripts_and_breaks_blocks(self):
+        html = (
+            '<html><head><title>T</title><script>var x = 1;</script></head>'
+            '<body><p>One &amp; two</p><div>Three</div></body></html>'
+        )
+        self.assertEqual(self.extract('a.html', html), ['T\n\nOne & two\n\nThree'])
+
+    def test_json_array_is_streamed_per_element(self):
+        records = [{'id': i, 'tags': ['a', 'b'], 'meta': {'note': 'x' * 50}} for i in range(3000)]
+        with mock.patch.object(extraction, 'READ_SIZE', 1024):
+            chunks = self.extract('a.json', json.dumps(records))
+        text = '\n\n'.join(chunks)
+        self.assertEqual(text.count('meta.note: '), 3000)
+        self.assertIn('id: 2999\ntags: a\ntags: b', text)
+
+    def test_json_object_and_lines(self):
+        self.assertEqual(self.extract('a.json', '{"a": {"b": 1}, "c": null}'), ['a.b: 1'])
+        self.assertEqual(self.extract('a.jsonl', '{"a": 1}\n\n{"a": 2}\n'), ['a: 1\n\na: 2'])
+
+    def test_record_offsets(self):
+        content = '[{"a": 1},\n {"a": "é"}, 3]'
+        path = self.write('a.json', '\ufeff' + content)
+        raw = open(path, 'rb').read()
+        ranges = [raw[block.start:block.end] for block in read_blocks(path, 'a.json')]
+        self.assertEqual(ranges, [b'{"a": 1}', '{"a": "é"}'.encode(), b'3'])
+
+        path = self.write('a.csv', 'h\nfirst\n"multi\nline"\n')
+        raw = open(path, 'rb').read()
+        ranges = [raw[block.start:block.end] for block in read_blocks(path, 'a.csv')]
+        self.assertEqual(ranges, [b'first\n', b'"multi\nline"\n'])
+
+    def test_records_longer_than_a_read_are_parsed_whole(self):
+        value = 'é' * extraction.READ_SIZE
+        record = json.dumps({'long': value}, ensure_ascii=False) + '\n'
+        path = self.write('a.jsonl', '{"a": 1}\n' + record)
+        raw = open(path, 'rb').read()
+        blocks = list(read_blocks(path, 'a.jsonl'))
+        self.assertEqual([block.text for block in blocks], ['a: 1', f'long: {value}'])
+        self.assertEqual(raw[blocks[1].start:blocks[1].end].decode(), record)
+
+        path = self.write('a.csv', f'name,note\nAda,{value}\nBob,short\n')
+        blocks = list(read_blocks(path, 'a.csv'))
+        self.assertEqual([block.text for block in blocks], [f'name: Ada; note: {value}', 'name: Bob; note: short'])
+
+    def test_large_json_document_is_refused(self):
+        path = self.write('a.json', '{"a": "xxxx"}')
+        with mock.patch.object(extraction, 'MAX_JSON_DOCUMENT_BYTES', 8):
+            with self.assertRaises(DocumentTooLarge):
+                list(read_blocks(path, 'a.json'))
+            # Arrays are streamed, whatever their size
+            path = self.write('b.json', '["xxxx", "yyyy"]')
+            self.assertEqual([block.text for block in read_blocks(path, 'b.json')], ['xxxx', 'yyyy'])
+
+    def test_unsupported_type(self):
+        with self.assertRaises(UnsupportedFileType):
+            self.extract('a.bin', b'\x00\x01')
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('  ﬁne\u200b  print \n\n\t \n end '), 'fine print\nend')
+
+
+class ChunkingTests(SimpleTestCase):
+    """Test cases for token-aware chunking with overlap and byte offsets."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_sentences_fill_the_budget_and_overlap(self):
+        text = ' '.join(f'Sentence number {i} is here.' for i in range(40))
+        chunks = list(chunk_blocks([Block(text, 0, len(text), verbatim=True)], max_tokens=50, overlap_tokens=10))
+        self.assertGreater(len(chunks), 4)
+        for chunk, following in zip(chunks, chunks[1:]):
+            self.assertLessEqual(chunk.tokens, 50)
+            self.assertEqual(chunk.tokens, count_tokens(chunk.text))
+            # The next chunk starts with the last whole sentence of this one
+            self.assertTrue(chunk.text.endswith(following.text.split('. ')[0] + '.'))
+            self.assertLess(following.start, chunk.end)
+        self.assertTrue(all(chunk.text.startswith('Sentence') for chunk in chunks))
+
+    def test_no_overlap_across_paragraphs(self):
+        blocks = [Block('One two three four five six.', 0, 28), Block('Seven eight.', 30, 42)]
+        chunks = list(chunk_blocks(blocks, max_tokens=8, overlap_tokens=7))
+        self.assertEqual([chunk.text for chunk in chunks], ['One two three four five six.', 'Seven eight.'])
+
+    def test_long_sentences_and_words_are_split(self):
+        text = 'word ' * 100 + 'x' * 50
+        chunks = list(chunk_blocks([Block(text, 0, len(text), verbatim=True)], max_tokens=20))
+        self.assertTrue(all(chunk.tokens <= 20 for chunk in chunks))
+        self.assertEqual(''.join(chunk.text for chunk in chunks).replace(' ', ''), 'word' * 100 + 'x' * 50)
+
+    def test_split_words_are_not_altered(self):
+        word = 'averyveryverylongword' * 8
+        chunks = list(chunk_blocks([Block(word, 0, len(word), verbatim=True)], max_tokens=12))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunk.text for chunk in chunks), word)
+
+        text = f'short {word} end'
+        for chunk in chunk_blocks([Block(text, 0, len(text), verbatim=True)], max_tokens=12):
+            self.assertEqual(text[chunk.start:chunk.end].strip(), chunk.text)
+
+    def test_byte_offsets_of_plain_text(self):
+        path = os.path.join(self.directory, 'a.txt')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\ufeffZażółć gęślą jaźń. Second sentence!\r\n\r\nNext paragraph — with dashes.\n')
+        raw = open(path, 'rb').read()
+        chunks = list(chunk_file(path, 'a.txt', max_tokens=10))
+        self.assertEqual(len(chunks), 3)
+        for chunk in chunks:
+            self.assertEqual(normalize_text(raw[chunk.start:chunk.end].decode()), chunk.text)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            list(chunk_blocks([], max_tokens=10, overlap_tokens=10))
+
+    def test_memory_is_bounded(self):
+        path = os.path.join(self.directory, 'big.log')
+        line = 'GET /api/files/ 200 in 12ms. User agent: test client, request id 0123456789abcdef.\n'
+        with open(path, 'w') as file:
+            for _ in range(8 * 2**20 // len(line)):
+                file.write(line)
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in chunk_file(path, 'big.log', max_tokens=256, overlap_tokens=32))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(count, 1000)
+        # An 8 MB file is chunked in well under a MB
+        self.assertLess(peak, 2**20)
+
+
+class ProcessingQueueTests(FileStorageTestCase):
+    """Test cases for job queueing, claiming and the status endpoints."""
+
+    def process(self, file_id):
+        return self.client.post(reverse('file-process', args=[file_id]))
+
+    def client_for(self, email):
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(email=email, password='testpass'))
+        return client
+
+    def test_process_and_poll(self):
+        file_id = self.upload('notes.md', b'# Notes\n\nHello *world*\n').data['id']
+        response = self.process(file_id)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+
+        report = process_jobs()
+        self.assertEqual((report.done, report.chunks), (1, 1))
+        poll = self.client.get(reverse('file-process-job', args=[job_id]))
+        self.assertEqual(poll.data['status'], 'done')
+        self.assertEqual(poll.data['chunk_count'], 1)
+        self.assertEqual(
+            list(TextChunk.objects.values_list('text', 'start_offset', 'end_offset', 'token_count')),
+            [('Notes\n\nHello world', 0, 23, 6)],
+        )
+
+        # Done already: nothing is queued again
+        response = self.process(file_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(process_jobs().jobs, 0)
+
+    def test_same_content_is_processed_once(self):
+        other = self.client_for('other@example.com')
+        first = self.upload('a.txt', b'shared content').data['id']
+        second = self.upload('b.txt', b'shared content', client=other).data['id']
+        job_id = self.process(first).data['id']
+        self.assertEqual(other.post(reverse('file-process', args=[second])).data['id'], job_id)
+        self.assertEqual(FileProcessingJob.objects.count(), 1)
+        self.assertEqual(process_jobs().done, 1)
+
+    def test_job_of_another_users_file_is_hidden(self):
+        job_id = self.process(self.upload('a.txt', b'private').data['id']).data['id']
+        other = self.client_for('other@example.com')
+        self.assertEqual(other.get(reverse('file-process-job', args=[job_id])).status_code, 404)
+        self.assertEqual(other.post(reverse('file-process', args=[9999])).status_code, 404)
+
+    def test_worker_pool(self):
+        for i in range(5):
+            self.process(self.upload(f'{i}.txt', f'file {i}'.encode()).data['id'])
+        report = process_jobs(workers=2)
+        self.assertEqual((report.done, report.chunks), (5, 5))
+        self.assertEqual(sorted(TextChunk.objects.values_list('text', flat=True)), [f'file {i}' for i in range(5)])
+
+    def test_unsupported_file_fails_without_retry(self):
+        job_id = self.process(self.upload('a.bin', b'\x00\x01').data['id']).data['id']
+        report = process_jobs()
+        self.assertEqual((report.failed, report.retried), (1, 0))
+        job = FileProcessingJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.attempts), (FileProcessingJob.FAILED, 1))
+        self.assertIn('.bin', job.error)
+
+    def test_tsv_upload_is_split_on_tabs(self):
+        # Stored blobs have no extension: the reader follows the uploaded name
+        self.process(self.upload('people.tsv', b'name\tcity\nSmith, J\tLondon\n').data['id'])
+        self.assertEqual(process_jobs().done, 1)
+        self.assertEqual(list(TextChunk.objects.values_list('text', flat=True)), ['name: Smith, J; city: London'])
+
+    def test_large_json_document_fails_without_retry(self):
+        job_id = self.process(self.upload('a.json', b'{"a": "xxxx"}').data['id']).data['id']
+        with mock.patch.object(extraction, 'MAX_JSON_DOCUMENT_BYTES', 8):
+            report = process_jobs()
+        self.assertEqual((report.failed, report.retried), (1, 0))
+        job = FileProcessingJob.objects.get(id=job_id)
+        self.assertEqual(job.status, FileProcessingJob.FAILED)
+        self.assertIn('limited to', job.error)
+
+    def test_jobs_can_be_limited_to_one_uploader(self):
+        # Uploads are queued as they arrive
+        self.upload('mine.txt', b'mine')
+        self.upload('theirs.txt', b'theirs', client=self.client_for('other@example.com'))
+        report = process_jobs(uploader=self.user)
+        self.assertEqual((report.done, report.indexed), (1, 1))
+        self.assertEqual(FileProcessingJob.objects.get(name='theirs.txt').status, FileProcessingJob.QUEUED)
+
+    @override_settings(FILE_PROCESSING_MAX_ATTEMPTS=2)
+    def test_errors_are_retried_then_failed(self):
+        job_id = self.process(self.upload('a.txt', b'text').data['id']).data['id']
+        with mock.patch('chat.utils.processing.spool_chunks', side_effect=OSError('disk')):
+            report = process_jobs()
+        self.assertEqual((report.retried, report.failed), (1, 1))
+        job = FileProcessingJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.attempts, job.error), (FileProcessingJob.FAILED, 2, 'OSError: disk'))
+
+        # Asking again queues a failed job afresh
+        self.assertEqual(self.process(FileUpload.objects.get().id).data['status'], 'queued')
+        self.assertEqual(process_jobs().done, 1)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.process(self.upload('a.txt', b'text').data['id'])
+        [job] = claim_jobs(10)
+        self.assertEqual(claim_jobs(10), [])
+        FileProcessingJob.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        [again] = claim_jobs(10)
+        self.assertEqual(again.attempts, 2)
+        # The first worker's late result is discarded
+        self.assertFalse(finish_job(job, [Chunk('late', 0, 4, 1)]))
+        self.assertTrue(finish_job(again, [Chunk('on time', 0, 4, 2)]))
+        self.assertEqual(list(TextChunk.objects.values_list('text', flat=True)), ['on time'])
+
+    def test_chunks_are_deleted_with_the_last_upload(self):
+        file_id = self.upload('a.txt', b'text').data['id']
+        self.process(file_id)
+        process_jobs()
+        self.client.delete(reverse('file-delete', args=[file_id]))
+        reap_deleted_uploads()
+        self.assertFalse(FileProcessingJob.objects.exists())
+        self.assertFalse(TextChunk.objects.exists())
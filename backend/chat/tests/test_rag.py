@@ -0,0 +1,598 @@
+"""
+Tests for the lexical retrieval index and the RAG query and answer endpoints.
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chat.models import FileProcessingJob, IndexedJob
+from chat.rag.answer import build_prompt, passage_budget
+from chat.rag.analysis import analyze
+from chat.rag.bm25 import BM25, Hit
+from chat.rag.dense import VectorIndex
+from chat.rag.embeddings import HashingEmbedder
+from chat.rag.fusion import reciprocal_rank_fusion
+from chat.rag.index import LexicalIndex, SegmentedIndex
+from chat.rag.ivf import assign
+from chat.rag.shards import ShardCache, get_shard, get_shards
+from chat.tests.test_files import FileStorageTestCase
+from chat.utils.chunking import count_tokens
+from chat.utils.deletion import reap_deleted_uploads
+from chat.utils.processing import process_jobs
+from src.libs import openai
+from src.utils.gpt import GPT_VERSIONS
+
+WORDS = 'apple banana cherry delta echo foxtrot golf hotel india juliet kilo lima mike'.split()
+
+
+class LexicalIndexTests(SimpleTestCase):
+    """Test cases for segments, BM25 scoring and MaxScore retrieval."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def index(self, **kwargs):
+        return LexicalIndex(self.directory, **kwargs)
+
+    def exhaustive(self, documents, query, k, allowed_jobs=None):
+        """Score every document the slow way."""
+        bm25 = BM25()
+        analyzed = [(chunk_id, job_id, Counter(analyze(text))) for chunk_id, job_id, text in documents]
+        lengths = [max(1, sum(terms.values())) for _, _, terms in analyzed]
+        avg_length = sum(lengths) / len(lengths)
+        scores = []
+        for (chunk_id, job_id, terms), length in zip(analyzed, lengths):
+            if allowed_jobs is not None and job_id not in allowed_jobs:
+                continue
+            score = 0.0
+            for term, count in Counter(analyze(query)).items():
+                df = sum(1 for _, _, other in analyzed if term in other)
+                tf = terms.get(term, 0)
+                if tf:
+                    norm = bm25.k1 * (1 - bm25.b + bm25.b * length / avg_length)
+                    score += count * bm25.idf(df, len(analyzed)) * tf * (bm25.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, -chunk_id))
+        return [-chunk_id for _, chunk_id in sorted(scores, reverse=True)[:k]]
+
+    def test_ranks_by_bm25(self):
+        index = self.index()
+        index.add([
+            (1, 1, 'The cat sat on the mat'),
+            (2, 1, 'Dogs and cats are pets; the cat is a cat'),
+            (3, 2, 'Nothing to see here'),
+        ])
+        hits = index.search('cat', 5)
+        self.assertEqual([hit.chunk_id for hit in hits], [2, 1])
+        self.assertGreater(hits[0].score, hits[1].score)
+        self.assertEqual(index.search('unknown words', 5), [])
+        self.assertEqual([hit.chunk_id for hit in index.search('cat', 5, allowed_jobs={2})], [])
+
+    def test_maxscore_matches_exhaustive_scoring(self):
+        rng = random.Random(7)
+        documents = [
+            (chunk_id, chunk_id % 5, ' '.join(rng.choices(WORDS[:rng.randint(3, len(WORDS))], k=rng.randint(1, 40))))
+            for chunk_id in range(1, 400)
+        ]
+        index = self.index(max_segments=100)
+        for start in range(0, len(documents), 50):
+            index.add(documents[start:start + 50])
+        self.assertEqual(len(index.segments), 8)
+        for query in ['apple', 'kilo lima mike', 'apple apple banana', 'golf hotel india juliet kilo']:
+            for k in (1, 10):
+                with self.subTest(query=query, k=k):
+                    self.assertEqual(
+                        [hit.chunk_id for hit in index.search(query, k)], self.exhaustive(documents, query, k)
+                    )
+                    self.assertEqual(
+                        [hit.chunk_id for hit in index.search(query, k, allowed_jobs={1, 3})],
+                        self.exhaustive(documents, query, k, allowed_jobs={1, 3}),
+                    )
+
+    def test_segments_are_merged_and_dead_jobs_dropped(self):
+        index = self.index(max_segments=3)
+        for job_id in range(1, 5):
+            index.add([(job_id * 10, job_id, f'report number {job_id}')], live_jobs={2, 3, 4})
+        # The fourth segment merged the two oldest, dropping the deleted job 1
+        self.assertEqual(len(index.segments), 3)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(sorted(hit.job_id for hit in index.search('report', 10)), [2, 3, 4])
+
+        index.compact(live_jobs={4})
+        self.assertEqual(len(index.segments), 1)
+        self.assertEqual([hit.chunk_id for hit in index.search('report', 10)], [40])
+        index.compact(live_jobs=set())
+        self.assertEqual((index.segments, index.search('report', 10)), ([], []))
+
+    def test_deleted_job_can_be_added_again(self):
+        index = self.index()
+        index.add([(1, 1, 'comet tail'), (2, 2, 'comet dust')])
+        index.delete_jobs([1])
+        index.add([(1, 1, 'comet tail')])
+        self.assertEqual(index.deleted_jobs, frozenset())
+        self.assertEqual(sorted(hit.chunk_id for hit in index.search('comet', 10)), [1, 2])
+        index.compact(live_jobs={1, 2})
+        self.assertEqual(sorted(hit.chunk_id for hit in index.search('comet', 10)), [1, 2])
+
+    def test_incomplete_index_class_cannot_be_created(self):
+        class NoMerge(SegmentedIndex):
+            open_segment = LexicalIndex.open_segment
+            new_builder = LexicalIndex.new_builder
+
+        with self.assertRaises(TypeError):
+            NoMerge(self.directory)
+
+    def test_other_processes_changes_are_picked_up(self):
+        reader, writer = self.index(), self.index()
+        self.assertEqual(reader.search('alpha', 5), [])
+        writer.add([(1, 1, 'alpha beta')])
+        self.assertEqual([hit.chunk_id for hit in reader.search('alpha', 5)], [1])
+        writer.rebuild([(2, 1, 'alpha gamma'), (3, 1, 'delta')], batch_size=1)
+        self.assertEqual([hit.chunk_id for hit in reader.search('alpha', 5)], [2])
+        self.assertEqual(reader.generation, writer.generation)
+        self.assertEqual(len(reader.segments), 2)
+
+
+class DenseIndexTests(SimpleTestCase):
+    """Test cases for the hashing embedder and the memory-mapped vector index."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.embedder = HashingEmbedder(dim=64)
+
+    def test_hashing_embedder(self):
+        vectors = self.embedder.embed(['Bananas are yellow', 'yellow banana', 'quantum physics', ''])
+        self.assertEqual((vectors.dtype, vectors.shape), (np.float32, (4, 64)))
+        np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1, rtol=1e-6)
+        self.assertFalse(vectors[3].any())
+        # Deterministic across instances (and processes: no salted hash)
+        np.testing.assert_array_equal(HashingEmbedder(dim=64).embed(['yellow banana'])[0], vectors[1])
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(3)
+        documents = [(chunk_id, chunk_id % 4, ' '.join(rng.choices(WORDS, k=8))) for chunk_id in range(1, 200)]
+        index = VectorIndex(self.directory, self.embedder, max_segments=100)
+        for start in range(0, len(documents), 60):
+            index.add(documents[start:start + 60])
+        self.assertIsInstance(index.segments[0].vectors, np.memmap)
+        matrix = self.embedder.embed([text for _, _, text in documents])
+        jobs = np.array([job_id for _, job_id, _ in documents])
+        query = 'apple kilo mike'
+        scores = matrix @ self.embedder.embed([query])[0]
+        expected = [documents[row][0] for row in np.argsort(-scores, kind='stable')[:5]]
+        filtered = np.where(np.isin(jobs, [1, 2]), scores, -np.inf)
+        expected_filtered = [documents[row][0] for row in np.argsort(-filtered, kind='stable')[:5]]
+        # Scored in blocks smaller than a segment
+        with mock.patch('chat.rag.dense.BLOCK_ROWS', 7):
+            hits = index.search(query, 5)
+            self.assertEqual([hit.chunk_id for hit in hits], expected)
+            self.assertAlmostEqual(hits[0].score, float(scores.max()), places=5)
+            self.assertEqual([hit.chunk_id for hit in index.search(query, 5, allowed_jobs={1, 2})], expected_filtered)
+        self.assertEqual(index.search('', 5), [])
+
+    def test_compaction_drops_dead_jobs(self):
+        index = VectorIndex(self.directory, self.embedder, max_segments=2)
+        for job_id in range(1, 4):
+            index.add([(job_id, job_id, f'report {job_id}'), (job_id + 10, job_id, 'appendix')], live_jobs={2, 3})
+        self.assertEqual(len(index.segments), 2)
+        self.assertEqual(sorted(hit.job_id for hit in index.search('report', 10)), [2, 3])
+        index.compact(live_jobs={3})
+        self.assertEqual(len(index.segments), 1)
+        self.assertEqual([hit.chunk_id for hit in index.search('appendix', 10)], [13])
+
+    def test_deleted_jobs_are_skipped_then_dropped(self):
+        for index in (VectorIndex(self.directory, self.embedder), LexicalIndex(tempfile.mkdtemp(dir=self.directory))):
+            index.add([(1, 1, 'report one'), (2, 2, 'report two')])
+            index.add([(3, 3, 'report three')])
+            index.delete_jobs([1, 3])
+            self.assertEqual(index.deleted_jobs, {1, 3})
+            self.assertEqual([hit.chunk_id for hit in index.search('report', 10)], [2])
+            self.assertEqual([hit.chunk_id for hit in index.search('report', 10, allowed_jobs={1, 2})], [2])
+            # Compacting drops their documents, and with them the record of the deletion
+            index.compact()
+            self.assertEqual((len(index), index.deleted_jobs), (1, frozenset()))
+            self.assertEqual([hit.chunk_id for hit in index.search('report', 10)], [2])
+
+
+class IVFTests(SimpleTestCase):
+    """Test cases for clustered dense segments and approximate search."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.embedder = HashingEmbedder(dim=32)
+        rng = random.Random(5)
+        self.documents = [
+            (chunk_id, chunk_id % 50, ' '.join(rng.choices(WORDS, k=4))) for chunk_id in range(1, 1001)
+        ]
+        self.index = VectorIndex(self.directory, self.embedder, ivf_min_rows=500, nprobe=2)
+        self.index.add(self.documents)
+        self.flat = VectorIndex(tempfile.mkdtemp(dir=self.directory), self.embedder)
+        self.flat.add(self.documents)
+
+    def test_large_segments_are_clustered(self):
+        [segment] = self.index.segments
+        self.assertEqual((len(segment.centroids), segment.offsets[-1]), (31, 1000))
+        self.assertIsInstance(segment.vectors, np.memmap)
+        # Rows are grouped by their closest centroid, and still line up with their chunks
+        labels = assign(segment.vectors, segment.centroids)
+        self.assertTrue(np.all(np.diff(labels) >= 0))
+        texts = dict((chunk_id, text) for chunk_id, _, text in self.documents)
+        np.testing.assert_allclose(
+            segment.vectors[:20], self.embedder.embed([texts[chunk_id] for chunk_id in segment.chunk_ids[:20]])
+        )
+        # Small segments stay flat
+        self.index.add([(2000, 1, 'apple')])
+        self.assertIsNone(self.index.segments[1].centroids)
+
+    def test_probing_every_list_is_exact(self):
+        for query in ['apple banana', 'kilo', 'golf hotel india']:
+            exact = [hit.chunk_id for hit in self.flat.search(query, 10)]
+            self.assertEqual([hit.chunk_id for hit in self.index.search(query, 10, nprobe=31)], exact)
+            approximate = {hit.chunk_id for hit in self.index.search(query, 10)}
+            self.assertGreaterEqual(len(approximate & set(exact)), 5)
+
+    def test_filtered_search_probes_until_enough_hits(self):
+        # A single list holds about one allowed row; more are probed to fill the results
+        hits = self.index.search('apple', 5, allowed_jobs={7}, nprobe=1)
+        self.assertEqual(len(hits), 5)
+        self.assertEqual({hit.job_id for hit in hits}, {7})
+
+
+class FusionTests(SimpleTestCase):
+    """Test cases for reciprocal-rank fusion."""
+
+    def test_agreement_beats_a_single_first_place(self):
+        lexical = [Hit(9.0, 1, 1), Hit(5.0, 2, 1), Hit(1.0, 3, 2)]
+        dense = [Hit(0.9, 4, 2), Hit(0.8, 2, 1), Hit(0.1, 3, 2)]
+        hits = reciprocal_rank_fusion([lexical, dense], 3)
+        self.assertEqual([hit.chunk_id for hit in hits], [2, 3, 1])
+        self.assertAlmostEqual(hits[0].score, 2 / 62)
+        # Chunks 1 and 4 are tied, first in one ranking only; the lower id wins
+        self.assertEqual([hit.chunk_id for hit in reciprocal_rank_fusion([lexical, dense], 4)][2:], [1, 4])
+        self.assertEqual(reciprocal_rank_fusion([[], []], 3), [])
+
+
+class RAGQueryTests(FileStorageTestCase):
+    """Test cases for retrieval over the user's uploaded files."""
+
+    def query(self, query, client=None, **extra):
+        return (client or self.client).post(reverse('rag-query'), {'query': query, **extra}, format='json')
+
+    def client_for(self, email):
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(email=email, password='testpass'))
+        return client
+
+    def test_upload_process_and_query(self):
+        other = self.client_for('other@example.com')
+        first = self.upload('fruit.txt', b'Apples are red.\n\nBananas are yellow.').data['id']
+        copy = self.upload('fruit-copy.txt', b'Apples are red.\n\nBananas are yellow.', client=other).data['id']
+        self.upload('cars.md', b'# Cars\n\nFast cars are red too.')
+        self.upload('image.bin', b'\x00\x01')
+        # Uploads of supported types are queued for extraction as they arrive
+        self.assertEqual(FileProcessingJob.objects.count(), 2)
+        # Two chunks in this user's shard, one in the other user's
+        self.assertEqual(process_jobs().indexed, 3)
+
+        response = self.query('yellow bananas')
+        self.assertEqual(response.status_code, 200)
+        [result] = response.data['results']
+        self.assertEqual((result['file_ids'], result['name']), ([first], 'fruit.txt'))
+        self.assertEqual(response.data['answer'], result['text'])
+        self.assertEqual((result['start_offset'], result['end_offset']), (0, 36))
+        # Shared content is indexed once, and found through each user's own upload
+        [result] = self.query('yellow bananas', client=other).data['results']
+        self.assertEqual((result['file_ids'], result['name']), ([copy], 'fruit-copy.txt'))
+
+        results = self.query('red', top_k=1).data['results']
+        self.assertEqual(len(results), 1)
+
+        # Character n-grams let the dense index match another form of a word
+        self.assertEqual(self.query('banana', mode='lexical').data['results'], [])
+        [result] = self.query('banana', mode='dense', top_k=1).data['results']
+        self.assertEqual(result['file_ids'], [first])
+
+    def test_results_follow_visibility(self):
+        file_id = self.upload('secret.txt', b'the launch code is zebra').data['id']
+        process_jobs()
+        other = self.client_for('other@example.com')
+        self.assertEqual(self.query('zebra', client=other).data['results'], [])
+        self.assertEqual(len(self.query('zebra').data['results']), 1)
+
+        # Deleting the file takes it out of the results at once; once reaped, as it was the last
+        # upload of the content, its job is deleted too, and the indexes follow
+        job_id = FileProcessingJob.objects.get().id
+        self.client.delete(reverse('file-delete', args=[file_id]))
+        self.assertEqual(self.query('zebra').data, {'answer': '', 'results': []})
+        with self.captureOnCommitCallbacks(execute=True):
+            reap_deleted_uploads()
+        self.assertFalse(FileProcessingJob.objects.exists())
+        self.assertFalse(IndexedJob.objects.exists())
+        for index in get_shard(self.user.pk).indexes.values():
+            self.assertEqual(index.deleted_jobs, {job_id})
+            self.assertEqual(index.search('zebra', 5), [])
+
+    def test_hybrid_mode_and_dedupe(self):
+        first = self.upload('owls.txt', b'Barn owls hunt at night.').data['id']
+        second = self.upload('owls.md', b'Barn owls hunt at night.\n').data['id']
+        self.upload('larks.txt', b'Larks sing at dawn.')
+        process_jobs()
+
+        results = self.query('owls hunting', mode='hybrid', top_k=2).data['results']
+        self.assertEqual([result['file_ids'] for result in results], [[first], [second]])
+        # The same passage in different content comes back once
+        results = self.query('owls hunting', mode='hybrid', top_k=2, dedupe=True).data['results']
+        self.assertEqual(results[0]['file_ids'], [first, second])
+        self.assertNotIn(second, results[1]['file_ids'])
+
+    def test_results_are_cached_until_files_change(self):
+        file_id = self.upload('moon.txt', b'The moon orbits the earth.').data['id']
+        process_jobs()
+        self.assertEqual(len(self.query('moon orbit').data['results']), 1)
+        # The same question, however it is typed, is answered without touching the database
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.query('  MOON   orbit ').data['results']), 1)
+
+        # A new upload invalidates; its text is found once extracted and indexed
+        self.upload('moons.txt', b'Every moon of Jupiter orbits it.')
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.query('moon orbit').data['results']), 1)
+        process_jobs()
+        self.assertEqual(len(self.query('moon orbit').data['results']), 2)
+
+        self.client.post(reverse('file-bulk-delete'), {'ids': [file_id]}, format='json')
+        self.assertEqual(len(self.query('moon orbit').data['results']), 1)
+
+    def test_rebuild_command(self):
+        self.upload('a.txt', b'quantum physics notes')
+        process_jobs()
+        call_command('rebuild_rag_index', stdout=StringIO())
+        lexical = get_shard(self.user.pk).indexes['lexical']
+        self.assertEqual(len(lexical), 1)
+        self.assertEqual(len(self.query('quantum').data['results']), 1)
+        call_command('rebuild_rag_index', '--compact', stdout=StringIO())
+        self.assertEqual(len(lexical.segments), 1)
+
+    def test_benchmark_command(self):
+        self.upload('queued.txt', b'not the benchmark\'s to process')
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('benchmark_rag', '--files', '5', '--paragraphs', '4', '--queries', '6', '--k', '5', stdout=out)
+        # Only the benchmark user's jobs run
+        self.assertEqual(FileProcessingJob.objects.get(name='queued.txt').status, FileProcessingJob.QUEUED)
+        report = json.loads(out.getvalue())
+        self.assertEqual((report["corpus"]["files"], report["corpus"]["queries"]), (5, 6))
+        self.assertEqual(set(report["modes"]), {'lexical', 'dense', 'hybrid'})
+        # Relevant passages share two rare words with their query, which BM25 ranks first
+        self.assertEqual((report["modes"]["lexical"]["recall"], report["modes"]["lexical"]["mrr"]), (1.0, 1.0))
+        for result in report["modes"].values():
+            latency = result["latency_ms"]
+            self.assertLessEqual(latency["p50"], latency["p95"])
+            self.assertLessEqual(latency["p95"], latency["p99"])
+        self.assertGreater(report["index_bytes"]["dense"], 0)
+
+        fixture = os.path.join(self.media_root, 'fixture.json')
+        with open(fixture, 'w') as f:
+            json.dump({
+                "files": {"a.txt": "Owls hunt at night.", "b.txt": "Larks sing at dawn."},
+                "queries": [{"query": "singing larks", "relevant": ["Larks sing at dawn."]}],
+            }, f)
+        output = os.path.join(self.media_root, 'report.json')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'benchmark_rag', '--fixture', fixture, '--modes', 'dense', '--output', output, stdout=StringIO()
+            )
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report["modes"]["dense"]["mrr"], 1.0)
+        # The benchmark user and their shard are gone
+        self.assertFalse(get_user_model().objects.filter(email='rag-benchmark@example.invalid').exists())
+        self.assertEqual(get_shards().user_ids(), [])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.query('').status_code, 400)
+        self.assertEqual(self.query('x', top_k=0).status_code, 400)
+        self.assertEqual(self.query('x', top_k='many').status_code, 400)
+        self.assertEqual(self.query('x', top_k=51).status_code, 400)
+        self.assertEqual(self.query('x', mode='fuzzy').status_code, 400)
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """Streams ``server.tokens`` as an Azure OpenAI chat completion, or fails if ``server.fail``."""
+
+    def do_POST(self):
+        self.server.requests.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+        if self.server.fail:
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": {"message": "overloaded"}}).encode())
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for token in self.server.tokens:
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class RAGAnswerTests(FileStorageTestCase):
+    """Test cases for answers streamed from the user's files, by a local fake model server."""
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeModelHandler)
+        self.server.requests, self.server.tokens, self.server.fail = [], ['Owls ', 'hunt\n', 'at night [1].'], False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api = mock.patch.multiple(
+            openai,
+            api_type='azure',
+            api_base=f'http://127.0.0.1:{self.server.server_port}',
+            api_version='2023-05-15',
+            api_key='test',
+        )
+        api.start()
+        self.addCleanup(api.stop)
+
+    def answer(self, query, **extra):
+        return self.client.post(reverse('rag-answer'), {'query': query, **extra}, format='json')
+
+    def events(self, response):
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for message in b''.join(response.streaming_content).decode().split('\n\n')[:-1]:
+            name, data = message.split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_citations_then_streamed_answer(self):
+        file_id = self.upload('owls.txt', b'Barn owls hunt at night.').data['id']
+        process_jobs()
+        response = self.answer('when do owls hunt', model='gpt4')
+        self.assertEqual(response.status_code, 200)
+        # Citations are sent before the model is asked anything
+        first = next(iter(response.streaming_content)).decode()
+        self.assertTrue(first.startswith('event: citations\n'))
+        self.assertEqual(self.server.requests, [])
+
+        events = self.events(response)
+        self.assertEqual([name for name, _ in events], ['token'] * 3 + ['done'])
+        self.assertEqual(''.join(data for _, data in events[:-1]), 'Owls hunt\nat night [1].')
+        [citation] = json.loads(first.split('data: ')[1])
+        self.assertEqual(citation['file_ids'], [file_id])
+
+        [(path, body)] = self.server.requests
+        self.assertTrue(path.startswith('/openai/deployments/gpt-4-0613/chat/completions'))
+        self.assertTrue(body['stream'])
+        prompt = body['messages'][-1]['content']
+        self.assertIn('[1] owls.txt\nBarn owls hunt at night.', prompt)
+        self.assertTrue(prompt.endswith('Question: when do owls hunt'))
+
+    def test_no_passages_no_model_call(self):
+        self.assertEqual(self.events(self.answer('anything')), [('citations', []), ('done', {})])
+        self.assertEqual(self.server.requests, [])
+
+    def test_model_failure_ends_with_error(self):
+        self.upload('owls.txt', b'Barn owls hunt at night.')
+        process_jobs()
+        self.server.fail = True
+        with self.assertLogs('chat.rag.answer', 'ERROR'):
+            events = self.events(self.answer('owls'))
+        self.assertEqual([name for name, _ in events], ['citations', 'error'])
+
+    def test_prompt_fits_the_context_window(self):
+        results = [{"name": f'{i}.txt', "text": 'word ' * 400} for i in range(20)]
+        prompt, cited = build_prompt('a question', results, passage_budget('gpt35', 'a question'))
+        # The best passages are kept while they fit, with room left for the answer
+        self.assertTrue(0 < len(cited) < len(results))
+        self.assertEqual(cited, results[:len(cited)])
+        self.assertLessEqual(count_tokens(prompt), GPT_VERSIONS['gpt35'].context_window - settings.RAG_ANSWER_TOKENS)
+        _, cited = build_prompt('a question', results, passage_budget('gpt4-32k', 'a question'))
+        self.assertEqual(len(cited), len(results))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.answer('x', model='gpt5').status_code, 400)
+        self.assertEqual(self.answer('x', top_k=0).status_code, 400)
+        self.assertEqual(self.answer('word ' * 4000).status_code, 400)
+        self.assertEqual(self.answer('word ' * 4000, model='gpt4-32k').status_code, 200)
+
+
+class ShardTests(FileStorageTestCase):
+    """Test cases for per-user shards."""
+
+    def client_for(self, email):
+        user = get_user_model().objects.create_user(email=email, password='testpass')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return user, client
+
+    def query(self, client, query):
+        return client.post(reverse('rag-query'), {'query': query}, format='json').data['results']
+
+    def test_shards_hold_their_users_files_only(self):
+        other, client = self.client_for('other@example.com')
+        self.upload('mine.txt', b'alpha centauri')
+        self.upload('theirs.txt', b'alpha particles', client=client)
+        process_jobs()
+        self.assertEqual(len(get_shard(self.user.pk).indexes['lexical']), 1)
+        self.assertEqual([r['name'] for r in self.query(client, 'alpha')], ['theirs.txt'])
+
+        # Content extracted for someone else is indexed for a new uploader without extracting it again
+        self.upload('copy.txt', b'alpha particles')
+        report = process_jobs()
+        self.assertEqual((report.jobs, report.indexed), (0, 1))
+        self.assertEqual(sorted(r['name'] for r in self.query(self.client, 'alpha')), ['copy.txt', 'mine.txt'])
+
+    def test_reupload_after_delete_is_searchable_and_survives_compaction(self):
+        other, client = self.client_for('other@example.com')
+        content = b'quasars are distant'
+        file_id = self.upload('mine.txt', content).data['id']
+        self.upload('theirs.txt', content, client=client)
+        process_jobs()
+        # The other user still holds the content, so its job and chunks stay
+        self.client.post(reverse('file-bulk-delete'), {'ids': [file_id]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            reap_deleted_uploads()
+        self.assertEqual(self.query(self.client, 'quasars'), [])
+
+        self.upload('again.txt', content)
+        self.assertEqual(process_jobs().indexed, 1)
+        self.assertEqual([r['name'] for r in self.query(self.client, 'quasars')], ['again.txt'])
+        call_command('rebuild_rag_index', '--compact', stdout=StringIO())
+        self.assertEqual([r['name'] for r in self.query(self.client, 'quasars')], ['again.txt'])
+        for index in get_shard(self.user.pk).indexes.values():
+            self.assertEqual(len(index), 1)
+
+    def test_deleted_user_loses_their_shard(self):
+        other, client = self.client_for('other@example.com')
+        self.upload('theirs.txt', b'beta decay', client=client)
+        process_jobs()
+        directory = get_shards().directory(other.pk)
+        self.assertTrue(os.path.isdir(directory))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(os.path.exists(directory))
+        self.assertNotIn(other.pk, get_shards())
+
+    def test_least_recently_used_shards_are_evicted(self):
+        users = [self.user, *(self.client_for(f'u{i}@example.com')[0] for i in range(2))]
+        for user in users:
+            get_shard(user.pk).indexes['lexical'].add([(user.pk, 1, 'some words to index')])
+        shards = ShardCache(get_shards().root, max_bytes=0)
+        for user in users:
+            shards.get(user.pk).indexes['lexical'].search('words', 1)
+        self.assertGreater(shards.memory_bytes, 0)
+        # Over budget, only the shard used last stays open
+        shards.get(users[0].pk)
+        self.assertEqual([user.pk in shards for user in users], [True, False, False])
+        shards.max_bytes = 10**9
+        shards.get(users[1].pk)
+        self.assertEqual([user.pk in shards for user in users], [True, True, False])
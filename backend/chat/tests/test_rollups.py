@@ -0,0 +1,96 @@
+"""
+Tests for FileEventLog daily rollups and retention.
+"""
+
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from chat.models import FileEventDailyRollup, FileEventLog, FileUpload
+from chat.tests import TEST_CACHES
+from chat.utils.rollups import compact_file_events, day_start, purge_file_events, retention_cutoff
+
+User = get_user_model()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FileEventRollupTests(APITestCase):
+    """Test cases for compaction, retention and rollup-backed stats."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='rollup@example.com', password='testpass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.file = FileUpload.objects.create(name='a.txt', size=1, hash='a' * 64, uploader=self.user, file='blobs/a')
+        self.today = timezone.localdate()
+
+    def log(self, days_ago, event_type='access', count=1, file=None):
+        at = day_start(self.today - timedelta(days=days_ago)) + timedelta(hours=12)
+        FileEventLog.objects.bulk_create(
+            FileEventLog(event_type=event_type, file=file or self.file, user=self.user, timestamp=at)
+            for _ in range(count)
+        )
+
+    def test_compaction_rolls_up_completed_days(self):
+        self.log(2, count=3)
+        self.log(1, count=2)
+        self.log(1, event_type='upload')
+        self.log(0, count=5)
+
+        days, rows = compact_file_events()
+
+        self.assertEqual((days, rows), (2, 3))
+        counts = {
+            (rollup.day, rollup.event_type): rollup.count
+            for rollup in FileEventDailyRollup.objects.filter(file=self.file)
+        }
+        yesterday, before = self.today - timedelta(days=1), self.today - timedelta(days=2)
+        self.assertEqual(counts, {(before, 'access'): 3, (yesterday, 'access'): 2, (yesterday, 'upload'): 1})
+
+    def test_recompaction_counts_late_events_once(self):
+        self.log(1, count=2)
+        compact_file_events()
+        self.log(1)
+        compact_file_events()
+        self.assertEqual(FileEventDailyRollup.objects.get().count, 3)
+
+    def test_retention_deletes_only_compacted_old_events(self):
+        self.log(40, count=4)
+        self.log(10, count=2)
+        self.assertIsNone(retention_cutoff(30))
+
+        compact_file_events()
+        deleted = purge_file_events(retention_cutoff(30), batch_size=3)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(FileEventLog.objects.count(), 2)
+        # Purged days keep their rollups when compaction runs again
+        compact_file_events(since=self.today - timedelta(days=60))
+        self.assertEqual(FileEventDailyRollup.objects.filter(day=self.today - timedelta(days=40)).get().count, 4)
+
+    def test_command_compacts_then_purges(self):
+        self.log(100, count=2)
+        self.log(1)
+        out = io.StringIO()
+        call_command('compact_file_events', '--retain-days=90', stdout=out)
+        self.assertIn('Deleted 2 raw events', out.getvalue())
+        self.assertEqual(FileEventDailyRollup.objects.count(), 2)
+
+    def test_stats_combine_rollups_with_today(self):
+        self.log(3, count=2)
+        self.log(0, count=4)
+        compact_file_events()
+
+        response = self.client.get(reverse('file-stats'), {'days': 7})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'access': 6})
+        self.assertEqual([row['access'] for row in response.data['daily']], [2, 4])
+        self.assertEqual(response.data['top_files'], [{'file_id': self.file.id, 'name': 'a.txt', 'accesses': 6}])
+        self.assertEqual(self.client.get(reverse('file-stats'), {'days': 0}).status_code, 400)
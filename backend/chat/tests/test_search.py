@@ -0,0 +1,73 @@
+"""
+Tests for the conversation full-text search index.
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from chat.models import Conversation, Message, Role, Version
+from chat.tests import TEST_CACHES
+from chat.utils.search import apply_fulltext_search, rebuild_search_index
+
+User = get_user_model()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FullTextSearchTests(APITestCase):
+    """Test cases for the full-text search backend."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='search@example.com', password='testpass')
+        self.role = Role.objects.create(name='user')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _search(self, text):
+        return set(apply_fulltext_search(Conversation.objects.all(), text).values_list('title', flat=True))
+
+    def test_title_and_summary_are_indexed_on_save(self):
+        Conversation.objects.create(title="Deploying Django", summary="Notes about uvicorn", user=self.user)
+        self.assertEqual(self._search("django"), {"Deploying Django"})
+        self.assertEqual(self._search("uvic"), {"Deploying Django"})
+
+    def test_messages_are_indexed_incrementally(self):
+        conversation = Conversation.objects.create(title="Chat", user=self.user)
+        version = Version.objects.create(conversation=conversation)
+        conversation.active_version = version
+        conversation.save()
+        Message.objects.create(content="How do I bake sourdough bread?", role=self.role, version=version)
+        self.assertEqual(self._search("sourdough"), {"Chat"})
+
+    def test_title_change_and_delete_update_index(self):
+        conversation = Conversation.objects.create(title="Old name", summary="x", user=self.user)
+        conversation.title = "New name"
+        conversation.save()
+        self.assertEqual(self._search("old"), set())
+        self.assertEqual(self._search("new"), {"New name"})
+        conversation.delete()
+        self.assertEqual(self._search("new"), set())
+
+    def test_search_endpoint_ranks_by_relevance(self):
+        Conversation.objects.create(title="Gardening", summary="tomato tomato tomato tomato", user=self.user)
+        Conversation.objects.create(title="Cooking", summary="a tomato salad and other dishes", user=self.user)
+        Conversation.objects.create(title="Unrelated", summary="nothing here", user=self.user)
+        response = self.client.get(reverse('conversation-summaries'), {'search': 'tomato'})
+        self.assertEqual(response.status_code, 200)
+        titles = [item['title'] for item in response.data['results']]
+        self.assertEqual(titles, ["Gardening", "Cooking"])
+        self.assertEqual(response.data['count'], 2)
+
+    def test_query_syntax_is_not_interpreted(self):
+        Conversation.objects.create(title="Quotes", summary="x", user=self.user)
+        self.assertEqual(self._search('quo"* ('), {"Quotes"})
+        self.assertEqual(self._search('"*'), {"Quotes"})
+
+    def test_rebuild_search_index(self):
+        Conversation.objects.bulk_create(
+            [Conversation(title=f"Bulk {i}", summary="bulk", user=self.user) for i in range(3)]
+        )
+        self.assertEqual(self._search("bulk"), set())
+        self.assertEqual(rebuild_search_index(clear=True), 3)
+        self.assertEqual(len(self._search("bulk")), 3)
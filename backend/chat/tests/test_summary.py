@@ -2,14 +2,16 @@
 Tests for conversation summary functionality.
 """
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from chat.models import Conversation, Version, Message, Role
+from chat.tests import TEST_CACHES
 from chat.utils.summary import generate_conversation_summary, update_conversation_summary
 
 User = get_user_model()
 
 
+@override_settings(CACHES=TEST_CACHES)
 class SummaryTestCase(TestCase):
     """Test cases for conversation summary functionality."""
     
@@ -1,5 +1,6 @@
 import json
 
+from django.test import override_settings
 from django.urls import reverse
 from freezegun import freeze_time
 from rest_framework import status
@@ -7,8 +8,10 @@ from rest_framework.test import APITestCase
 
 from authentication.models import CustomUser
 from chat.models import Conversation, Message, Role, Version
+from chat.tests import TEST_CACHES
 
 
+@override_settings(CACHES=TEST_CACHES)
 class LoggedInConversationTests(APITestCase):
     @classmethod
     def setUpTestData(cls):
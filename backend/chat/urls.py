@@ -4,10 +4,21 @@ from chat import views
 from .views import (
     ConversationSummaryListView,
     FileUploadView,
+    FileBatchUploadView,
+    FileDedupeProbeView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    UploadSessionCompleteView,
     FileListView,
     FileDeleteView,
+    FileBulkDeleteView,
+    FileDownloadView,
+    FileExportView,
+    FileEventStatsView,
     RAGQueryView,
+    RAGAnswerView,
     FileProcessView,
+    FileProcessingJobView,
 )
 
 urlpatterns = [
@@ -33,9 +44,20 @@ urlpatterns += [
     # API endpoints for Task 3
     path('api/conversations/summaries/', ConversationSummaryListView.as_view(), name='conversation-summaries'),
     path('api/files/upload/', FileUploadView.as_view(), name='file-upload'),
+    path('api/files/upload/batch/', FileBatchUploadView.as_view(), name='file-batch-upload'),
+    path('api/files/probe/', FileDedupeProbeView.as_view(), name='file-probe'),
+    path('api/files/uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('api/files/uploads/<uuid:id>/', UploadSessionView.as_view(), name='upload-session'),
+    path('api/files/uploads/<uuid:id>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
     path('api/files/', FileListView.as_view(), name='file-list'),
     path('api/files/<int:id>/delete/', FileDeleteView.as_view(), name='file-delete'),
+    path('api/files/bulk-delete/', FileBulkDeleteView.as_view(), name='file-bulk-delete'),
+    path('api/files/<int:id>/download/', FileDownloadView.as_view(), name='file-download'),
+    path('api/files/export/', FileExportView.as_view(), name='file-export'),
+    path('api/files/stats/', FileEventStatsView.as_view(), name='file-stats'),
     # Task 4 endpoints
     path('api/rag/query/', RAGQueryView.as_view(), name='rag-query'),
+    path('api/rag/answer/', RAGAnswerView.as_view(), name='rag-answer'),
     path('api/files/<int:id>/process/', FileProcessView.as_view(), name='file-process'),
+    path('api/files/jobs/<int:id>/', FileProcessingJobView.as_view(), name='file-process-job'),
 ]
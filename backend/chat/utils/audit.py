@@ -0,0 +1,123 @@
+"""
+Buffered writer for ``FileEventLog``.
+
+Events are appended to an in-memory buffer and written with one ``bulk_create`` per flush. A flush
+happens when the buffer reaches ``max_batch`` events, when a request finishes (after its response
+was sent), from a background thread once events are ``flush_interval`` seconds old, and at
+interpreter exit, so a graceful shutdown does not drop buffered events.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from chat.models import FileEventLog, FileUpload
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Thread-safe buffer of ``FileEventLog`` rows flushed in batches."""
+
+    def __init__(self, max_batch: int = 500, flush_interval: float = 5.0, max_buffer: int = 20000):
+        """
+        Args:
+            max_batch: Buffered events that trigger an immediate flush
+            flush_interval: Seconds an event may wait before the background thread flushes it
+            max_buffer: Events kept for retry while the database is unavailable; the oldest are dropped beyond this
+        """
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def log(self, event_type: str, file_id: Optional[int], user_id: int, extra: str = None):
+        event = FileEventLog(
+            event_type=event_type, file_id=file_id, user_id=user_id, extra=extra, timestamp=timezone.now()
+        )
+        self.log_many([event])
+
+    def log_many(self, events: List):
+        """Buffer unsaved ``FileEventLog`` instances."""
+        if not events:
+            return
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(events)
+            full = len(self._buffer) >= self.max_batch
+        if full:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write every buffered event now; returns how many were written."""
+        with self._lock:
+            events, self._buffer, self._oldest = self._buffer, [], None
+        if not events:
+            return 0
+        try:
+            return self._write(events)
+        except Exception:
+            logger.exception("Could not write %d file events, keeping them for the next flush", len(events))
+            with self._lock:
+                self._buffer = (events + self._buffer)[-self.max_buffer:]
+                self._oldest = time.monotonic()
+            return 0
+
+    def _write(self, events: List) -> int:
+        # A file deleted while its events were buffered keeps the event without it, like ON DELETE SET NULL
+        file_ids = {event.file_id for event in events if event.file_id}
+        live_files = set(FileUpload.objects.filter(id__in=file_ids).values_list("id", flat=True))
+        for event in events:
+            if event.file_id not in live_files:
+                event.file_id = None
+        try:
+            with transaction.atomic():
+                FileEventLog.objects.bulk_create(events, batch_size=self.max_batch)
+            return len(events)
+        except IntegrityError:
+            pass
+
+        # Events of a user deleted meanwhile are dropped, like ON DELETE CASCADE would
+        User = FileEventLog._meta.get_field("user").related_model
+        live_users = set(User.objects.filter(id__in={e.user_id for e in events}).values_list("id", flat=True))
+        kept = [event for event in events if event.user_id in live_users]
+        with transaction.atomic():
+            FileEventLog.objects.bulk_create(kept, batch_size=self.max_batch)
+        return len(kept)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="file-event-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+                self.flush()
+                # The thread's own connection is not closed by the request cycle
+                connections.close_all()
+
+
+audit_log = SimpleLazyObject(lambda: AuditLogWriter(**settings.FILE_EVENT_LOG_BUFFER))
@@ -0,0 +1,236 @@
+"""
+Content-addressed blob store for uploaded files.
+
+Bytes are stored once per SHA-256 under ``blobs/ab/cd/<sha256>`` and shared by every
+``FileUpload`` with that hash; ``FileBlob.ref_count`` tracks how many uploads point at a blob.
+Callers that create blobs inside a larger transaction wrap it in ``stored_blobs_atomic`` so bytes
+stored by a transaction that rolls back are unlinked again.
+
+Linking a blob by its digest alone would let anyone who learns a file's SHA-256 read it, so such links
+go through a proof-of-possession challenge (``possession_challenge`` / ``check_possession``).
+"""
+
+import hashlib
+import hmac
+import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from chat.models import FileBlob, FileRemoval
+
+
+_stored_names: ContextVar = ContextVar("stored_blob_names", default=None)
+POSSESSION_SALT = "chat.blobs.possession"
+
+
+class _RolledBack(Exception):
+    """Leaves an atomic block marked for rollback through the exception path."""
+
+
+def blob_path(sha256: str) -> str:
+    """Storage name of a blob, fanned out so no directory grows too large."""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def _store(sha256: str, content) -> str:
+    name = default_storage.save(blob_path(sha256), content)
+    stored = _stored_names.get()
+    if stored is not None:
+        stored.append(name)
+    return name
+
+
+@contextmanager
+def stored_blobs_atomic():
+    """
+    ``transaction.atomic`` that unlinks the blob files stored inside it if it rolls back.
+
+    Without it a rollback after ``acquire_blob`` stored new content would leave the bytes on disk
+    with no ``FileBlob`` row pointing at them.
+    """
+    stored = []
+    token = _stored_names.set(stored)
+    try:
+        with transaction.atomic():
+            yield
+            if transaction.get_rollback():
+                raise _RolledBack
+    except _RolledBack:
+        _discard(stored)
+    except BaseException:
+        _discard(stored)
+        raise
+    finally:
+        _stored_names.reset(token)
+
+
+def _unstore(name: str) -> None:
+    default_storage.delete(name)
+    stored = _stored_names.get()
+    if stored is not None:
+        stored.remove(name)
+
+
+def _discard(names: Iterable[str]) -> None:
+    # Storage gave each name to this block alone, and names unstored early are no longer listed
+    for name in names:
+        default_storage.delete(name)
+
+
+def _add_reference(sha256: str):
+    with transaction.atomic():
+        if FileBlob.objects.filter(hash=sha256).update(ref_count=F("ref_count") + 1):
+            return FileBlob.objects.get(hash=sha256)
+    return None
+
+
+def acquire_blob(sha256: str, content=None, size: int = None) -> FileBlob:
+    """
+    Take a reference on the blob for ``sha256``, storing ``content`` only if the blob is new.
+
+    Args:
+        sha256: Hex digest of the content
+        content: File with the bytes, only read when no blob exists yet (may be None to probe)
+        size: Content size in bytes, defaults to ``content.size``
+
+    Returns:
+        FileBlob: The referenced blob, or None when it does not exist and no content was given
+    """
+    blob = _add_reference(sha256)
+    if blob is not None or content is None:
+        return blob
+
+    name = _store(sha256, content)
+    try:
+        with transaction.atomic():
+            return FileBlob.objects.create(
+                hash=sha256, file=name, size=content.size if size is None else size, ref_count=1
+            )
+    except IntegrityError:
+        # Another request stored the same content first, share its blob
+        _unstore(name)
+        return _add_reference(sha256)
+
+
+def acquire_blobs(contents: Dict[str, object]) -> Dict[str, FileBlob]:
+    """
+    Batch ``acquire_blob``: one reference on each blob of ``contents`` (SHA-256 -> file).
+
+    Existing blobs are found and referenced with one query each way, new content is stored and
+    inserted with one ``bulk_create``; if a concurrent request created some of the same blobs,
+    those fall back to the per-blob path.
+
+    Returns:
+        Dict[str, FileBlob]: Blob for every hash
+    """
+    with transaction.atomic():
+        blobs = {blob.hash: blob for blob in FileBlob.objects.select_for_update().filter(hash__in=contents)}
+        FileBlob.objects.filter(pk__in=[blob.pk for blob in blobs.values()]).update(ref_count=F("ref_count") + 1)
+
+    new = {sha256: content for sha256, content in contents.items() if sha256 not in blobs}
+    stored = {sha256: _store(sha256, content) for sha256, content in new.items()}
+    try:
+        with transaction.atomic():
+            created = FileBlob.objects.bulk_create(
+                FileBlob(hash=sha256, file=name, size=new[sha256].size, ref_count=1) for sha256, name in stored.items()
+            )
+        blobs.update((blob.hash, blob) for blob in created)
+    except IntegrityError:
+        for sha256, name in stored.items():
+            try:
+                with transaction.atomic():
+                    blobs[sha256] = FileBlob.objects.create(
+                        hash=sha256, file=name, size=new[sha256].size, ref_count=1
+                    )
+            except IntegrityError:
+                _unstore(name)
+                blobs[sha256] = _add_reference(sha256)
+    return blobs
+
+
+def possession_challenge(user_id, sha256: str, size: int) -> dict:
+    """
+    Pick a random byte range of the content whose SHA-256 the client must return.
+
+    The range is signed into a token together with the user and the content, so checking the answer
+    needs no server state. A challenge is issued whether or not the content is stored.
+
+    Returns:
+        dict: ``token``, ``offset`` and ``length`` of the range
+    """
+    length = min(size, settings.FILE_DEDUPE_PROOF_BYTES)
+    offset = secrets.randbelow(size - length + 1)
+    token = signing.dumps([user_id, sha256, size, offset, length], salt=POSSESSION_SALT)
+    return {"token": token, "offset": offset, "length": length}
+
+
+def check_possession(user_id, sha256: str, size: int, token: str, proof: str) -> bool:
+    """
+    Whether ``proof`` is the SHA-256 of the range that ``token`` asked this user for.
+
+    Returns:
+        bool: False for an invalid or expired token, content that is not stored, or a wrong answer
+    """
+    try:
+        challenged = signing.loads(token, salt=POSSESSION_SALT, max_age=settings.FILE_DEDUPE_CHALLENGE_SECONDS)
+    except signing.BadSignature:
+        return False
+    user, digest, digest_size, offset, length = challenged
+    if [user, digest, digest_size] != [user_id, sha256, size]:
+        return False
+    blob = FileBlob.objects.filter(hash=sha256, size=size).first()
+    if blob is None:
+        return False
+    with blob.file.open("rb") as file:
+        file.seek(offset)
+        expected = hashlib.sha256(file.read(length)).hexdigest()
+    return hmac.compare_digest(expected, proof)
+
+
+def release_blob(blob_id: int) -> bool:
+    """
+    Drop one reference; the blob row and its bytes go away with the last one.
+
+    The bytes are queued as a ``FileRemoval`` in the same transaction and unlinked later by
+    ``remove_pending_files`` (the ``reap_deleted_files`` command), so no request waits on the
+    filesystem and a crash cannot leave unrecorded orphans.
+
+    Returns:
+        bool: True when the blob was deleted
+    """
+    with transaction.atomic():
+        FileBlob.objects.filter(pk=blob_id).update(ref_count=F("ref_count") - 1)
+        blob = FileBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None or blob.ref_count > 0:
+            return False
+        FileRemoval.objects.create(path=blob.file.name)
+        blob.delete()
+    return True
+
+
+def remove_pending_files(ids: Iterable[int] = None) -> int:
+    """
+    Unlink queued files, then drop their queue rows; rerunning after a crash is harmless.
+
+    Args:
+        ids: Only process these ``FileRemoval`` rows, all of them by default
+
+    Returns:
+        int: Number of queue rows processed
+    """
+    removals = FileRemoval.objects.all() if ids is None else FileRemoval.objects.filter(pk__in=ids)
+    done = 0
+    for removal in removals.iterator():
+        # Content uploaded again since may have been stored under the same name
+        if not FileBlob.objects.filter(file=removal.path).exists():
+            default_storage.delete(removal.path)
+        removal.delete()
+        done += 1
+    return done
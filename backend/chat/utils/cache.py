@@ -0,0 +1,94 @@
+"""
+Versioned, per-user response caching for conversation endpoints and file retrieval.
+
+Cache keys embed a version token per user and namespace (``conversations``, ``files``). Writes bump
+the token instead of deleting keys, so stale entries are never addressed again and simply expire.
+"""
+
+import hashlib
+import time
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.response import Response
+
+from src.utils.cache import cache
+
+VERSION_KEY = "chat:{namespace}:version:{scope}"
+ALL_USERS = "all"
+CONVERSATIONS = "conversations"
+FILES = "files"
+
+
+def _version_key(scope, namespace: str = CONVERSATIONS) -> str:
+    return VERSION_KEY.format(namespace=namespace, scope=scope)
+
+
+def get_cache_version(scope, namespace: str = CONVERSATIONS) -> int:
+    """Return the current version token for a scope (a user id or ``ALL_USERS``) in a namespace."""
+    key = _version_key(scope, namespace)
+    version = cache.get(key, local=False)
+    if version is None:
+        # Seed from the clock so a flushed cache never hands out previously used versions
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, local=False)
+    return version
+
+
+def bump_cache_version(scopes, namespace: str) -> None:
+    """
+    Invalidate cached data of the scopes in a namespace.
+
+    Bumps immediately and again after commit, so a reader that cached pre-commit data under
+    the first bump is invalidated as well.
+    """
+
+    def bump():
+        for scope in scopes:
+            cache.incr(_version_key(scope, namespace), initial=time.time_ns)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def bump_conversation_cache_version(user_id) -> None:
+    """Invalidate cached responses containing a user's conversations."""
+    bump_cache_version((user_id, ALL_USERS), CONVERSATIONS)
+
+
+def bump_file_cache_version(user_id) -> None:
+    """Invalidate cached retrieval results over a user's files, after an upload or delete."""
+    bump_cache_version((user_id,), FILES)
+
+
+class VersionedCacheMixin:
+    """
+    Cache ``list`` responses per requesting user and query string.
+
+    Views define ``cache_prefix`` and may override ``get_cache_scopes`` (the users whose data the
+    response may contain, by default the requesting user); the key embeds each scope's version,
+    so writes invalidate it instantly.
+    """
+
+    cache_prefix = None
+    cache_timeout = None
+
+    def get_cache_scopes(self) -> List:
+        return [self.request.user.pk]
+
+    def get_cache_versions(self) -> List[int]:
+        return [get_cache_version(scope) for scope in self.get_cache_scopes()]
+
+    def get_cache_key(self, request) -> str:
+        query = sorted((name, request.query_params.getlist(name)) for name in request.query_params)
+        digest = hashlib.sha1(repr(query).encode()).hexdigest()
+        versions = ".".join(str(version) for version in self.get_cache_versions())
+        return f"{self.cache_prefix}:{request.user.pk}:{versions}:{digest}"
+
+    def list(self, request, *args, **kwargs):
+        def compute():
+            return super(VersionedCacheMixin, self).list(request, *args, **kwargs).data
+
+        timeout = self.cache_timeout or settings.CONVERSATION_CACHE_TIMEOUT
+        return Response(cache.get_or_compute(self.get_cache_key(request), compute, timeout))
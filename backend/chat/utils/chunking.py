@@ -0,0 +1,222 @@
+"""
+Token-aware chunking of extracted text.
+
+Blocks from ``chat.utils.extraction`` are split at sentence and line boundaries, and the pieces
+packed into chunks of at most ``max_tokens`` tokens. Consecutive chunks share up to
+``overlap_tokens`` tokens of whole sentences, so text cut at a chunk border is still seen whole in
+one of them, and a new chunk starts at a paragraph break when one is close. Only the chunk being
+built is held in memory, so files of any size are chunked in constant space.
+
+Each chunk records the byte range of the file it came from: exact for plain text, at the
+granularity of a line, row or record for formats whose text is rewritten (Markdown, CSV, HTML, JSON).
+
+Tokens are estimated without a tokenizer dependency: one per punctuation mark and one per four
+characters of a word, which errs slightly high against GPT-style BPE counts of English prose.
+"""
+
+import json
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, NamedTuple
+
+from chat.utils.extraction import Block, read_blocks, utf8_length
+
+_TOKEN = re.compile(r'\w{1,4}|[^\w\s]')
+
+# Sentence ends (with closing quotes or brackets) followed by whitespace, and line breaks
+_BOUNDARY = re.compile(r'(?<=[.!?])["\'\)\]]*[^\S\n]+|[^\S\n]*\n\s*')
+
+_WORD = re.compile(r'\S+\s*')
+
+_CONTROL = re.compile(r'[\x00-\x08\x0b-\x1f\x7f-\x9f\u200b\ufeff]')
+_SPACES = re.compile(r'[^\S\n]+')
+# Whatever normalize_text would change in ASCII text besides leading and trailing spaces
+_ASCII_UNCLEAN = re.compile(r'[^ -~]|  ')
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+class _Piece(NamedTuple):
+    """A sentence (or part of one), with what joins it to the piece before."""
+    text: str
+    tokens: int
+    start: int
+    end: int
+    separator: str
+
+
+@dataclass
+class ChunkingStats:
+    bytes: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 2**20 / self.seconds if self.seconds else 0.0
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalize, drop control characters, collapse whitespace and remove blank lines."""
+    if text.isascii() and not _ASCII_UNCLEAN.search(text):
+        # Most text: NFKC leaves ASCII alone and there is no whitespace to collapse
+        return text.strip()
+    text = _CONTROL.sub(' ', unicodedata.normalize('NFKC', text))
+    lines = (_SPACES.sub(' ', line).strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def split_block(block: Block, max_tokens: int) -> Iterator[_Piece]:
+    """Split a block into normalized pieces of at most ``max_tokens``, with their byte ranges."""
+    text = block.text
+    measure = len if text.isascii() else utf8_length
+    byte_offset, char_offset = block.start, 0
+    separator = '\n\n'
+
+    def span(start, end):
+        # Offsets only move forward, so each character is measured once
+        nonlocal byte_offset, char_offset
+        if not block.verbatim:
+            return block.start, block.end
+        byte_offset += measure(text[char_offset:start])
+        char_offset = start
+        first = byte_offset
+        byte_offset += measure(text[start:end])
+        char_offset = end
+        return first, byte_offset
+
+    position = 0
+    for boundary in _BOUNDARY.finditer(text + '\n'):
+        end = min(boundary.start(), len(text))
+        sentence = text[position:end]
+        newlines = boundary.group().count('\n')
+        next_separator = '\n\n' if newlines > 1 else '\n' if newlines else ' '
+        normalized = normalize_text(sentence)
+        if normalized:
+            tokens = count_tokens(normalized)
+            if tokens <= max_tokens:
+                yield _Piece(normalized, tokens, *span(position, end), separator)
+            else:
+                # Too long for one chunk: break between words, and inside words longer than a chunk
+                for word_start, word_end, continued in _word_runs(sentence, position, max_tokens):
+                    piece = normalize_text(text[word_start:word_end])
+                    if piece:
+                        piece_separator = '' if continued else separator
+                        yield _Piece(piece, count_tokens(piece), *span(word_start, word_end), piece_separator)
+                        separator = ' '
+            separator = next_separator
+        position = boundary.end()
+        if position >= len(text):
+            break
+
+
+def _word_runs(sentence: str, offset: int, max_tokens: int) -> Iterator[tuple]:
+    """
+    Character ranges of runs of whole words of at most ``max_tokens``, with whether the run continues
+    the word before it without a break (the parts of a word longer than a chunk).
+    """
+    run_start, run_tokens = offset, 0
+    for word in _WORD.finditer(sentence):
+        tokens = count_tokens(word.group())
+        if run_tokens and run_tokens + tokens > max_tokens:
+            yield run_start, offset + word.start(), False
+            run_start, run_tokens = offset + word.start(), 0
+        if tokens > max_tokens:
+            # Every character is at most one token
+            first = offset + word.start()
+            for start in range(first, offset + word.end(), max_tokens):
+                yield start, min(start + max_tokens, offset + word.end()), start > first
+            run_start, run_tokens = offset + word.end(), 0
+            continue
+        run_tokens += tokens
+    if run_tokens:
+        yield run_start, offset + len(sentence), False
+
+
+def _join(pieces: List[_Piece]) -> Chunk:
+    text = pieces[0].text + ''.join(piece.separator + piece.text for piece in pieces[1:])
+    return Chunk(text, pieces[0].start, max(piece.end for piece in pieces), sum(piece.tokens for piece in pieces))
+
+
+def chunk_blocks(blocks: Iterable[Block], max_tokens: int, overlap_tokens: int = 0) -> Iterator[Chunk]:
+    """
+    Pack the sentences of ``blocks`` into overlapping chunks.
+
+    Args:
+        blocks: Text blocks in document order
+        max_tokens: Token budget of a chunk
+        overlap_tokens: Tokens of trailing sentences repeated at the start of the next chunk
+
+    Yields:
+        Chunk: Text, byte range in the file and token count
+    """
+    if max_tokens < 1 or not 0 <= overlap_tokens < max_tokens:
+        raise ValueError('max_tokens must be positive and overlap_tokens between 0 and max_tokens - 1')
+    window: List[_Piece] = []
+    tokens = 0
+    fresh = 0
+    for block in blocks:
+        for piece in split_block(block, max_tokens):
+            if window and tokens + piece.tokens > max_tokens:
+                yield _join(window)
+                # Carry whole trailing sentences of the chunk over, not reaching back past a paragraph break
+                carried, carried_tokens = [], 0
+                for previous in reversed(window):
+                    if (
+                        carried_tokens + previous.tokens > overlap_tokens
+                        or carried_tokens + previous.tokens + piece.tokens > max_tokens
+                    ):
+                        break
+                    carried.append(previous)
+                    carried_tokens += previous.tokens
+                    if previous.separator == '\n\n':
+                        break
+                window, tokens, fresh = carried[::-1], carried_tokens, 0
+            window.append(piece)
+            tokens += piece.tokens
+            fresh += 1
+    if fresh:
+        yield _join(window)
+
+
+def chunk_file(path: str, name: str, max_tokens: int, overlap_tokens: int = 0) -> Iterator[Chunk]:
+    """Stream the chunks of a stored file; raises ``ExtractionError`` for files no reader can extract."""
+    return chunk_blocks(read_blocks(path, name), max_tokens, overlap_tokens)
+
+
+def spool_chunks(path: str, name: str, max_tokens: int, overlap_tokens: int, spool_path: str) -> ChunkingStats:
+    """
+    Chunk a stored file into a spool file of JSON lines, for another process to load.
+
+    Returns:
+        ChunkingStats: Bytes read, chunks and tokens written, and the time it took
+    """
+    stats = ChunkingStats(bytes=os.path.getsize(path))
+    started = time.perf_counter()
+    with open(spool_path, 'w', encoding='utf-8') as spool:
+        for chunk in chunk_file(path, name, max_tokens, overlap_tokens):
+            spool.write(json.dumps(chunk, ensure_ascii=False))
+            spool.write('\n')
+            stats.chunks += 1
+            stats.tokens += chunk.tokens
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def read_spool(spool_path: str) -> Iterator[Chunk]:
+    with open(spool_path, encoding='utf-8') as spool:
+        for line in spool:
+            yield Chunk(*json.loads(line))
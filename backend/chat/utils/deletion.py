@@ -0,0 +1,77 @@
+"""
+Soft deletion of uploads and the background reaper that reclaims their storage.
+
+Deleting marks rows with ``deleted_at`` in a single UPDATE and returns. ``reap_deleted_uploads``,
+run by the ``reap_deleted_files`` command, later deletes rows past the grace period; that releases
+their blobs, and bytes no longer referenced are unlinked through the durable ``FileRemoval`` queue.
+Uploading the same content again before the reaper ran revives the row.
+"""
+
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import FileEventLog, FileUpload
+from chat.utils.blobs import remove_pending_files
+from chat.utils.cache import bump_file_cache_version
+
+
+def soft_delete_uploads(user, ids: Iterable[int]) -> List[int]:
+    """
+    Mark the user's live uploads among ``ids`` deleted and log a delete event for each.
+
+    Returns:
+        List[int]: Ids that were deleted; the others were not found
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        live = FileUpload.objects.select_for_update().filter(id__in=ids, uploader=user, deleted_at__isnull=True)
+        deleted = list(live.values_list('id', flat=True))
+        FileUpload.objects.filter(id__in=deleted).update(deleted_at=now)
+        FileEventLog.objects.bulk_create(
+            FileEventLog(event_type='delete', file_id=file_id, user=user, timestamp=now) for file_id in deleted
+        )
+        if deleted:
+            bump_file_cache_version(user.pk)
+    return deleted
+
+
+def revive_upload(user, file_hash: str, name: str) -> Optional[FileUpload]:
+    """Bring back the user's soft-deleted upload of this content, still holding its blob, if there is one."""
+    revived = FileUpload.objects.filter(hash=file_hash, uploader=user, deleted_at__isnull=False).update(
+        deleted_at=None, name=name, uploaded_at=timezone.now()
+    )
+    if not revived:
+        return None
+    bump_file_cache_version(user.pk)
+    return FileUpload.objects.get(hash=file_hash, uploader=user)
+
+
+def reap_deleted_uploads(grace_seconds: int = 0, batch_size: int = 500) -> Tuple[int, int]:
+    """
+    Delete soft-deleted uploads older than the grace period, then unlink unreferenced files.
+
+    Each batch is locked and deleted in its own transaction, so a crash loses at most the batch in
+    flight, which is simply picked up again on the next run.
+
+    Returns:
+        Tuple[int, int]: Upload rows deleted and files unlinked
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    rows = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                FileUpload.objects.select_for_update()
+                .filter(deleted_at__lt=cutoff)
+                .order_by('deleted_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            # Row deletes release the blobs (post_delete signal) and queue their files
+            FileUpload.objects.filter(id__in=batch).delete()
+        rows += len(batch)
+    return rows, remove_pending_files()
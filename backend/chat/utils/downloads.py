@@ -0,0 +1,230 @@
+"""
+Authenticated file downloads with HTTP Range and conditional request support.
+
+The stored SHA-256 is the strong ETag. Bytes are streamed by ``FileResponse`` from an open file
+positioned at the range start, so WSGI servers with ``wsgi.file_wrapper`` (e.g. gunicorn) send them
+with ``sendfile``. With ``FILE_DOWNLOAD_OFFLOAD`` set, the transfer is handed to the web server
+through ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd) after permissions were checked.
+
+Several files are exported as a ZIP generated on the fly: ``zipfile`` writes to an unseekable sink
+(entries get data descriptors instead of patched headers) that is drained after every chunk, so
+memory stays constant however large the archive is, and nothing is written to disk.
+"""
+
+import logging
+import os
+import zipfile
+from typing import Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+
+logger = logging.getLogger(__name__)
+
+# Already compressed formats are stored as-is, deflating them costs CPU and saves nothing
+COMPRESSED_EXTENSIONS = {
+    '.7z', '.avi', '.bz2', '.docx', '.epub', '.flac', '.gif', '.gz', '.heic', '.jpeg', '.jpg', '.m4a', '.mkv',
+    '.mov', '.mp3', '.mp4', '.odp', '.ods', '.odt', '.ogg', '.pdf', '.png', '.pptx', '.rar', '.tgz', '.webm',
+    '.webp', '.xlsx', '.xz', '.zip', '.zst',
+}
+
+ZIP_CHUNK_SIZE = 256 * 2**10
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range starts beyond the end of the file."""
+
+
+class RangeFile:
+    """
+    Read at most ``length`` bytes of ``file`` from its current position.
+
+    ``fileno`` and ``tell`` are passed through, so ``sendfile`` can start at the right offset;
+    servers bound the transfer by the response's ``Content-Length``.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range into inclusive ``(start, end)`` offsets.
+
+    Returns None when the whole file should be sent: no header, a malformed one, or several ranges
+    (which would need a multipart response). Raises ``RangeNotSatisfiable`` for ranges past the end.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    specs = header[len("bytes="):].split(",")
+    if len(specs) != 1:
+        return None
+    first, _, last = specs[0].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def serve_upload(request, upload) -> HttpResponse:
+    """
+    Build the download response for ``upload``, honouring If-None-Match, Range and If-Range.
+
+    Args:
+        request: The download request
+        upload: The FileUpload to send, already permission-checked
+
+    Returns:
+        HttpResponse: 200, 206, 304 or 416 response
+    """
+    etag = quote_etag(upload.hash)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return HttpResponseNotModified(headers=headers)
+
+    offload = settings.FILE_DOWNLOAD_OFFLOAD
+    if offload:
+        response = HttpResponse(headers=headers)
+        response["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(upload.name)}"
+        # The web server serves the file itself, including ranges
+        if offload == "x-accel-redirect":
+            response["X-Accel-Redirect"] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + quote(upload.file.name)
+        elif offload == "x-sendfile":
+            response["X-Sendfile"] = default_storage.path(upload.file.name)
+        else:
+            raise ImproperlyConfigured(f"Unknown FILE_DOWNLOAD_OFFLOAD mode: {offload!r}")
+        del response["Content-Type"]
+        return response
+
+    size = upload.size
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except RangeNotSatisfiable:
+            return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    file = default_storage.open(upload.file.name, "rb")
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=upload.name, headers=headers)
+        response["Content-Length"] = size
+        return response
+
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(
+        RangeFile(file, end - start + 1), status=206, as_attachment=True, filename=upload.name, headers=headers
+    )
+    response["Content-Length"] = end - start + 1
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+class _ZipSink:
+    """Write-only, unseekable file object collecting what ``zipfile`` writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def archive_name(name: str, used: set) -> str:
+    """``name``, or ``name (2).ext`` etc. if the archive already has an entry called that."""
+    root, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{root} ({n}){ext}"
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(uploads: Iterable) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of ``uploads`` chunk by chunk.
+
+    Args:
+        uploads: FileUpload instances (or rows with ``name``, ``file``, ``size`` and ``uploaded_at``)
+
+    Yields:
+        bytes: Consecutive pieces of the archive, each at most about ``ZIP_CHUNK_SIZE`` plus a header
+    """
+    sink = _ZipSink()
+    used = set()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for upload in uploads:
+            try:
+                source = default_storage.open(upload.file.name, "rb")
+            except FileNotFoundError:
+                logger.warning("Skipping %s in export, %s is missing from storage", upload.name, upload.file.name)
+                continue
+            modified = timezone.localtime(upload.uploaded_at).timetuple()[:6]
+            info = zipfile.ZipInfo(archive_name(upload.name, used), modified)
+            compressed = os.path.splitext(upload.name)[1].lower() in COMPRESSED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if compressed else zipfile.ZIP_DEFLATED
+            info.file_size = upload.size
+            with source, archive.open(info, mode="w", force_zip64=upload.size > zipfile.ZIP64_LIMIT) as entry:
+                for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b""):
+                    entry.write(chunk)
+                    yield from _pending(sink)
+            yield from _pending(sink)
+    # Central directory
+    yield from _pending(sink)
+
+
+def _pending(sink: _ZipSink) -> Iterator[bytes]:
+    data = sink.drain()
+    if data:
+        yield data
@@ -0,0 +1,384 @@
+"""
+Streaming text extraction from uploaded files.
+
+Each reader consumes the file incrementally and yields text blocks (paragraphs, table rows, JSON
+records) with the byte range of the file they came from, so memory is bounded by the largest
+block, not the file. ``chat.utils.chunking`` splits the blocks into chunks.
+
+Nothing here touches the database, so extraction can run in worker processes.
+"""
+
+import codecs
+import csv
+import json
+import os
+import re
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+READ_SIZE = 64 * 2**10
+
+# Longest block a reader accumulates before yielding it anyway (e.g. a text file without blank lines)
+MAX_BLOCK_CHARS = 64 * 2**10
+
+# Largest JSON document that is not a top-level array: those are decoded whole, so bigger ones fail the job
+MAX_JSON_DOCUMENT_BYTES = 16 * 2**20
+
+FILE_KINDS = {
+    '.txt': 'text',
+    '.text': 'text',
+    '.log': 'text',
+    '.md': 'markdown',
+    '.markdown': 'markdown',
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.htm': 'html',
+    '.html': 'html',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+
+class ExtractionError(Exception):
+    """The file cannot be extracted; trying again would fail the same way."""
+
+
+class UnsupportedFileType(ExtractionError):
+    """No reader handles the file's type."""
+
+
+class DocumentTooLarge(ExtractionError):
+    """The file is too large for a reader that holds it whole."""
+
+
+class Block(NamedTuple):
+    """
+    Text read from ``start`` to ``end`` (byte offsets) of the file. ``verbatim`` blocks are the
+    decoded bytes themselves; others were rewritten (markup stripped, values labelled), so only the
+    block's range as a whole maps back to the file.
+    """
+    text: str
+    start: int
+    end: int
+    verbatim: bool = False
+
+
+def file_kind(name: str) -> Optional[str]:
+    return FILE_KINDS.get(os.path.splitext(name)[1].lower())
+
+
+def utf8_length(text: str) -> int:
+    return len(text.encode('utf-8', 'surrogatepass'))
+
+
+def iter_lines(path: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield ``(text, start, end)`` for the lines of a UTF-8 file; lines longer than ``READ_SIZE``
+    bytes come in pieces. A byte order mark is skipped, and undecodable bytes become U+FFFD
+    instead of failing the job.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    offset = 0
+    with open(path, 'rb') as file:
+        for raw in iter(lambda: file.readline(READ_SIZE), b''):
+            start = offset
+            if not offset and raw.startswith(codecs.BOM_UTF8):
+                raw, start = raw[len(codecs.BOM_UTF8):], len(codecs.BOM_UTF8)
+            offset = start + len(raw)
+            yield decoder.decode(raw), start, offset
+
+
+def iter_whole_lines(path: str) -> Iterator[Tuple[str, int, int]]:
+    """``iter_lines`` with long lines joined back together, for formats parsed line by line."""
+    pieces, start, end = [], 0, 0
+    for text, piece_start, end in iter_lines(path):
+        if not pieces:
+            start = piece_start
+        pieces.append(text)
+        if text.endswith('\n'):
+            yield ''.join(pieces), start, end
+            pieces = []
+    if pieces:
+        yield ''.join(pieces), start, end
+
+
+def read_paragraphs(lines: Iterable[Tuple[str, int, int]], verbatim: bool = False) -> Iterator[Block]:
+    """Group lines into blank-line separated paragraphs."""
+    paragraph, size = [], 0
+    start, end = 0, 0
+    for text, line_start, line_end in lines:
+        if not text.strip():
+            if paragraph:
+                yield Block(''.join(paragraph), start, end, verbatim)
+                paragraph, size = [], 0
+            continue
+        if not paragraph:
+            start = line_start
+        paragraph.append(text)
+        end = line_end
+        size += len(text)
+        if size >= MAX_BLOCK_CHARS:
+            yield Block(''.join(paragraph), start, end, verbatim)
+            paragraph, size = [], 0
+    if paragraph:
+        yield Block(''.join(paragraph), start, end, verbatim)
+
+
+def read_text(path: str) -> Iterator[Block]:
+    yield from read_paragraphs(iter_lines(path), verbatim=True)
+
+
+MARKDOWN_PATTERNS = [
+    (re.compile(r'^\s{0,3}(```|~~~).*$'), ''),           # code fence markers, the code is kept
+    (re.compile(r'^\s{0,3}#{1,6}\s+'), ''),              # headings
+    (re.compile(r'^\s{0,3}>\s?'), ''),                   # block quotes
+    (re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+'), ''),       # list items
+    (re.compile(r'^\s{0,3}([-*_])(\s*\1){2,}\s*$'), ''),  # horizontal rules
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),      # images: alt text
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),       # links: link text
+    (re.compile(r'<[^>\n]+>'), ''),                      # inline HTML
+    (re.compile(r'(\*\*|\*|~~|`)(?=\S)(.+?)(?<=\S)\1'), r'\2'),     # emphasis and code spans
+    (re.compile(r'(?<!\w)(__|_)(?=\S)(.+?)(?<=\S)\1(?!\w)'), r'\2'),  # underscore emphasis, not snake_case
+]
+
+
+def strip_markdown(line: str) -> str:
+    for pattern, replacement in MARKDOWN_PATTERNS:
+        line = pattern.sub(replacement, line)
+    return line
+
+
+def read_markdown(path: str) -> Iterator[Block]:
+    lines = ((strip_markdown(text.rstrip('\r\n')) + '\n', start, end) for text, start, end in iter_lines(path))
+    yield from read_paragraphs(lines)
+
+
+def read_csv(path: str, delimiter: str = ',') -> Iterator[Block]:
+    """One block per row, each value labelled with its column header."""
+    consumed = [0]
+
+    def texts():
+        for text, _, end in iter_whole_lines(path):
+            consumed[0] = end
+            yield text
+
+    rows = csv.reader(texts(), delimiter=delimiter)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [column.strip() for column in header]
+    start = consumed[0]
+    for row in rows:
+        fields = [
+            f'{header[i]}: {value}' if i < len(header) and header[i] else value
+            for i, value in enumerate(row)
+            if value.strip()
+        ]
+        if fields:
+            yield Block('; '.join(fields), start, consumed[0])
+        start = consumed[0]
+
+
+def read_tsv(path: str) -> Iterator[Block]:
+    yield from read_csv(path, delimiter='\t')
+
+
+class _HTMLTextParser(HTMLParser):
+    """Collect visible text, breaking blocks at block-level elements."""
+
+    SKIP = {'script', 'style', 'noscript', 'template', 'svg', 'iframe'}
+    BLOCKS = {
+        'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'footer',
+        'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+        'section', 'table', 'td', 'th', 'title', 'tr', 'ul',
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        # Blocks span from the end of the previous one to the end of the input fed so far
+        self.start = 0
+        self.fed = 0
+        self._text = []
+        self._size = 0
+        self._skipping = 0
+
+    def _break(self):
+        if self._text:
+            self.blocks.append(Block(''.join(self._text), self.start, self.fed))
+            self._text, self._size = [], 0
+            self.start = self.fed
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self._break()
+
+    def handle_data(self, data):
+        if self._skipping:
+            return
+        self._text.append(data)
+        self._size += len(data)
+        if self._size >= MAX_BLOCK_CHARS:
+            self._break()
+
+    def close(self):
+        super().close()
+        self._break()
+
+
+def read_html(path: str) -> Iterator[Block]:
+    """Block ranges are at line granularity: the parser reports no byte positions."""
+    parser = _HTMLTextParser()
+    for text, _, end in iter_lines(path):
+        parser.fed = end
+        parser.feed(text)
+        yield from parser.blocks
+        parser.blocks.clear()
+    parser.close()
+    yield from parser.blocks
+
+
+def flatten_json(value) -> str:
+    """``key.path: value`` lines for the scalars of a JSON value, in document order."""
+    lines = []
+    stack = [('', value)]
+    while stack:
+        path, item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend((f'{path}.{key}' if path else str(key), child) for key, child in reversed(item.items()))
+        elif isinstance(item, list):
+            stack.extend((path, child) for child in reversed(item))
+        elif item is not None and item != '':
+            lines.append(f'{path}: {item}' if path else str(item))
+    return '\n'.join(lines)
+
+
+class _DecodingReader:
+    """Decode a binary file piece by piece, tracking the byte offset of a moving character position."""
+
+    def __init__(self, file):
+        self.file = file
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.eof = False
+
+    def read(self, size: int) -> str:
+        data = self.file.read(size)
+        self.eof = not data
+        return self.decoder.decode(data, final=self.eof)
+
+
+def iter_json_array(reader: _DecodingReader, buffer: str, offset: int) -> Iterator[Tuple[object, int, int]]:
+    """
+    Decode the elements of a top-level JSON array one at a time, with their byte ranges.
+
+    ``buffer`` holds the text right after the ``[``, which ends at byte ``offset``.
+    """
+    decoder = json.JSONDecoder()
+    position, read_size = 0, READ_SIZE
+
+    def advance(to):
+        nonlocal position, offset
+        offset += utf8_length(buffer[position:to])
+        position = to
+
+    while True:
+        while True:
+            skip = position
+            while skip < len(buffer) and buffer[skip] in ' \t\r\n,':
+                skip += 1
+            advance(skip)
+            if position < len(buffer) or reader.eof:
+                break
+            buffer, position = reader.read(READ_SIZE), 0
+        if position >= len(buffer) or buffer[position] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if reader.eof:
+                raise
+            end = None
+        # A value ending exactly at the buffer end may be cut short (a number, or the element is incomplete)
+        if end is None or (end == len(buffer) and not reader.eof):
+            more = reader.read(read_size)
+            # Grow reads while one element spans many of them, so decoding it stays linear overall
+            read_size *= 2
+            buffer, position = buffer[position:] + more, 0
+            continue
+        read_size = READ_SIZE
+        start = offset
+        advance(end)
+        yield value, start, offset
+        if position > READ_SIZE:
+            buffer, position = buffer[position:], 0
+
+
+def read_json(path: str) -> Iterator[Block]:
+    """
+    Top-level arrays are decoded element by element, one block per element. Other documents have
+    no element boundaries to stream along and are decoded whole, up to ``MAX_JSON_DOCUMENT_BYTES``.
+
+    Raises:
+        DocumentTooLarge: A document other than an array is larger than ``MAX_JSON_DOCUMENT_BYTES``
+    """
+    with open(path, 'rb') as file:
+        offset = len(codecs.BOM_UTF8) if file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 0
+        file.seek(offset)
+        reader = _DecodingReader(file)
+        head = reader.read(READ_SIZE)
+        stripped = head.lstrip()
+        if stripped.startswith('['):
+            offset += utf8_length(head[:len(head) - len(stripped) + 1])
+            for value, start, end in iter_json_array(reader, stripped[1:], offset):
+                yield Block(flatten_json(value), start, end)
+        else:
+            if os.fstat(file.fileno()).st_size > MAX_JSON_DOCUMENT_BYTES:
+                raise DocumentTooLarge(
+                    f'JSON documents other than arrays are limited to {MAX_JSON_DOCUMENT_BYTES // 2**20} MB'
+                )
+            text = head + reader.decoder.decode(file.read(), final=True)
+            yield Block(flatten_json(json.loads(text)), offset, file.tell())
+
+
+def read_jsonl(path: str) -> Iterator[Block]:
+    for text, start, end in iter_whole_lines(path):
+        if text.strip():
+            yield Block(flatten_json(json.loads(text)), start, end)
+
+
+READERS = {
+    'text': read_text,
+    'markdown': read_markdown,
+    'csv': read_csv,
+    'tsv': read_tsv,
+    'html': read_html,
+    'json': read_json,
+    'jsonl': read_jsonl,
+}
+
+
+def read_blocks(path: str, name: str) -> Iterator[Block]:
+    """
+    Stream the text blocks of a stored file.
+
+    Args:
+        path: Filesystem path of the stored file
+        name: File name; its extension selects the reader
+
+    Raises:
+        UnsupportedFileType: No reader handles the file's extension
+    """
+    kind = file_kind(name)
+    if kind is None:
+        extension = os.path.splitext(name)[1] or 'files without an extension'
+        raise UnsupportedFileType(f'Text extraction does not support {extension}')
+    return READERS[kind](path)
@@ -0,0 +1,165 @@
+"""
+Hot-path query registry and query plan inspection for the ``advise_indexes`` command.
+"""
+
+import statistics
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Model, QuerySet
+from django.utils import timezone
+
+from chat.models import Conversation, FileEventDailyRollup, FileEventLog, FileUpload, Message
+
+
+@dataclass
+class HotQuery:
+    """An ORM query issued by a hot endpoint and the model index meant to serve it."""
+
+    name: str
+    model: type
+    index_name: str
+    build: Callable[[Dict], QuerySet]
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "get_conversations",
+        Conversation,
+        "chat_conv_user_live_idx",
+        lambda ctx: Conversation.objects.filter(user_id=ctx["user_id"], deleted_at__isnull=True).order_by(
+            "-modified_at"
+        ),
+    ),
+    HotQuery(
+        "conversation_summaries",
+        Conversation,
+        "chat_conv_modified_idx",
+        lambda ctx: Conversation.objects.order_by("-modified_at")[:11],
+    ),
+    HotQuery(
+        "conversation_summaries?user",
+        Conversation,
+        "chat_conv_user_modified_idx",
+        lambda ctx: Conversation.objects.filter(user__id=ctx["user_id"]).order_by("-modified_at")[:11],
+    ),
+    HotQuery(
+        "version_messages",
+        Message,
+        "chat_msg_version_created_idx",
+        lambda ctx: Message.objects.filter(version_id=ctx["version_id"]).order_by("created_at"),
+    ),
+    HotQuery(
+        "file_list",
+        FileUpload,
+        "chat_file_uploader_idx",
+        lambda ctx: FileUpload.objects.filter(uploader_id=ctx["user_id"], deleted_at__isnull=True).order_by(
+            "-uploaded_at"
+        )[:11],
+    ),
+    HotQuery(
+        "file_events_by_file",
+        FileEventLog,
+        "chat_fileevent_file_idx",
+        lambda ctx: FileEventLog.objects.filter(file_id=ctx["file_id"]).order_by("-timestamp")[:50],
+    ),
+    HotQuery(
+        "file_events_by_user",
+        FileEventLog,
+        "chat_fileevent_user_idx",
+        lambda ctx: FileEventLog.objects.filter(user_id=ctx["user_id"]).order_by("-timestamp")[:50],
+    ),
+    HotQuery(
+        "file_events_retention",
+        FileEventLog,
+        "chat_fileevent_ts_idx",
+        lambda ctx: FileEventLog.objects.filter(timestamp__lt=ctx["cutoff"]).order_by("timestamp").values("id")[:5000],
+    ),
+    HotQuery(
+        "file_stats",
+        FileEventDailyRollup,
+        "chat_rollup_user_day_idx",
+        lambda ctx: FileEventDailyRollup.objects.filter(user_id=ctx["user_id"], day__gte=ctx["cutoff"].date()),
+    ),
+]
+
+
+def sample_context() -> Dict:
+    """Pick real ids to parametrize the hot queries, so plans reflect actual data distribution."""
+    conversation = Conversation.objects.order_by("-modified_at").values("user_id", "active_version_id").first()
+    file = FileUpload.objects.order_by("-uploaded_at").values("id").first()
+    return {
+        "user_id": conversation["user_id"] if conversation else 0,
+        "version_id": (conversation or {}).get("active_version_id") or uuid.uuid4(),
+        "file_id": file["id"] if file else 0,
+        "cutoff": timezone.now() - timedelta(days=settings.FILE_EVENT_LOG_RETENTION_DAYS),
+    }
+
+
+def explain(queryset: QuerySet) -> List[str]:
+    """Return the query plan as text lines."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return [row[0] for row in cursor.fetchall()]
+    return []
+
+
+def find_plan_issues(plan: List[str]) -> List[str]:
+    """Flag sequential scans and sorts that spill into a temporary B-tree (SQLite) or a Sort node (PostgreSQL)."""
+    issues = []
+    for line in plan:
+        detail = line.strip().lstrip("->").strip()
+        if connection.vendor == "sqlite":
+            if detail.startswith("SCAN ") and "USING" not in detail and "VIRTUAL TABLE" not in detail:
+                issues.append(f"sequential scan: {detail}")
+            elif "USE TEMP B-TREE" in detail:
+                issues.append(f"temp sort: {detail}")
+        elif connection.vendor == "postgresql":
+            if detail.startswith("Seq Scan"):
+                issues.append(f"sequential scan: {detail}")
+            elif detail.startswith(("Sort ", "Incremental Sort")):
+                issues.append(f"sort: {detail}")
+    return issues
+
+
+def time_queryset(queryset: QuerySet, runs: int = 5) -> float:
+    """Median wall time in milliseconds of evaluating the queryset."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def get_model_index(model: type, name: str):
+    for index in model._meta.indexes:
+        if index.name == name:
+            return index
+    return None
+
+
+def index_exists(model: type, name: str) -> bool:
+    with connection.cursor() as cursor:
+        return name in connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+
+def create_index(model: type[Model], name: str) -> Optional[str]:
+    """Create a declared model index that the database is missing; returns its SQL."""
+    index = get_model_index(model, name)
+    if index is None or index_exists(model, name):
+        return None
+    with connection.schema_editor(atomic=connection.vendor != "postgresql") as schema_editor:
+        sql = str(index.create_sql(model, schema_editor))
+        schema_editor.add_index(model, index)
+    return sql
@@ -0,0 +1,275 @@
+"""
+Background text extraction of uploaded files, driven by the ``process_files`` command.
+
+The queue is the ``FileProcessingJob`` table, one job per content hash, so every upload of the same
+bytes shares one job and its ``TextChunk`` rows. A worker claims a job with a conditional UPDATE that
+also sets a lease; the job of a worker that died mid-run is claimed again once its lease expires, and
+results are only written if the job was not claimed again meanwhile. Uploads of supported types are
+queued as they are created, and the chunks of finished jobs are added to the retrieval shards of
+their uploaders (``chat.rag``), as are those of new uploads of content extracted earlier.
+Extraction and chunking (``chat.utils.chunking``) run on a process pool without database access;
+each worker streams its chunks to a spool file that the claiming process loads in batches, so
+neither holds a whole file.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from chat.models import FileProcessingJob, FileUpload, TextChunk
+from chat.rag.retrieval import index_pending
+from chat.utils.chunking import Chunk, read_spool, spool_chunks
+from chat.utils.extraction import ExtractionError, file_kind
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProcessingReport:
+    done: int = 0
+    failed: int = 0
+    retried: int = 0
+    indexed: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def jobs(self) -> int:
+        return self.done + self.failed + self.retried
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 2**20 / self.seconds if self.seconds else 0.0
+
+
+def enqueue_processing(upload: FileUpload) -> Tuple[FileProcessingJob, bool]:
+    """
+    Queue text extraction of the upload's content, unless it is queued or processed already.
+
+    A failed job is queued again, with its attempts reset.
+
+    Returns:
+        Tuple[FileProcessingJob, bool]: The job, and whether it was (re)queued by this call
+    """
+    job, created = FileProcessingJob.objects.get_or_create(hash=upload.hash, defaults={'name': upload.name})
+    if created:
+        return job, True
+    requeued = FileProcessingJob.objects.filter(id=job.id, status=FileProcessingJob.FAILED).update(
+        status=FileProcessingJob.QUEUED, name=upload.name, attempts=0, error=''
+    )
+    if requeued:
+        job.refresh_from_db()
+    return job, bool(requeued)
+
+
+def queue_uploads(uploads: Iterable[FileUpload]):
+    """Queue text extraction of new uploads in one query, for the file types extraction supports."""
+    FileProcessingJob.objects.bulk_create(
+        [FileProcessingJob(hash=upload.hash, name=upload.name) for upload in uploads if file_kind(upload.name)],
+        # Content already queued or processed keeps its job
+        ignore_conflicts=True,
+    )
+
+
+def uploaded_by(uploader) -> Q:
+    """Jobs of content the user uploaded."""
+    return Q(hash__in=FileUpload.objects.filter(uploader=uploader).values('hash'))
+
+
+def claim_jobs(limit: int, uploader=None) -> List[FileProcessingJob]:
+    """
+    Claim up to ``limit`` queued jobs (or running jobs whose lease expired), oldest first.
+
+    Args:
+        limit: Most jobs to claim
+        uploader: Only claim jobs of content this user uploaded, None for any job
+    """
+    now = timezone.now()
+    claimable = Q(status=FileProcessingJob.QUEUED) | Q(status=FileProcessingJob.RUNNING, lease_expires_at__lt=now)
+    if uploader is not None:
+        claimable &= uploaded_by(uploader)
+    candidates = FileProcessingJob.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)
+    claimed = []
+    for job_id in candidates[:limit]:
+        # Another worker may have claimed it since it was listed; only one UPDATE matches
+        if FileProcessingJob.objects.filter(claimable, id=job_id).update(
+            status=FileProcessingJob.RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.FILE_PROCESSING_LEASE_SECONDS),
+        ):
+            claimed.append(job_id)
+    return list(FileProcessingJob.objects.filter(id__in=claimed).order_by('created_at'))
+
+
+def source_path(job: FileProcessingJob) -> Optional[str]:
+    """Filesystem path of the stored bytes of the job's content, None once no upload has them."""
+    upload = FileUpload.objects.filter(hash=job.hash).exclude(file='').only('file').first()
+    return default_storage.path(upload.file.name) if upload else None
+
+
+def renew_lease(job: FileProcessingJob) -> bool:
+    """Extend the lease of a job still being worked on; False if it was claimed again meanwhile."""
+    return bool(FileProcessingJob.objects.filter(
+        id=job.id, status=FileProcessingJob.RUNNING, attempts=job.attempts
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=settings.FILE_PROCESSING_LEASE_SECONDS)))
+
+
+def wait_for(job: FileProcessingJob, future: Future):
+    """Wait for a worker's result, renewing the job's lease meanwhile so large files are not claimed again."""
+    while True:
+        try:
+            return future.result(timeout=settings.FILE_PROCESSING_LEASE_SECONDS / 3)
+        except FutureTimeoutError:
+            renew_lease(job)
+
+
+def finish_job(job: FileProcessingJob, chunks: Iterable[Chunk], batch_size: int = 500) -> bool:
+    """Replace the job's chunks and mark it done; False if the job was claimed again meanwhile."""
+    chunks = iter(chunks)
+    count = 0
+    with transaction.atomic():
+        TextChunk.objects.filter(job=job).delete()
+        while batch := list(islice(chunks, batch_size)):
+            TextChunk.objects.bulk_create(
+                TextChunk(
+                    job=job,
+                    index=count + i,
+                    text=chunk.text,
+                    start_offset=chunk.start,
+                    end_offset=chunk.end,
+                    token_count=chunk.tokens,
+                )
+                for i, chunk in enumerate(batch)
+            )
+            count += len(batch)
+        if not FileProcessingJob.objects.filter(
+            id=job.id, status=FileProcessingJob.RUNNING, attempts=job.attempts
+        ).update(
+            status=FileProcessingJob.DONE,
+            chunk_count=count,
+            error='',
+            finished_at=timezone.now(),
+            lease_expires_at=None,
+        ):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def fail_job(job: FileProcessingJob, error: str, retry: bool = True) -> bool:
+    """
+    Record a failed attempt: the job is queued again until it used up its attempts.
+
+    Returns:
+        bool: Whether the job will be retried
+    """
+    retry = retry and job.attempts < settings.FILE_PROCESSING_MAX_ATTEMPTS
+    FileProcessingJob.objects.filter(id=job.id, status=FileProcessingJob.RUNNING, attempts=job.attempts).update(
+        status=FileProcessingJob.QUEUED if retry else FileProcessingJob.FAILED,
+        error=error[:2000],
+        finished_at=None if retry else timezone.now(),
+        lease_expires_at=None,
+    )
+    return retry
+
+
+def index_finished(job_ids: Optional[Iterable[int]] = None) -> int:
+    """Index the chunks of finished jobs (all pending ones when None); a failure leaves them for the next run."""
+    try:
+        return index_pending(job_ids)
+    except Exception:
+        logger.exception('Indexing extracted text failed')
+        return 0
+
+
+def process_jobs(workers: int = 1, max_jobs: int = None, uploader=None) -> ProcessingReport:
+    """
+    Run queued jobs until the queue is empty.
+
+    Args:
+        workers: Extraction processes; 1 extracts in this process
+        max_jobs: Stop after this many jobs, None to drain the queue
+        uploader: Only run (and then index) jobs of content this user uploaded, None for every job
+
+    Returns:
+        ProcessingReport: Jobs done, failed and queued for retry, and chunks written and indexed
+    """
+    report = ProcessingReport()
+    started = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while max_jobs is None or report.jobs < max_jobs:
+            # A couple of jobs per worker keeps every process busy while results are written
+            limit = workers * 2 if max_jobs is None else min(workers * 2, max_jobs - report.jobs)
+            jobs = claim_jobs(limit, uploader)
+            if not jobs:
+                break
+            tasks = []
+            for job in jobs:
+                path = source_path(job)
+                if path is None:
+                    fail_job(job, 'The file was deleted', retry=False)
+                    report.failed += 1
+                    continue
+                fd, spool = tempfile.mkstemp(suffix='.chunks')
+                os.close(fd)
+                args = (
+                    path,
+                    job.name,
+                    settings.FILE_PROCESSING_CHUNK_TOKENS,
+                    settings.FILE_PROCESSING_CHUNK_OVERLAP,
+                    spool,
+                )
+                tasks.append((job, spool, executor.submit(spool_chunks, *args) if executor else args))
+            finished = []
+            for job, spool, task in tasks:
+                try:
+                    stats = wait_for(job, task) if executor else spool_chunks(*task)
+                    written = finish_job(job, read_spool(spool))
+                except ExtractionError as exc:
+                    fail_job(job, str(exc), retry=False)
+                    report.failed += 1
+                except Exception as exc:
+                    logger.exception('Text extraction of %s (%s) failed', job.name, job.hash)
+                    if fail_job(job, f'{type(exc).__name__}: {exc}'):
+                        report.retried += 1
+                    else:
+                        report.failed += 1
+                else:
+                    if written:
+                        finished.append(job.id)
+                        report.done += 1
+                        report.chunks += stats.chunks
+                        report.tokens += stats.tokens
+                        report.bytes += stats.bytes
+                finally:
+                    os.remove(spool)
+            report.indexed += index_finished(finished)
+        # Uploads of content extracted earlier have no job to run, only text to index
+        if uploader is None:
+            report.indexed += index_finished()
+        else:
+            report.indexed += index_finished(
+                FileProcessingJob.objects.filter(uploaded_by(uploader)).values_list('id', flat=True)
+            )
+    finally:
+        if executor:
+            executor.shutdown()
+    report.seconds = time.perf_counter() - started
+    return report
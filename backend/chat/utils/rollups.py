@@ -0,0 +1,137 @@
+"""
+Daily rollups and retention for ``FileEventLog``.
+
+Raw events are compacted into ``FileEventDailyRollup`` rows (one per day, user, file and event type)
+for every completed day, and raw rows of days that are compacted and past retention are deleted in
+bounded batches. Analytics read the rollups, plus today's raw events which are not compacted yet.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from chat.models import FileEventDailyRollup, FileEventLog, FileUpload
+
+
+def day_start(day: date) -> datetime:
+    """Start of ``day`` in the current time zone; rollup days follow ``TIME_ZONE``."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def last_compacted_day() -> Optional[date]:
+    return FileEventDailyRollup.objects.aggregate(day=Max('day'))['day']
+
+
+def compact_file_events(since: date = None, lookback_days: int = 1) -> Tuple[int, int]:
+    """
+    Recompute the rollups of every completed day from ``since`` on.
+
+    Args:
+        since: First day to compact; defaults to ``lookback_days`` before the last compacted day,
+            so events flushed late for a compacted day are still counted
+        lookback_days: Already compacted days to recompute when ``since`` is not given
+
+    Returns:
+        Tuple[int, int]: Days compacted and rollup rows written
+    """
+    today = timezone.localdate()
+    if since is None:
+        last = last_compacted_day()
+        if last is not None:
+            since = last - timedelta(days=lookback_days)
+        else:
+            first = FileEventLog.objects.aggregate(first=Min('timestamp'))['first']
+            if first is None:
+                return 0, 0
+            since = timezone.localdate(first)
+
+    rows = (
+        FileEventLog.objects.filter(timestamp__gte=day_start(since), timestamp__lt=day_start(today))
+        .annotate(day=TruncDate('timestamp'))
+        .values('day', 'user_id', 'file_id', 'event_type')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    rollups = [FileEventDailyRollup(**row) for row in rows]
+    # Only days that still have raw events are replaced, so days already purged by retention keep their rollups
+    days = {rollup.day for rollup in rollups}
+    with transaction.atomic():
+        FileEventDailyRollup.objects.filter(day__in=days).delete()
+        FileEventDailyRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(days), len(rollups)
+
+
+def retention_cutoff(retain_days: int) -> Optional[datetime]:
+    """Raw events before this time may be deleted: past retention, and their day is compacted."""
+    last = last_compacted_day()
+    if last is None:
+        return None
+    retained_from = timezone.localdate() - timedelta(days=retain_days)
+    return day_start(min(retained_from, last + timedelta(days=1)))
+
+
+def purge_file_events(before: datetime, batch_size: int = 5000) -> int:
+    """
+    Delete raw events older than ``before``, ``batch_size`` rows per statement and transaction.
+
+    Small batches keep each delete short, so concurrent event writes never wait on a long lock.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            FileEventLog.objects.filter(timestamp__lt=before).order_by('timestamp').values_list('id', flat=True)[
+                :batch_size
+            ]
+        )
+        if not ids:
+            return deleted
+        deleted += FileEventLog.objects.filter(id__in=ids).delete()[0]
+
+
+def file_event_stats(user, days: int = 30, top: int = 10) -> Dict:
+    """
+    Event totals, a daily series and the most accessed files of ``user`` over the last ``days`` days.
+
+    Completed days come from the rollups, today from the raw table.
+    """
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+
+    daily = {}
+    files = {}
+    rollups = FileEventDailyRollup.objects.filter(user=user, day__gte=since, day__lt=today)
+    raw = (
+        FileEventLog.objects.filter(user=user, timestamp__gte=day_start(today))
+        .values('file_id', 'event_type')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for row in rollups.values('day', 'event_type').annotate(total=Sum('count')).order_by():
+        daily.setdefault(row['day'], {})[row['event_type']] = row['total']
+    for row in rollups.filter(event_type='access').values('file_id').annotate(total=Sum('count')).order_by():
+        files[row['file_id']] = row['total']
+    for row in raw:
+        counts = daily.setdefault(today, {})
+        counts[row['event_type']] = counts.get(row['event_type'], 0) + row['total']
+        if row['event_type'] == 'access':
+            files[row['file_id']] = files.get(row['file_id'], 0) + row['total']
+
+    totals = {}
+    for counts in daily.values():
+        for event_type, total in counts.items():
+            totals[event_type] = totals.get(event_type, 0) + total
+
+    top_files = sorted(((count, file_id) for file_id, count in files.items() if file_id), reverse=True)[:top]
+    names = dict(FileUpload.objects.filter(id__in=[file_id for _, file_id in top_files]).values_list('id', 'name'))
+    return {
+        'days': days,
+        'totals': totals,
+        'daily': [{'day': day, **daily[day]} for day in sorted(daily)],
+        'top_files': [
+            {'file_id': file_id, 'name': names.get(file_id), 'accesses': count} for count, file_id in top_files
+        ],
+    }
@@ -0,0 +1,185 @@
+"""
+Integrity scrub of the media store for the ``scrub_media`` command.
+
+Stored files are found with ``os.scandir`` and re-hashed on a thread pool from memory-mapped reads
+(``hashlib`` releases the GIL on large buffers, so threads hash in parallel). Every file is checked
+against the SHA-256 of the blob or upload that references it; files no row references are orphans.
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from chat.models import FileBlob, FileRemoval, FileUpload
+
+# Top-level MEDIA_ROOT directories holding stored files; dot-directories inside them are in-flight uploads
+STORE_DIRS = ('blobs', 'uploads')
+
+HASH_SLICE = 8 * 2**20
+
+
+class RateLimiter:
+    """Token bucket shared by the hashing threads, capping read throughput in bytes per second."""
+
+    def __init__(self, bytes_per_second: Optional[float]):
+        self.rate = bytes_per_second
+        self._allowance = bytes_per_second or 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate) - nbytes
+            self._last = now
+            delay = -self._allowance / self.rate if self._allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+@dataclass
+class ScrubReport:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    mismatched: List[Tuple[str, str, str]] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    orphans: List[str] = field(default_factory=list)
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 2**20 / self.seconds if self.seconds else 0.0
+
+
+def expected_hashes() -> Dict[str, str]:
+    """Storage name -> SHA-256 for every stored file a row references."""
+    expected = dict(FileBlob.objects.values_list('file', 'hash'))
+    # Uploads stored before the blob store, not folded into a blob
+    expected.update(FileUpload.objects.filter(blob__isnull=True).exclude(file='').values_list('file', 'hash'))
+    return expected
+
+
+def walk_store(root: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Yield ``(storage name, entry)`` for the files under the store directories, depth first."""
+    stack = [os.path.join(root, name) for name in STORE_DIRS]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield os.path.relpath(entry.path, root).replace(os.sep, '/'), entry
+        except FileNotFoundError:
+            continue
+
+
+def hash_file(path: str, limiter: RateLimiter = None) -> str:
+    """SHA-256 of a file read through ``mmap``, one slice at a time."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return hasher.hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for start in range(0, size, HASH_SLICE):
+                    chunk = view[start:start + HASH_SLICE]
+                    if limiter:
+                        limiter.acquire(len(chunk))
+                    hasher.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+    return hasher.hexdigest()
+
+
+def scrub_media(
+    workers: int = 4,
+    rate_limit: float = None,
+    grace_seconds: int = 86400,
+    delete_orphans: bool = True,
+    verify: bool = True,
+    root: str = None,
+) -> ScrubReport:
+    """
+    Check every stored file against its expected hash and collect missing files and orphans.
+
+    Args:
+        workers: Hashing threads
+        rate_limit: Maximum read throughput in bytes per second, None for unlimited
+        grace_seconds: Unreferenced files younger than this are left alone, they may be mid-upload
+        delete_orphans: Delete orphans past the grace period, otherwise only report them
+        verify: Re-hash referenced files; without it only presence and orphans are checked
+        root: Store root, ``MEDIA_ROOT`` by default
+
+    Returns:
+        ScrubReport: Counts, throughput and the problems found
+    """
+    root = str(root or settings.MEDIA_ROOT)
+    expected = expected_hashes()
+    pending_removal = set(FileRemoval.objects.values_list('path', flat=True))
+    limiter = RateLimiter(rate_limit)
+    report = ScrubReport()
+    seen = set()
+    lock = threading.Lock()
+    orphan_cutoff = time.time() - grace_seconds
+    started = time.perf_counter()
+
+    def check(name: str, path: str, digest: str):
+        try:
+            actual = hash_file(path, limiter)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            # Reaped since the walk found it
+            return
+        with lock:
+            report.files += 1
+            report.bytes += size
+            if actual != digest:
+                report.mismatched.append((name, digest, actual))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for name, entry in walk_store(root):
+            digest = expected.get(name)
+            if digest is None:
+                # Files queued for removal are the reaper's job
+                if name not in pending_removal and entry.stat().st_mtime < orphan_cutoff:
+                    report.orphans.append(name)
+                    if delete_orphans:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+                continue
+            seen.add(name)
+            if not verify:
+                report.files += 1
+                continue
+            # Bounded submission keeps memory flat however large the store is
+            if len(in_flight) >= workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(check, name, entry.path, digest))
+        for future in in_flight:
+            future.result()
+
+    report.missing = sorted(set(expected) - seen)
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,224 @@
+"""
+Full-text search index for conversations.
+
+SQLite (development) keeps an FTS5 virtual table, PostgreSQL (``DATABASE_URL``) keeps a
+``tsvector`` table with a GIN index. Rows are written per conversation from the model write
+paths, so searching never falls back to an ``icontains`` scan of the conversation table.
+"""
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from chat.models import Conversation, Message
+
+SQLITE_TABLE = "chat_conversation_fts"
+POSTGRES_TABLE = "chat_conversation_search"
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_availability = {}
+
+
+def get_search_config() -> str:
+    """Text search configuration used by PostgreSQL (stemming and stop words)."""
+    return getattr(settings, "SEARCH_CONFIG", "english")
+
+
+def is_fulltext_available() -> bool:
+    """Check (once per database) whether the configured database has the full-text index table."""
+    key = (connection.vendor, str(connection.settings_dict["NAME"]))
+    if key not in _availability:
+        if connection.vendor == "sqlite":
+            table = SQLITE_TABLE
+        elif connection.vendor == "postgresql":
+            table = POSTGRES_TABLE
+        else:
+            table = None
+        _availability[key] = table is not None and table in connection.introspection.table_names()
+    return _availability[key]
+
+
+def conversation_rowid(conversation_id) -> int:
+    """Stable 63-bit FTS5 rowid derived from the conversation UUID, so updates are keyed lookups."""
+    return conversation_id.int >> 65
+
+
+def build_document(conversation: Conversation) -> Tuple[str, str, str]:
+    """Return the (title, summary, body) triple indexed for a conversation."""
+    body = ""
+    if conversation.active_version_id:
+        body = "\n".join(
+            Message.objects.filter(version_id=conversation.active_version_id)
+            .order_by("created_at")
+            .values_list("content", flat=True)
+        )
+    return conversation.title or "", conversation.summary or "", body
+
+
+def _write_rows(rows: List[Tuple]) -> None:
+    """Upsert ``(conversation_id, title, summary, body)`` rows into the index."""
+    if not rows:
+        return
+    pk_field = Conversation._meta.pk
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {SQLITE_TABLE} (rowid, conversation_id, title, summary, body) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [
+                    (conversation_rowid(pk), pk_field.get_db_prep_value(pk, connection), title, summary, body)
+                    for pk, title, summary, body in rows
+                ],
+            )
+        else:
+            config = get_search_config()
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (conversation_id, document) VALUES (%s, "
+                "setweight(to_tsvector(%s, %s), 'A') || setweight(to_tsvector(%s, %s), 'B') || "
+                "setweight(to_tsvector(%s, %s), 'C')) "
+                "ON CONFLICT (conversation_id) DO UPDATE SET document = EXCLUDED.document",
+                [(pk, config, title, config, summary, config, body) for pk, title, summary, body in rows],
+            )
+
+
+def update_conversation_search_index(conversation: Conversation) -> None:
+    """Re-index a single conversation after it (or one of its messages) was written."""
+    if not is_fulltext_available():
+        return
+    _write_rows([(conversation.pk, *build_document(conversation))])
+
+
+def remove_conversation_search_index(conversation_ids: Iterable) -> None:
+    """Drop index rows for the given conversation ids."""
+    if not is_fulltext_available():
+        return
+    conversation_ids = list(conversation_ids)
+    if not conversation_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.executemany(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid = %s", [(conversation_rowid(pk),) for pk in conversation_ids]
+            )
+        else:
+            cursor.executemany(
+                f"DELETE FROM {POSTGRES_TABLE} WHERE conversation_id = %s", [(pk,) for pk in conversation_ids]
+            )
+
+
+def rebuild_search_index(queryset=None, batch_size: int = 2000, clear: bool = False) -> int:
+    """
+    (Re)index conversations in batches.
+
+    Args:
+        queryset: Conversations to index, all of them by default
+        batch_size: Number of conversations written per round trip
+        clear: Empty the index first, which also drops rows of conversations deleted in bulk
+
+    Returns:
+        int: Number of indexed conversations
+    """
+    if not is_fulltext_available():
+        return 0
+    if clear:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE if connection.vendor == 'sqlite' else POSTGRES_TABLE}")
+    if queryset is None:
+        queryset = Conversation.objects.all()
+
+    indexed = 0
+    batch = []
+    for row in queryset.order_by().values_list("pk", "title", "summary", "active_version_id").iterator(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            indexed += _index_batch(batch)
+            batch = []
+    indexed += _index_batch(batch)
+    return indexed
+
+
+def _index_batch(batch: List[Tuple]) -> int:
+    version_ids = [version_id for *_, version_id in batch if version_id]
+    bodies = {}
+    for version_id, content in (
+        Message.objects.filter(version_id__in=version_ids).order_by("created_at").values_list("version_id", "content")
+    ):
+        bodies.setdefault(version_id, []).append(content)
+    _write_rows(
+        [
+            (pk, title or "", summary or "", "\n".join(bodies.get(version_id, [])))
+            for pk, title, summary, version_id in batch
+        ]
+    )
+    return len(batch)
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Turn raw user input into a prefix query, so every keystroke matches partial words.
+
+    Terms are reduced to word characters, which keeps FTS5/tsquery syntax out of user input.
+    """
+    terms = TERM_RE.findall(text.lower())
+    if not terms:
+        return None
+    if connection.vendor == "sqlite":
+        return " ".join(f'"{term}"*' for term in terms)
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def apply_fulltext_search(queryset, text: str):
+    """
+    Restrict a conversation queryset to full-text matches and annotate ``search_rank`` (higher is better).
+    """
+    query = build_match_query(text)
+    if query is None:
+        return queryset
+    conversation_table = Conversation._meta.db_table
+    if connection.vendor == "sqlite":
+        return queryset.extra(
+            select={"search_rank": f"-{SQLITE_TABLE}.rank"},
+            tables=[SQLITE_TABLE],
+            where=[
+                f"{SQLITE_TABLE} MATCH %s",
+                f"{SQLITE_TABLE}.conversation_id = {conversation_table}.id",
+            ],
+            params=[query],
+        )
+    config = get_search_config()
+    return queryset.extra(
+        select={"search_rank": f"ts_rank({POSTGRES_TABLE}.document, to_tsquery(%s, %s))"},
+        select_params=[config, query],
+        tables=[POSTGRES_TABLE],
+        where=[
+            f"{POSTGRES_TABLE}.document @@ to_tsquery(%s, %s)",
+            f"{POSTGRES_TABLE}.conversation_id = {conversation_table}.id",
+        ],
+        params=[config, query],
+    )
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ``SearchFilter`` backed by the full-text index, ranked by relevance.
+
+    Place it after ``OrderingFilter``: results are ordered by rank unless the client asked
+    for an explicit ``ordering``. Falls back to ``icontains`` when the index is missing.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        if not is_fulltext_available():
+            return super().filter_queryset(request, queryset, view)
+
+        queryset = apply_fulltext_search(queryset, " ".join(search_terms))
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by("-search_rank", "-modified_at")
+        return queryset
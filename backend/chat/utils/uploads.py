@@ -0,0 +1,297 @@
+"""
+Upload handling for the file endpoints.
+
+Uploads are hashed while they stream in and are written once, into a staging directory on the
+same filesystem as ``MEDIA_ROOT``. Storage then only has to rename the file into place.
+
+Resumable uploads write each chunk by offset into a file preallocated in the session directory.
+Every chunk gets its own SHA-256 when it arrives; the whole-file digest is kept running in-process
+while chunks arrive in order, and completion only reads back whatever that running hash missed, as
+long as the chunks it covered were not rewritten since.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+def get_staging_dir() -> str:
+    """Directory for in-flight uploads, created on demand."""
+    path = os.path.join(settings.MEDIA_ROOT, settings.FILE_UPLOAD_STAGING_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    An upload already on disk in the staging directory, with its SHA-256 digest.
+
+    ``temporary_file_path`` lets ``FileSystemStorage`` move the file instead of copying it.
+    If the file was not moved by the time it is closed (e.g. a rejected duplicate), it is removed.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra=None, sha256=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    Stream each uploaded file to the staging directory while hashing it with SHA-256.
+
+    Replaces Django's memory and temporary-file handlers, so every byte is read from the request
+    once and written to disk once, and the digest is ready when the body ends.
+    """
+
+    chunk_size = 256 * 2**10
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = tempfile.NamedTemporaryFile(suffix=".upload", dir=get_staging_dir(), delete=False)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        return HashedUploadedFile(
+            self.file,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+            sha256=self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+
+def hash_uploaded_files(files: List[UploadedFile], workers: int = 4) -> List[str]:
+    """
+    SHA-256 of each uploaded file, in order.
+
+    Files that came through ``HashingFileUploadHandler`` already carry their digest; any others are
+    hashed concurrently on a thread pool (``hashlib`` releases the GIL while hashing large chunks).
+    """
+
+    def digest(file):
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        return hasher.hexdigest()
+
+    digests = [getattr(file, "sha256", None) for file in files]
+    missing = [i for i, value in enumerate(digests) if value is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+            for i, value in zip(missing, executor.map(digest, [files[i] for i in missing])):
+                digests[i] = value
+    return digests
+
+
+def get_session_dir() -> str:
+    """Directory for the files of resumable upload sessions, created on demand."""
+    path = os.path.join(settings.MEDIA_ROOT, settings.FILE_UPLOAD_SESSION_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_session_path(session) -> str:
+    return os.path.join(get_session_dir(), f"{session.id}.part")
+
+
+def preallocate(path: str, size: int):
+    """Create ``path`` with ``size`` bytes reserved, so chunks can be written at any offset."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        if size and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+class ChunkError(ValueError):
+    """A chunk body did not match its declared length or digest."""
+
+
+class RunningHashes:
+    """
+    Whole-file SHA-256 states of in-progress sessions, advanced while chunks arrive in order.
+
+    The state lives in this process only and is bounded. Besides the hasher it keeps the digest of
+    every chunk it consumed, so completion can tell from the ``UploadChunk`` rows whether a chunk was
+    rewritten since, possibly by another process that never saw this state.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, session_id, offset: int, length: int):
+        """
+        Take the hash state if ``offset`` is exactly where it stopped.
+
+        Returns ``(hasher, digests, token)`` or None. Writing over bytes already hashed, or being
+        hashed by another request, drops the state, since the digest could no longer match the file.
+        """
+        with self._lock:
+            hasher, position, digests, token = self._states.get(session_id, (None, 0, None, None))
+            if token is not None or position != offset:
+                if offset < position:
+                    del self._states[session_id]
+                return None
+            if hasher is None:
+                if offset != 0:
+                    return None
+                hasher, digests = hashlib.sha256(), []
+            token = object()
+            self._states[session_id] = (None, offset + length, None, token)
+            return hasher, digests, token
+
+    def release(self, session_id, token, hasher, position: int, digests: List[str]):
+        """Store the advanced state, unless it was dropped while the chunk was being written."""
+        with self._lock:
+            entry = self._states.get(session_id)
+            if entry is None or entry[3] is not token:
+                return
+            self._states[session_id] = (hasher, position, digests, None)
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def pop(self, session_id):
+        """
+        Remove and return ``(hasher, position, digests)``, where ``digests`` are the SHA-256 of the
+        chunks hashed so far; ``(None, 0, [])`` if there is no usable state.
+        """
+        with self._lock:
+            hasher, position, digests, token = self._states.pop(session_id, (None, 0, None, None))
+            if hasher is None or token is not None:
+                return None, 0, []
+            return hasher, position, digests
+
+
+running_hashes = RunningHashes()
+
+
+def write_chunk(session, offset: int, length: int, stream, expected_sha256: str = None) -> str:
+    """
+    Stream ``length`` bytes from ``stream`` into the session file at ``offset``.
+
+    Args:
+        session: The UploadSession being written
+        offset: Byte offset of the chunk
+        length: Expected chunk length in bytes
+        stream: File-like request body
+        expected_sha256: Digest the client declared for the chunk, if any
+
+    Returns:
+        str: SHA-256 hex digest of the chunk
+
+    Raises:
+        ChunkError: If the body is shorter or longer than ``length`` or does not match its digest
+    """
+    chunk_hasher = hashlib.sha256()
+    claim = running_hashes.claim(session.id, offset, length)
+    file_hasher = claim[0] if claim else None
+    fd = os.open(get_session_path(session), os.O_WRONLY)
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(HashingFileUploadHandler.chunk_size, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            chunk_hasher.update(data)
+            if file_hasher is not None:
+                file_hasher.update(data)
+            written += len(data)
+    finally:
+        os.close(fd)
+
+    digest = chunk_hasher.hexdigest()
+    if written != length or stream.read(1):
+        error = f"Expected {length} bytes at offset {offset}, received a body of a different length."
+    elif expected_sha256 and expected_sha256.lower() != digest:
+        error = f"Chunk at offset {offset} does not match its SHA-256."
+    else:
+        error = None
+    if error:
+        if claim:
+            running_hashes.pop(session.id)
+        raise ChunkError(error)
+    if claim:
+        running_hashes.release(session.id, claim[2], file_hasher, offset + written, [*claim[1], digest])
+    return digest
+
+
+def finish_session_hash(session) -> str:
+    """
+    Whole-file SHA-256 of a complete session, reading only the bytes the running hash missed.
+
+    The running state is only trusted if every chunk it consumed still has the digest recorded in
+    its ``UploadChunk`` row; a chunk rewritten since, by any process, means hashing the whole file.
+    """
+    hasher, offset, digests = running_hashes.pop(session.id)
+    if hasher is not None:
+        recorded = list(
+            session.chunks.filter(index__lt=len(digests)).order_by('index').values_list('sha256', flat=True)
+        )
+        if recorded != digests or offset > session.size:
+            hasher = None
+    if hasher is None:
+        hasher, offset = hashlib.sha256(), 0
+    with open(get_session_path(session), "rb") as file:
+        file.seek(offset)
+        for block in iter(lambda: file.read(2**20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def open_session_file(session, sha256: str) -> HashedUploadedFile:
+    """The assembled session file as an upload that storage can move into place."""
+    return HashedUploadedFile(
+        open(get_session_path(session), "rb"), session.name, None, session.size, None, sha256=sha256
+    )
+
+
+def discard_session_file(session):
+    running_hashes.pop(session.id)
+    try:
+        os.remove(get_session_path(session))
+    except FileNotFoundError:
+        pass
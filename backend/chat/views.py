@@ -1,23 +1,65 @@
+import errno
+import io
+import re
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework import generics, permissions, filters, status, serializers
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
-from .serializers import ConversationSummarySerializer, FileUploadSerializer
-from .models import Conversation, FileUpload, FileEventLog
+from .serializers import (
+    ConversationSummarySerializer,
+    DedupeProbeSerializer,
+    FileProcessingJobSerializer,
+    FileUploadSerializer,
+    UploadSessionSerializer,
+)
+from .models import Conversation, FileProcessingJob, FileUpload, FileEventLog, UploadChunk, UploadSession
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import BasePermission
 from rest_framework.views import APIView
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 
 from chat.models import Conversation, Message, Version
+from chat.pagination import CountFreePagination, EstimatedCountPagination
+from chat.rag.answer import passage_budget, stream_answer
+from chat.rag.retrieval import RETRIEVAL_MODES, cached_retrieve
 from chat.serializers import ConversationSerializer, MessageSerializer, TitleSerializer, VersionSerializer
+from chat.utils.audit import audit_log
+from chat.utils.blobs import (
+    acquire_blob,
+    acquire_blobs,
+    check_possession,
+    possession_challenge,
+    release_blob,
+    stored_blobs_atomic,
+)
 from chat.utils.branching import make_branched_conversation
+from chat.utils.cache import ALL_USERS, VersionedCacheMixin, bump_file_cache_version
+from chat.utils.deletion import revive_upload, soft_delete_uploads
+from chat.utils.downloads import serve_upload, stream_zip
+from chat.utils.processing import enqueue_processing, queue_uploads
+from chat.utils.rollups import file_event_stats
+from chat.utils.search import FullTextSearchFilter
+from chat.utils.uploads import (
+    ChunkError,
+    HashingFileUploadHandler,
+    hash_uploaded_files,
+    discard_session_file,
+    finish_session_hash,
+    get_session_path,
+    open_session_file,
+    preallocate,
+    write_chunk,
+)
+from src.utils.gpt import GPT_VERSIONS
 
 
 @api_view(["GET"])
@@ -243,25 +285,23 @@ def version_add_message(request, pk):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-@method_decorator(cache_page(60), name='dispatch')
-class ConversationSummaryListView(generics.ListAPIView):
+class ConversationSummaryListView(VersionedCacheMixin, generics.ListAPIView):
     """
     API endpoint to retrieve conversation summaries with pagination and filtering.
     Supports filtering by user, title, and modified_at.
+    Search uses the full-text index and is ordered by relevance unless `ordering` is given.
+    Responses are cached per requesting user and query, and invalidated by conversation writes.
     """
+    cache_prefix = 'conversation-summaries'
+
     serializer_class = ConversationSummarySerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['user', 'title']
     search_fields = ['title', 'summary']
     ordering_fields = ['modified_at', 'title']
     ordering = ['-modified_at']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CountFreePagination
 
     def get_queryset(self):
         qs = Conversation.objects.all()
@@ -270,34 +310,64 @@ class ConversationSummaryListView(generics.ListAPIView):
             qs = qs.filter(user__id=user)
         return qs
 
+    def get_cache_scopes(self):
+        user = self.request.query_params.get('user')
+        return [user] if user else [ALL_USERS]
+
 class FileUploadPermission(BasePermission):
     """Allow only certain roles to upload/manage files."""
     allowed_roles = ["admin", "user", "moderator", "superadmin"]
     def has_permission(self, request, view):
         return request.user.is_authenticated and getattr(request.user, 'role', None) in self.allowed_roles
 
-class FileUploadView(generics.CreateAPIView):
+class HashingUploadMixin:
+    """Hash uploads while they stream to disk, so the body is read and written only once."""
+    parser_classes = [MultiPartParser, FormParser]
+
+    def initial(self, request, *args, **kwargs):
+        # Must be set before anything (e.g. the CSRF check) parses the body
+        request.upload_handlers = [HashingFileUploadHandler(request._request)]
+        super().initial(request, *args, **kwargs)
+
+class FileUploadView(HashingUploadMixin, generics.CreateAPIView):
     """
     API endpoint for file upload with duplication check.
+    The upload is hashed while it streams to disk, so the body is read and written only once.
     """
     serializer_class = FileUploadSerializer
     permission_classes = [FileUploadPermission]
-    parser_classes = [MultiPartParser, FormParser]
 
     def perform_create(self, serializer):
         uploaded_file = self.request.FILES['file']
-        file_hash = self._calculate_hash(uploaded_file)
+        file_hash = getattr(uploaded_file, 'sha256', None) or self._calculate_hash(uploaded_file)
         # Check for duplicate
-        if FileUpload.objects.filter(hash=file_hash, uploader=self.request.user).exists():
+        if FileUpload.objects.filter(hash=file_hash, uploader=self.request.user, deleted_at__isnull=True).exists():
+            raise serializers.ValidationError('Duplicate file upload detected.')
+        revived = revive_upload(self.request.user, file_hash, uploaded_file.name)
+        if revived is not None:
+            # Deleted but not reaped yet: the stored bytes are still referenced
+            serializer.instance = revived
+            FileEventLog.objects.create(event_type="upload", file=revived, user=self.request.user)
+            return
+        try:
+            with stored_blobs_atomic():
+                # Identical content is stored once and shared between uploads
+                blob = acquire_blob(file_hash, uploaded_file)
+                instance = serializer.save(
+                    uploader=self.request.user,
+                    name=uploaded_file.name,
+                    size=uploaded_file.size,
+                    hash=file_hash,
+                    blob=blob,
+                    file=blob.file.name
+                )
+        except IntegrityError:
+            # A concurrent upload of the same content by this user committed first; the rollback
+            # gave back the blob reference taken above
             raise serializers.ValidationError('Duplicate file upload detected.')
-        instance = serializer.save(
-            uploader=self.request.user,
-            name=uploaded_file.name,
-            size=uploaded_file.size,
-            hash=file_hash
-        )
         # Log upload event
         FileEventLog.objects.create(event_type="upload", file=instance, user=self.request.user)
+        queue_uploads([instance])
 
     def _calculate_hash(self, file):
         import hashlib
@@ -307,6 +377,320 @@ class FileUploadView(generics.CreateAPIView):
         file.seek(0)
         return hasher.hexdigest()
 
+
+class FileBatchUploadView(HashingUploadMixin, APIView):
+    """
+    API endpoint to upload many files in one multipart request.
+    POST: any number of "files" parts (up to FILE_UPLOAD_BATCH_MAX_FILES)
+    Returns: {"results": [{"name": ..., "status": "created" | "revived" | "duplicate", "file": {...}}]},
+    in request order
+    """
+    permission_classes = [FileUploadPermission]
+
+    def post(self, request):
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({"error": "No files were sent in the 'files' field."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > settings.FILE_UPLOAD_BATCH_MAX_FILES:
+            return Response(
+                {"error": f"At most {settings.FILE_UPLOAD_BATCH_MAX_FILES} files per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        digests = hash_uploaded_files(files)
+
+        # One query resolves duplicates for the whole batch
+        existing = {
+            upload.hash: upload
+            for upload in FileUpload.objects.filter(uploader=request.user, hash__in=set(digests))
+            .select_related('uploader')
+        }
+        now = timezone.now()
+        statuses, new, revived = [], {}, {}
+        for file, file_hash in zip(files, digests):
+            if file_hash in new or file_hash in revived:
+                statuses.append('duplicate')
+            elif file_hash not in existing:
+                new[file_hash] = file
+                statuses.append('created')
+            elif existing[file_hash].deleted_at is not None:
+                # Deleted but not reaped yet: the stored bytes are still referenced
+                upload = revived[file_hash] = existing[file_hash]
+                upload.name, upload.deleted_at, upload.uploaded_at = file.name, None, now
+                statuses.append('revived')
+            else:
+                statuses.append('duplicate')
+
+        with stored_blobs_atomic():
+            FileUpload.objects.bulk_update(revived.values(), ['name', 'deleted_at', 'uploaded_at'])
+            blobs = acquire_blobs(new)
+            pending = [
+                FileUpload(
+                    uploader=request.user,
+                    name=file.name,
+                    size=file.size,
+                    hash=file_hash,
+                    blob=blobs[file_hash],
+                    file=blobs[file_hash].file.name,
+                )
+                for file_hash, file in new.items()
+            ]
+            try:
+                with transaction.atomic():
+                    created = FileUpload.objects.bulk_create(pending)
+            except IntegrityError:
+                # Some of the content was uploaded by a concurrent request since the lookup above
+                created = self._create_one_by_one(pending, existing)
+            FileEventLog.objects.bulk_create(
+                FileEventLog(event_type="upload", file=upload, user=request.user, timestamp=now)
+                for upload in [*created, *revived.values()]
+            )
+            queue_uploads(created)
+            if created or revived:
+                # Bulk writes send no signals
+                bump_file_cache_version(request.user.pk)
+
+        created_hashes = {upload.hash for upload in created}
+        statuses = [
+            'duplicate' if file_status == 'created' and file_hash not in created_hashes else file_status
+            for file_hash, file_status in zip(digests, statuses)
+        ]
+        uploads = {**existing, **{upload.hash: upload for upload in created}}
+        results = [
+            {"name": file.name, "status": file_status, "file": FileUploadSerializer(uploads[file_hash]).data}
+            for file, file_hash, file_status in zip(files, digests, statuses)
+        ]
+        code = status.HTTP_201_CREATED if created or revived else status.HTTP_200_OK
+        return Response({"results": results}, status=code)
+
+    def _create_one_by_one(self, pending, existing):
+        """Insert uploads one at a time; one that lost the race gives back its blob reference."""
+        created = []
+        for upload in pending:
+            try:
+                with transaction.atomic():
+                    created.extend(FileUpload.objects.bulk_create([upload]))
+            except IntegrityError:
+                release_blob(upload.blob_id)
+                existing[upload.hash] = FileUpload.objects.get(uploader=upload.uploader, hash=upload.hash)
+        return created
+
+
+class FileDedupeProbeView(APIView):
+    """
+    API endpoint to check for content before uploading it.
+    POST: {"hash": "<sha256>", "size": 123, "name": "..."}
+    Returns {"exists": false} when the bytes must be uploaded. Otherwise returns
+    {"exists": true, "created": ..., "file": {...}}, where created means a FileUpload was linked to
+    already stored content without any bytes being sent.
+    In global scope, content the user does not own is only linked with proof of possession: the first
+    answer carries {"challenge": {"token", "offset", "length"}}, and the probe is repeated with
+    "challenge": token and "proof": the SHA-256 of those bytes of the file.
+    """
+    permission_classes = [FileUploadPermission]
+
+    def post(self, request):
+        serializer = DedupeProbeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_hash, size, name = (serializer.validated_data[k] for k in ('hash', 'size', 'name'))
+
+        existing = FileUpload.objects.filter(hash=file_hash, uploader=request.user, deleted_at__isnull=True).first()
+        if existing is not None:
+            return Response({"exists": True, "created": False, "file": FileUploadSerializer(existing).data})
+        instance = revive_upload(request.user, file_hash, name)
+        if instance is not None:
+            FileEventLog.objects.create(event_type="upload", file=instance, user=request.user, extra="dedupe probe")
+            return Response(
+                {"exists": True, "created": True, "file": FileUploadSerializer(instance).data},
+                status=status.HTTP_201_CREATED,
+            )
+        if settings.FILE_DEDUPE_PROBE_SCOPE != 'global':
+            return Response({"exists": False})
+        challenge, proof = serializer.validated_data.get('challenge'), serializer.validated_data.get('proof')
+        if not (challenge and proof):
+            # Issued whether or not the content is stored, so the probe is no existence oracle
+            return Response({"exists": False, "challenge": possession_challenge(request.user.pk, file_hash, size)})
+        if not check_possession(request.user.pk, file_hash, size, challenge, proof):
+            return Response({"exists": False})
+
+        try:
+            with transaction.atomic():
+                # Takes a reference only if the content is still stored
+                blob = acquire_blob(file_hash)
+                if blob is None:
+                    return Response({"exists": False})
+                instance = FileUpload.objects.create(
+                    uploader=request.user, name=name, size=blob.size, hash=file_hash, blob=blob, file=blob.file.name
+                )
+        except IntegrityError:
+            # A concurrent upload or probe of the same content by this user won
+            existing = FileUpload.objects.get(hash=file_hash, uploader=request.user)
+            return Response({"exists": True, "created": False, "file": FileUploadSerializer(existing).data})
+        FileEventLog.objects.create(event_type="upload", file=instance, user=request.user, extra="dedupe probe")
+        return Response(
+            {"exists": True, "created": True, "file": FileUploadSerializer(instance).data},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class InsufficientStorage(APIException):
+    status_code = status.HTTP_507_INSUFFICIENT_STORAGE
+    default_detail = 'Not enough storage space for this upload.'
+    default_code = 'insufficient_storage'
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """
+    API endpoint to start a resumable upload.
+    POST: {"name": "...", "size": 123, "chunk_size": 8388608 (optional), "sha256": "..." (optional)}
+    Returns the session, whose file is preallocated so chunks can be PUT by offset in any order.
+    A user holds at most FILE_UPLOAD_MAX_OPEN_SESSIONS sessions and FILE_UPLOAD_MAX_OPEN_SESSION_BYTES
+    reserved bytes; a full disk returns 507.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [FileUploadPermission]
+
+    def perform_create(self, serializer):
+        sha256 = serializer.validated_data.get('sha256')
+        live = FileUpload.objects.filter(uploader=self.request.user, deleted_at__isnull=True)
+        if sha256 and live.filter(hash=sha256).exists():
+            raise serializers.ValidationError('Duplicate file upload detected.')
+        open_sessions = UploadSession.objects.filter(uploader=self.request.user).aggregate(
+            count=Count('id'), size=Sum('size')
+        )
+        if open_sessions['count'] >= settings.FILE_UPLOAD_MAX_OPEN_SESSIONS:
+            raise serializers.ValidationError(
+                f'At most {settings.FILE_UPLOAD_MAX_OPEN_SESSIONS} uploads can be in progress at once.'
+            )
+        reserved = (open_sessions['size'] or 0) + serializer.validated_data['size']
+        if reserved > settings.FILE_UPLOAD_MAX_OPEN_SESSION_BYTES:
+            raise serializers.ValidationError(
+                f'Uploads in progress can reserve at most {settings.FILE_UPLOAD_MAX_OPEN_SESSION_BYTES} bytes.'
+            )
+        session = serializer.save(uploader=self.request.user)
+        try:
+            preallocate(get_session_path(session), session.size)
+        except OSError as e:
+            discard_session_file(session)
+            session.delete()
+            if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                raise InsufficientStorage()
+            raise
+
+
+class UploadSessionView(APIView):
+    """
+    API endpoint for one resumable upload session.
+    GET: status, including received and missing chunk indexes
+    PUT: raw chunk bytes, placed by a "Content-Range: bytes start-end/total" header or ?offset=;
+         an optional X-Chunk-SHA256 header is verified before the chunk is accepted
+    DELETE: abort the upload
+    """
+    permission_classes = [FileUploadPermission]
+
+    def get_object(self, id):
+        return generics.get_object_or_404(UploadSession, id=id, uploader=self.request.user)
+
+    def get(self, request, id):
+        return Response(UploadSessionSerializer(self.get_object(id)).data)
+
+    def put(self, request, id):
+        session = self.get_object(id)
+        offset = self._get_offset(request)
+        if offset is None or offset < 0 or offset >= session.size or offset % session.chunk_size:
+            return Response(
+                {"error": f"Offset must be a multiple of the chunk size ({session.chunk_size}) below {session.size}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        index = offset // session.chunk_size
+        length = session.chunk_length(index)
+        if request.META.get('CONTENT_LENGTH') not in (None, '', str(length)):
+            return Response({"error": f"Chunk {index} must be {length} bytes."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            digest = write_chunk(
+                session, offset, length, request.stream or io.BytesIO(), request.headers.get('X-Chunk-SHA256')
+            )
+        except ChunkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OSError as e:
+            if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                raise InsufficientStorage()
+            raise
+        UploadChunk.objects.update_or_create(session=session, index=index, defaults={'size': length, 'sha256': digest})
+        session.save(update_fields=['updated_at'])
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, id):
+        session = self.get_object(id)
+        discard_session_file(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _get_offset(self, request):
+        content_range = request.headers.get('Content-Range')
+        value = request.query_params.get('offset')
+        if content_range:
+            match = re.fullmatch(r'bytes (\d+)-\d+/(\d+|\*)', content_range.strip())
+            value = match.group(1) if match else None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+
+class UploadSessionCompleteView(APIView):
+    """
+    API endpoint to finish a resumable upload once every chunk has arrived.
+    POST: {}
+    Returns the created file, stored through the blob store like a single-request upload.
+    """
+    permission_classes = [FileUploadPermission]
+
+    def post(self, request, id):
+        with stored_blobs_atomic():
+            # Lock the session so concurrent completions cannot both store the file
+            session = generics.get_object_or_404(
+                UploadSession.objects.select_for_update(), id=id, uploader=request.user
+            )
+            received = session.chunks.values_list('index', 'size')
+            if len(received) != session.chunk_count or sum(size for _, size in received) != session.size:
+                return Response(
+                    {"error": "Upload is incomplete.", **UploadSessionSerializer(session).data},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            file_hash = finish_session_hash(session)
+            if session.sha256 and session.sha256 != file_hash:
+                return Response(
+                    {"error": "Uploaded bytes do not match the declared SHA-256.", "sha256": file_hash},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if FileUpload.objects.filter(hash=file_hash, uploader=request.user, deleted_at__isnull=True).exists():
+                discard_session_file(session)
+                session.delete()
+                return Response({"error": "Duplicate file upload detected."}, status=status.HTTP_400_BAD_REQUEST)
+
+            instance = revive_upload(request.user, file_hash, session.name)
+            if instance is None:
+                content = open_session_file(session, file_hash)
+                try:
+                    blob = acquire_blob(file_hash, content, session.size)
+                finally:
+                    content.close()
+                instance = FileUpload.objects.create(
+                    uploader=request.user,
+                    name=session.name,
+                    size=session.size,
+                    hash=file_hash,
+                    blob=blob,
+                    file=blob.file.name,
+                )
+            discard_session_file(session)
+            session.delete()
+        FileEventLog.objects.create(event_type="upload", file=instance, user=request.user)
+        queue_uploads([instance])
+        return Response(FileUploadSerializer(instance).data, status=status.HTTP_201_CREATED)
+
 class FileListView(generics.ListAPIView):
     """
     API endpoint to list uploaded files with metadata.
@@ -318,18 +702,81 @@ class FileListView(generics.ListAPIView):
     search_fields = ['name']
     ordering_fields = ['uploaded_at', 'name', 'size']
     ordering = ['-uploaded_at']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
 
     def get_queryset(self):
-        return FileUpload.objects.filter(uploader=self.request.user)
+        return FileUpload.objects.filter(uploader=self.request.user, deleted_at__isnull=True).select_related('uploader')
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
-        # Log access for each file in the result
-        for file in self.get_queryset():
-            FileEventLog.objects.create(event_type="access", file=file, user=request.user)
+        # Log access for the files actually returned; written in one batch after the response is sent
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        audit_log.log_many([
+            FileEventLog(event_type="access", file_id=file['id'], user=request.user, timestamp=timezone.now())
+            for file in results
+        ])
+        return response
+
+class FileDownloadView(APIView):
+    """
+    API endpoint to download an uploaded file.
+    GET: supports Range (single range), If-Range and If-None-Match; the ETag is the file's SHA-256
+    """
+    permission_classes = [FileUploadPermission]
+
+    def get(self, request, id):
+        upload = generics.get_object_or_404(FileUpload, id=id, uploader=request.user, deleted_at__isnull=True)
+        response = serve_upload(request, upload)
+        if response.status_code in (200, 206):
+            audit_log.log('access', upload.id, request.user.id, extra=response.get('Content-Range', 'download'))
         return response
 
+class FileExportView(APIView):
+    """
+    API endpoint to download several uploaded files as one ZIP archive, streamed as it is built.
+    GET: ?ids=1,2,3 (all of the user's files when omitted)
+    """
+    permission_classes = [FileUploadPermission]
+
+    def get(self, request):
+        uploads = FileUpload.objects.filter(uploader=request.user, deleted_at__isnull=True).order_by('uploaded_at')
+        if request.query_params.get('ids'):
+            try:
+                ids = [int(file_id) for file_id in request.query_params['ids'].split(',')]
+            except ValueError:
+                return Response({"error": "ids must be comma-separated integers"}, status=status.HTTP_400_BAD_REQUEST)
+            uploads = uploads.filter(id__in=ids)
+        # Only the metadata is held in memory; file contents are streamed one chunk at a time
+        uploads = list(uploads.only('id', 'name', 'file', 'size', 'uploaded_at'))
+        if not uploads:
+            return Response({"error": "No files to export"}, status=status.HTTP_404_NOT_FOUND)
+
+        now = timezone.now()
+        audit_log.log_many([
+            FileEventLog(event_type="access", file_id=upload.id, user=request.user, extra="export", timestamp=now)
+            for upload in uploads
+        ])
+        response = StreamingHttpResponse(stream_zip(uploads), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="files-{timezone.localdate():%Y%m%d}.zip"'
+        return response
+
+class FileEventStatsView(APIView):
+    """
+    API endpoint for the user's file activity, read from the daily rollups.
+    GET: ?days=30 (1-365)
+    Returns: {"days": 30, "totals": {...}, "daily": [{"day": ..., "access": ...}], "top_files": [...]}
+    """
+    permission_classes = [FileUploadPermission]
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 365:
+            return Response({"error": "days must be between 1 and 365"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(file_event_stats(request.user, days))
+
 class FileDeleteView(generics.DestroyAPIView):
     """
     API endpoint to delete an uploaded file.
@@ -339,36 +786,129 @@ class FileDeleteView(generics.DestroyAPIView):
     lookup_field = 'id'
 
     def get_queryset(self):
-        return FileUpload.objects.filter(uploader=self.request.user)
+        return FileUpload.objects.filter(uploader=self.request.user, deleted_at__isnull=True)
 
     def perform_destroy(self, instance):
-        FileEventLog.objects.create(event_type="delete", file=instance, user=self.request.user)
-        super().perform_destroy(instance)
+        # Soft delete like the bulk endpoint: the reaper releases the blob, and re-uploading revives the row until then
+        soft_delete_uploads(self.request.user, [instance.id])
 
-class RAGQueryView(APIView):
+
+class FileBulkDeleteView(APIView):
     """
-    API endpoint for Retrieval-Augmented Generation (RAG) queries.
-    POST: {"query": "..."}
-    Returns: {"answer": "..."}
+    API endpoint to delete many uploaded files at once.
+    POST: {"ids": [1, 2, 3]}
+    Returns: {"deleted": [...], "not_found": [...]}
     """
     permission_classes = [FileUploadPermission]
+    max_ids = 1000
+
     def post(self, request):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or len(ids) > self.max_ids:
+            return Response(
+                {"error": f"ids must be a list of 1 to {self.max_ids} file ids"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = {int(file_id) for file_id in ids}
+        except (TypeError, ValueError):
+            return Response({"error": "ids must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        deleted = soft_delete_uploads(request.user, ids)
+        return Response({"deleted": sorted(deleted), "not_found": sorted(ids.difference(deleted))})
+
+class RAGQueryView(APIView):
+    """
+    API endpoint for Retrieval-Augmented Generation (RAG) queries over the text of the user's files.
+    POST: {"query": "...", "top_k": 5, "mode": "lexical" | "dense" | "hybrid", "dedupe": false}
+    Returns: {"answer": "<best matching passage>", "results": [{"chunk_id", "score", "text", "file_ids", ...}]}
+    Repeated queries are served from a cache that uploads, deletes and index updates invalidate.
+    """
+    permission_classes = [FileUploadPermission]
+
+    def parse(self, request):
+        """The retrieval options of the request, or a 400 response."""
         query = request.data.get('query')
-        answer = f"[RAG answer for query: {query}]"
-        return Response({"answer": answer})
+        if not isinstance(query, str) or not query.strip():
+            return Response({"error": "query is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = int(request.data.get('top_k', settings.RAG_TOP_K))
+        except (TypeError, ValueError):
+            top_k = 0
+        if not 1 <= top_k <= settings.RAG_MAX_TOP_K:
+            return Response(
+                {"error": f"top_k must be between 1 and {settings.RAG_MAX_TOP_K}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        mode = request.data.get('mode', settings.RAG_DEFAULT_MODE)
+        if mode not in RETRIEVAL_MODES:
+            return Response(
+                {"error": f"mode must be one of {', '.join(RETRIEVAL_MODES)}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        dedupe = request.data.get('dedupe', False) in (True, 'true', '1')
+        return {"query": query, "k": top_k, "mode": mode, "dedupe": dedupe}
+
+    def post(self, request):
+        options = self.parse(request)
+        if isinstance(options, Response):
+            return options
+        results = cached_retrieve(request.user, **options)
+        return Response({"answer": results[0]["text"] if results else "", "results": results})
+
+
+class RAGAnswerView(RAGQueryView):
+    """
+    API endpoint streaming a GPT answer to a question about the user's files, as server-sent events.
+    POST: the body of rag-query, plus {"model": "gpt35"} (a key of GPT_VERSIONS)
+    Returns: a "citations" event with the results the prompt holds, numbered from 1 as the answer cites
+    them, then "token" events as the model writes, then "done" (or "error" if the model fails)
+    """
+    def parse(self, request):
+        options = super().parse(request)
+        if isinstance(options, Response):
+            return options
+        model = request.data.get('model', settings.RAG_ANSWER_MODEL)
+        if model not in GPT_VERSIONS:
+            return Response(
+                {"error": f"model must be one of {', '.join(GPT_VERSIONS)}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if passage_budget(model, options["query"]) <= 0:
+            return Response({"error": f"query is too long for {model}"}, status=status.HTTP_400_BAD_REQUEST)
+        return {**options, "model": model}
+
+    def post(self, request):
+        options = self.parse(request)
+        if isinstance(options, Response):
+            return options
+        response = StreamingHttpResponse(stream_answer(request.user, **options), content_type='text/event-stream')
+        # Proxies must pass events on as they come
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class FileProcessView(APIView):
     """
-    API endpoint to process an uploaded file (e.g., extract text, preview, etc.).
+    API endpoint to queue text extraction of an uploaded file, run in the background by process_files.
+    Extraction is per content, so uploads of the same bytes share one job.
     POST: {}
-    Returns: {"result": "..."}
+    Returns: the job, 202 while it is pending or 200 once done; poll it at file-process-job
     """
     permission_classes = [FileUploadPermission]
     def post(self, request, id):
         try:
-            file = FileUpload.objects.get(id=id, uploader=request.user)
+            file = FileUpload.objects.get(id=id, uploader=request.user, deleted_at__isnull=True)
         except FileUpload.DoesNotExist:
             return Response({"error": "File not found"}, status=404)
-        # Stub: Replace with actual file processing logic
-        result = f"[Processed file: {file.name}]"
-        return Response({"result": result})
+        job, _ = enqueue_processing(file)
+        response_status = status.HTTP_200_OK if job.status == FileProcessingJob.DONE else status.HTTP_202_ACCEPTED
+        return Response(FileProcessingJobSerializer(job).data, status=response_status)
+
+
+class FileProcessingJobView(generics.RetrieveAPIView):
+    """
+    API endpoint to poll a text extraction job of one of the user's files.
+    """
+    serializer_class = FileProcessingJobSerializer
+    permission_classes = [FileUploadPermission]
+    lookup_field = 'id'
+
+    def get_queryset(self):
+        hashes = FileUpload.objects.filter(uploader=self.request.user, deleted_at__isnull=True).values('hash')
+        return FileProcessingJob.objects.filter(hash__in=hashes)
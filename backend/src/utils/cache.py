@@ -0,0 +1,242 @@
+"""
+Two-tier cache: a bounded in-process LRU in front of the shared Django cache.
+
+The shared tier is ``CACHES[alias]`` (a file-based store on one host, Redis when ``REDIS_URL``
+is set), so every worker process sees the same entries. The local tier only keeps entries for a
+short time, which bounds how long a process may serve a value another process has replaced;
+mutable entries such as version counters should be read with ``local=False``.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+_MISSING = object()
+
+
+@dataclass
+class CacheMetrics:
+    local_hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    computes: int = 0
+    lock_waits: int = 0
+    evictions: int = 0
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry expiry, bounded by number of entries."""
+
+    def __init__(self, max_entries: int, on_evict: Optional[Callable] = None):
+        self.max_entries = max_entries
+        self._on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return _MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                if self._on_evict:
+                    self._on_evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Read-through cache with single-flight computation and TTL jitter.
+
+    Args:
+        alias: Django cache alias used as the shared tier
+        local_max_entries: Capacity of the in-process LRU
+        local_timeout: Upper bound in seconds for how long an entry lives in the LRU
+        jitter: Relative TTL jitter (0.1 means +-10%), so entries written together do not expire together
+        lock_timeout: Seconds a computing caller may hold the shared stampede lock
+    """
+
+    poll_interval = 0.05
+
+    def __init__(
+        self,
+        alias: str = "default",
+        local_max_entries: int = 1024,
+        local_timeout: float = 30,
+        jitter: float = 0.1,
+        lock_timeout: float = 10,
+    ):
+        self.alias = alias
+        self.local_timeout = local_timeout
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.metrics = CacheMetrics()
+        self._metrics_lock = threading.Lock()
+        self.local = LRUCache(local_max_entries, on_evict=lambda: self._count("evictions"))
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, name: str) -> None:
+        with self._metrics_lock:
+            setattr(self.metrics, name, getattr(self.metrics, name) + 1)
+
+    def _jittered(self, timeout: Optional[float]) -> Optional[int]:
+        if timeout is None:
+            return None
+        return max(1, int(timeout * (1 + random.uniform(-self.jitter, self.jitter))))
+
+    def _local_ttl(self, timeout: Optional[float]) -> float:
+        return self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+
+    def get(self, key: str, default=None, local: bool = True):
+        value = self._lookup(key, local)
+        return default if value is _MISSING else value
+
+    def _lookup(self, key: str, local: bool, count: bool = True):
+        if local:
+            value = self.local.get(key)
+            if value is not _MISSING:
+                if count:
+                    self._count("local_hits")
+                return value
+        value = self.shared.get(key, _MISSING)
+        if value is _MISSING:
+            if count:
+                self._count("misses")
+            return _MISSING
+        if count:
+            self._count("shared_hits")
+        if local:
+            self.local.set(key, value, self.local_timeout)
+        return value
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None, local: bool = True) -> None:
+        timeout = self._jittered(timeout)
+        self.shared.set(key, value, timeout)
+        if local:
+            self.local.set(key, value, self._local_ttl(timeout))
+
+    def add(self, key: str, value: Any, timeout: Optional[float] = None) -> bool:
+        """Set ``key`` in the shared tier only if it is absent; usable as a cross-process lock."""
+        return self.shared.add(key, value, timeout)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def incr(self, key: str, initial: Callable[[], int] = lambda: 1) -> int:
+        """Increment a shared counter, creating it with ``initial()`` when missing."""
+        self.local.delete(key)
+        try:
+            return self.shared.incr(key)
+        except ValueError:
+            value = initial()
+            if not self.shared.add(key, value, None):
+                return self.shared.incr(key)
+            return value
+
+    def clear(self) -> None:
+        self.local.clear()
+        self.shared.clear()
+
+    @contextmanager
+    def _local_lock(self, key: str):
+        """Per-key lock shared by the threads of this process, dropped once nobody waits on it."""
+        with self._key_locks_guard:
+            lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._key_locks_guard:
+                lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (lock, waiters - 1)
+
+    def get_or_compute(self, key: str, compute: Callable, timeout: Optional[float] = None, local: bool = True):
+        """
+        Return the cached value for ``key``, computing and storing it once when missing.
+
+        Threads of one process queue on a local lock; other processes wait on a lock entry in the
+        shared tier and poll for the value instead of recomputing it.
+        """
+        value = self._lookup(key, local)
+        if value is not _MISSING:
+            return value
+
+        with self._local_lock(key):
+            value = self._lookup(key, local, count=False)
+            if value is not _MISSING:
+                return value
+
+            lock_key = f"{key}:lock"
+            if self.add(lock_key, 1, self.lock_timeout):
+                try:
+                    self._count("computes")
+                    value = compute()
+                    self.set(key, value, timeout, local=local)
+                finally:
+                    self.shared.delete(lock_key)
+                return value
+
+            self._count("lock_waits")
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = self.shared.get(key, _MISSING)
+                if value is not _MISSING:
+                    if local:
+                        self.local.set(key, value, self._local_ttl(timeout))
+                    return value
+            # The lock holder died or is too slow, do not keep the caller waiting any longer
+            self._count("computes")
+            return compute()
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            stats = asdict(self.metrics)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["local_hits"] + stats["shared_hits"]) / lookups, 4) if lookups else None
+        stats["local_entries"] = len(self.local)
+        return stats
+
+
+cache = SimpleLazyObject(lambda: TwoTierCache(**getattr(settings, "TWO_TIER_CACHE", {})))
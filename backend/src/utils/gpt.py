@@ -11,18 +11,22 @@ GPT_40_PARAMS = dict(
     stream=False,
 )
 
+SYSTEM_PROMPT = "You are a helpful assistant."
+
 
 @dataclass
 class GPTVersion:
     name: str
     engine: str
+    # Tokens the prompt and the answer share
+    context_window: int
 
 
 GPT_VERSIONS = {
-    "gpt35": GPTVersion("gpt35", "gpt-35-turbo-0613"),
-    "gpt35-16k": GPTVersion("gpt35-16k", "gpt-35-turbo-16k"),
-    "gpt4": GPTVersion("gpt4", "gpt-4-0613"),
-    "gpt4-32k": GPTVersion("gpt4-32k", "gpt4-32k-0613"),
+    "gpt35": GPTVersion("gpt35", "gpt-35-turbo-0613", 4096),
+    "gpt35-16k": GPTVersion("gpt35-16k", "gpt-35-turbo-16k", 16384),
+    "gpt4": GPTVersion("gpt4", "gpt-4-0613", 8192),
+    "gpt4-32k": GPTVersion("gpt4-32k", "gpt4-32k-0613", 32768),
 }
 
 
@@ -31,7 +35,7 @@ def get_simple_answer(prompt: str, stream: bool = True):
 
     for resp in openai.ChatCompletion.create(
         engine=GPT_VERSIONS["gpt35"].engine,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}],
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
         **kwargs,
     ):
         choices = resp.get("choices", [])
@@ -66,7 +70,7 @@ def get_conversation_answer(conversation: list[dict[str, str]], model: str, stre
 
     for resp in openai.ChatCompletion.create(
         engine=engine,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, *conversation],
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, *conversation],
         **kwargs,
     ):
         choices = resp.get("choices", [])